@@ -4,3 +4,8 @@ TRADING_TIMEZONE = 'UTC'
 
 # db login 
 DBINFO = "/home/ubuntu/ciqcoldcopy/capitaliq/DB_setting_local.json"
+
+# connection pool shared by the databaseManager query functions
+POOL_MINCONN = 1
+POOL_MAXCONN = 8
+POOL_IDLE_TIMEOUT = 300 # seconds before an idle connection above POOL_MINCONN is closed
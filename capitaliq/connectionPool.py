@@ -0,0 +1,242 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+
+
+class PoolTimeout(Exception):
+    """raised when no connection could be checked out within the given timeout"""
+
+
+class ConnectionPool():
+    """Thread-safe pool of psycopg2 connections to the ciq target database
+
+    Connections are handed out LIFO so the hottest connection is reused first and
+    the cold ones at the bottom of the stack age out through idle eviction.
+    Every checkout runs a cheap health check, a broken connection is replaced
+    transparently (counted as a reconnect). Connecting and the health check run
+    outside the lock on a reserved slot, so a slow server never blocks putconn or
+    other checkouts.
+
+    Args:
+        connect (callable): zero-arg factory returning a new psycopg2.connect
+        minconn (int, optional): connections kept open even when idle e.g. 1
+        maxconn (int, optional): hard cap on open connections e.g. 8
+        idle_timeout (int, optional): seconds an idle connection above minconn is kept e.g. 300
+        health_check (bool, optional): run "SELECT 1" on checkout if the connection was idle
+        health_check_interval (int, optional): only ping connections idle for longer than this (seconds)
+    """
+
+    def __init__(self, connect, minconn = 1, maxconn = 8, idle_timeout = 300, health_check = True, health_check_interval = 30):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f'invalid pool size: minconn={minconn}, maxconn={maxconn}')
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = [] # stack of (connection, last_used_monotonic)
+        self._used = set()
+        self._pending = 0 # slots reserved by checkouts connecting or health checking outside the lock
+        self._inherited = []
+        self._pid = os.getpid()
+        self._closed = False
+        self._stats = {
+            'connects': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.,
+            'reconnects': 0,
+            'evictions': 0,
+            'errors': 0,
+        }
+
+    def _is_healthy(self, db, idle_for):
+        if db.closed:
+            return False
+        if not self.health_check or idle_for < self.health_check_interval:
+            return True
+        try:
+            cursor = db.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            db.rollback()
+            return True
+        except (Exception, psycopg2.DatabaseError):
+            return False
+
+    def _check_fork(self):
+        # a forked worker must never reuse the sockets of its parent, nor close them:
+        # closing sends a terminate message that would end the parent's session too,
+        # so the inherited connections are only parked, never used or garbage collected
+        if self._pid != os.getpid():
+            self._inherited.extend(db for db, _ in self._idle)
+            self._inherited.extend(self._used)
+            self._idle = []
+            self._used = set()
+            self._pending = 0
+            self._pid = os.getpid()
+
+    def _evict_idle(self):
+        # the bottom of the stack holds the longest idle connections
+        now = time.monotonic()
+        while len(self._idle) + len(self._used) + self._pending > self.minconn and self._idle:
+            db, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.pop(0)
+            self._stats['evictions'] += 1
+            _close_quietly(db)
+
+    def getconn(self, timeout = None):
+        """check out a connection, blocks while maxconn connections are in use
+
+        Args:
+            timeout (float, optional): seconds to wait for a free connection, None waits forever
+
+        Raises:
+            PoolTimeout: no connection became free within timeout
+
+        Returns:
+            psycopg2.connect
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._closed:
+                raise psycopg2.InterfaceError('connection pool is closed')
+            self._check_fork()
+            self._evict_idle()
+
+            waited = False
+            wait_start = time.monotonic()
+            while not self._idle and len(self._used) + self._pending >= self.maxconn:
+                waited = True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout(f'no free connection after {timeout}s (maxconn={self.maxconn})')
+                self._cond.wait(remaining)
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - wait_start
+
+            # reserve the slot, the network round trips below run without the lock
+            db, last_used = self._idle.pop() if self._idle else (None, None)
+            self._pending += 1
+
+        connects = reconnects = 0
+        try:
+            if db is not None and not self._is_healthy(db, time.monotonic() - last_used):
+                _close_quietly(db)
+                db = None
+                reconnects = 1
+            if db is None:
+                db = self._connect()
+                connects = 1
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                self._stats['errors'] += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._pending -= 1
+            self._stats['connects'] += connects
+            self._stats['reconnects'] += reconnects
+            if self._closed:
+                _close_quietly(db)
+                self._cond.notify()
+                raise psycopg2.InterfaceError('connection pool is closed')
+            self._used.add(db)
+            self._stats['checkouts'] += 1
+            return db
+
+    def putconn(self, db, close = False):
+        """return a connection to the pool
+
+        The open transaction is rolled back, which also drops the temp tables the
+        query functions create without committing, so the next borrower gets a clean session.
+
+        Args:
+            db (psycopg2.connect): connection obtained from getconn
+            close (bool, optional): close the connection instead of keeping it
+        """
+        with self._cond:
+            self._check_fork()
+            if db not in self._used:
+                # checked out before a fork: the socket belongs to the parent, leave it alone
+                if any(db is inherited for inherited in self._inherited):
+                    return
+                # not ours, just get rid of it
+                _close_quietly(db)
+                return
+            self._used.discard(db)
+
+            if not close and not db.closed and not self._closed:
+                try:
+                    db.rollback()
+                except (Exception, psycopg2.DatabaseError):
+                    self._stats['errors'] += 1
+                    close = True
+            else:
+                close = True
+
+            if close:
+                _close_quietly(db)
+            else:
+                self._idle.append((db, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout = None):
+        """context manager around getconn / putconn
+
+        e.g.
+            with pool.connection() as db:
+                df = get_pricing('2020-03-03', '2020-03-04', [11686323, ], connection = db)
+        """
+        db = self.getconn(timeout = timeout)
+        close = False
+        try:
+            yield db
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            # the socket is likely gone, do not hand it to the next borrower
+            close = True
+            raise
+        finally:
+            self.putconn(db, close = close)
+
+    def closeall(self):
+        """close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            for db, _ in self._idle:
+                _close_quietly(db)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        """snapshot of the pool counters
+
+        Returns:
+            dict: e.g. {'connects': 2, 'checkouts': 4120, 'waits': 3, 'wait_time': 0.41, 'reconnects': 0,
+                        'evictions': 1, 'errors': 0, 'idle': 1, 'in_use': 1, 'size': 2}
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = len(self._used)
+            stats['size'] = len(self._idle) + len(self._used) + self._pending
+            return stats
+
+
+def _close_quietly(db):
+    try:
+        db.close()
+    except (Exception, psycopg2.DatabaseError):
+        pass
@@ -1,31 +1,240 @@
 from capitaliq.cfg import SERVER_TIMEZONE,DBINFO
+from capitaliq.cfg import POOL_MINCONN, POOL_MAXCONN, POOL_IDLE_TIMEOUT
+from capitaliq.connectionPool import ConnectionPool
 import pandas as pd
 from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+import inspect
+import io
+import os
+import threading
+import uuid
+import weakref
 import json
 import psycopg2
 
 
-def read_sql_to_df(sql, db, cursor):
+def read_sql_to_df(sql, db, cursor, dtypes = None, copy = False):
     """Internal: execute sql and get dataframe as a return 
     
     Args:
         sql (str): sql to be executed 
         db (psycopg2.connect): connect to ciq target database 
         cursor (database connection.cursor): 
+        dtypes (None, str or dict, optional): None keeps the raw python objects (Decimal, date, ...),
+                                'infer' maps the postgres column types to numpy dtypes (numeric -> float64,
+                                int -> Int64, date/timestamp -> datetime64), a dict {column: dtype} does the same
+                                and overrides single columns e.g. {'divadjclose': 'float64', 'isocode': 'category'}
+        copy (bool, optional): fetch through "COPY (sql) TO STDOUT" as csv and parse it with the vectorized
+                                pandas reader instead of building python tuples, sql must be a single SELECT
     
     Returns:
         pd.DataFrame: contains result for executed sql 
     """
     try:
+        if copy:
+            return _read_sql_copy(sql, cursor, dtypes)
         cursor.execute(sql)
         data = cursor.fetchall()
         columns = [desc[0] for desc in cursor.description]
-        return pd.DataFrame(data,columns = columns)
+        df = pd.DataFrame(data,columns = columns)
+        if dtypes is not None:
+            df = _apply_dtypes(df, _resolve_dtypes(cursor.description, dtypes))
+        return df
     except (Exception, psycopg2.DatabaseError) as error:
         db.rollback()
         print("Error: %s" % error)
 
 
+# postgres type oid -> pandas dtype, anything not listed (text, varchar, ...) stays object
+PG_TYPE_DTYPES = {
+    16: 'boolean', # bool
+    20: 'Int64', # int8
+    21: 'Int64', # int2
+    23: 'Int64', # int4
+    26: 'Int64', # oid
+    700: 'float64', # float4
+    701: 'float64', # float8
+    1700: 'float64', # numeric
+    1082: 'datetime64[ns]', # date
+    1114: 'datetime64[ns]', # timestamp
+    1184: 'datetime64[ns, UTC]', # timestamptz
+}
+
+# NULL marker of the COPY csv, postgres quotes a text value that happens to equal it
+COPY_NULL = r'\N'
+
+
+def _resolve_dtypes(description, dtypes):
+    """Internal: infer {column: dtype} from cursor.description type codes, explicit dtypes win"""
+    resolved = {desc[0]: PG_TYPE_DTYPES[desc[1]] for desc in description if desc[1] in PG_TYPE_DTYPES}
+    if isinstance(dtypes, dict):
+        resolved.update(dtypes)
+    return resolved
+
+
+def _apply_dtypes(df, dtypes):
+    """Internal: cast whole columns at once, Decimal objects go through float64"""
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if str(dtype).startswith('datetime64'):
+            df[col] = pd.to_datetime(df[col], utc = 'UTC' in str(dtype))
+        elif dtype in ('Int64', 'int64', 'Int32', 'int32') and df[col].dtype == object:
+            df[col] = df[col].astype('float64').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _read_sql_copy(sql, cursor, dtypes):
+    """Internal: COPY the query result out as csv and parse it in one vectorized pass"""
+    sql = sql.strip().rstrip(';')
+    # zero-row run to learn the column types, csv itself is untyped
+    cursor.execute(f"SELECT * FROM ({sql}) AS q LIMIT 0")
+    description = cursor.description
+    resolved = _resolve_dtypes(description, 'infer' if dtypes is None else dtypes)
+
+    # NULL as \N, so an empty string ("" in csv) is not read back as a missing value
+    buffer = io.StringIO()
+    cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT CSV, HEADER, NULL '{COPY_NULL}')", buffer)
+    buffer.seek(0)
+
+    dates = [col for col, dtype in resolved.items() if str(dtype).startswith('datetime64')]
+    parse = {col: dtype for col, dtype in resolved.items() if col not in dates}
+    # booleans come as t/f in postgres csv
+    bools = [col for col, dtype in parse.items() if dtype in ('boolean', 'bool')]
+    for col in bools:
+        parse.pop(col)
+    # text columns stay strings as in the tuple path, no type sniffing ('00123' keeps its zeros)
+    texts = [desc[0] for desc in description if desc[0] not in resolved]
+    parse.update({col: str for col in texts + bools})
+    df = pd.read_csv(buffer, dtype = parse, keep_default_na = False, na_values = [COPY_NULL])
+    for col in texts:
+        df[col] = df[col].astype(object).where(df[col].notna(), None)
+    for col in bools:
+        df[col] = df[col].map({'t': True, 'f': False}).astype('boolean')
+    for col in dates:
+        df[col] = pd.to_datetime(df[col], utc = 'UTC' in str(resolved[col]))
+    return df
+
+
+def read_sql_to_chunks(sql, db, chunksize = 100000):
+    """Internal: execute sql on a named server-side cursor and yield the result in dataframe chunks
+    
+    Only chunksize rows are held in python at a time, so multi-GB pulls run in bounded memory.
+    sql must be a single SELECT statement (it is wrapped into DECLARE ... CURSOR).
+    
+    Args:
+        sql (str): sql to be executed 
+        db (psycopg2.connect): connect to ciq target database, must stay open while iterating
+        chunksize (int, optional): rows per chunk, also used as the cursor itersize e.g. 100000
+    
+    Yields:
+        pd.DataFrame: contains up to chunksize rows of the result
+    """
+    cursor = db.cursor(name = f'stream_{uuid.uuid4().hex}')
+    cursor.itersize = int(chunksize)
+    try:
+        cursor.execute(sql)
+        while True:
+            data = cursor.fetchmany(int(chunksize))
+            if not data:
+                break
+            columns = [desc[0] for desc in cursor.description]
+            yield pd.DataFrame(data,columns = columns)
+    except (Exception, psycopg2.DatabaseError) as error:
+        db.rollback()
+        print("Error: %s" % error)
+        raise # a silently truncated stream would look like a complete result
+    finally:
+        if not cursor.closed and not db.closed:
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                pass
+
+
+def write_chunks_to_parquet(chunks, path):
+    """write dataframe chunks (e.g. from a query function called with chunksize) into one parquet file
+    
+    The arrow schema of the first chunk is used for the whole file.
+    
+    Args:
+        chunks (iterable): of pd.DataFrame e.g. get_hist_fxrate('2000-01-01', chunksize = 500000)
+        path (str): 'data/fx/hist_fxrate.parquet'
+    
+    Returns:
+        int: number of rows written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    nrows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index = False)
+            if writer is None:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                writer = pq.ParquetWriter(path, table.schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            nrows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return nrows
+
+
+def load_id_table(cursor, ids, table):
+    """Internal: bulk load ids into a one-column temp table with a single COPY round trip
+
+    The whole list is streamed in one COPY, so a 5,000-name universe costs one round trip
+    instead of a statement per id.
+    
+    Args:
+        cursor (database connection.cursor): cursor on the connection owning the temp table
+        ids (list): list of int ids   [11686323, 24937]
+        table (str): qualified name of an existing one-column table e.g. 'pg_temp_3.temp_universe'
+    
+    Returns:
+        str: table, to be used in the follow-up query e.g. "in (SELECT companyid FROM {table})"
+    """
+    buffer = io.StringIO(''.join(f'{int(id)}\n' for id in ids))
+    cursor.copy_expert(f'COPY {table} FROM STDIN', buffer)
+    return table
+
+
+_TEMP_SCHEMA = weakref.WeakKeyDictionary()
+
+
+def get_temp_schema(connection):
+    """Internal: name of the session temp schema (pg_temp_N) of a connection, cached per connection
+
+    Call it after the first CREATE TEMP TABLE of the session; the N is fixed for the
+    lifetime of the backend, so pooled connections only pay the lookup once.
+    
+    Args:
+        connection (psycopg2.connect): connection owning the temp tables
+    
+    Returns:
+        str: e.g. 'pg_temp_3'
+    """
+    tschema = _TEMP_SCHEMA.get(connection)
+    if tschema is None:
+        cursor = connection.cursor()
+        cursor.execute("SELECT nspname FROM pg_namespace WHERE oid = pg_my_temp_schema()")
+        row = cursor.fetchone()
+        if row is None:
+            # no temp table created yet in this session, the alias resolves to it anyway
+            return 'pg_temp'
+        tschema = row[0]
+        _TEMP_SCHEMA[connection] = tschema
+    return tschema
+
+
 def get_connection(dbInfo):
     """get the db connection using info in dbInfo json file
     
@@ -35,8 +244,7 @@ def get_connection(dbInfo):
     Returns:
         psycopg2.connect
     """
-    with open(dbInfo,'r') as f:
-        u = json.load(f)
+    u = _load_dbinfo(dbInfo)
 
     db = psycopg2.connect(
         host=u['host'],
@@ -47,6 +255,96 @@ def get_connection(dbInfo):
     return db
 
 
+@lru_cache(maxsize=None)
+def _load_dbinfo(dbInfo):
+    """Internal: read the credential json once per process"""
+    with open(dbInfo,'r') as f:
+        return json.load(f)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(dbInfo = DBINFO):
+    """get the module level connection pool, created on first use
+
+    All query functions below borrow from this pool when no connection is passed,
+    so a loop over thousands of companies reuses a handful of sessions instead of
+    paying a TCP + auth handshake per call.
+
+    Args:
+        dbInfo (.json, optional): user-pw for ciq target database
+
+    Returns:
+        ConnectionPool: e.g. get_pool().stats()
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool(
+                lambda: get_connection(dbInfo),
+                minconn=POOL_MINCONN,
+                maxconn=POOL_MAXCONN,
+                idle_timeout=POOL_IDLE_TIMEOUT)
+        return _POOL
+
+
+def close_pool():
+    """close the module level pool, the next query opens a fresh one"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.closeall()
+        _POOL = None
+
+
+def pooled(func):
+    """Internal: decorator that checks a connection out of the pool when the caller passes none
+
+    The wrapped function must take a `connection` argument; an explicitly passed
+    connection is used untouched and stays owned by the caller. If the function returns
+    a generator (chunksize mode) the connection is released when the generator is exhausted or closed.
+    """
+    position = list(inspect.signature(func).parameters).index('connection')
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if len(args) > position or kwargs.get('connection') is not None:
+            return func(*args, **kwargs)
+
+        pool = get_pool()
+        connection = pool.getconn()
+        kwargs['connection'] = connection
+        try:
+            result = func(*args, **kwargs)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            pool.putconn(connection, close = True)
+            raise
+        except BaseException:
+            pool.putconn(connection)
+            raise
+
+        if inspect.isgenerator(result):
+            # streamed results still need the connection, release it once consumed or closed
+            return _release_after(result, pool, connection)
+        pool.putconn(connection)
+        return result
+    return wrapper
+
+
+def _release_after(chunks, pool, connection):
+    close = False
+    try:
+        yield from chunks
+    except (psycopg2.InterfaceError, psycopg2.OperationalError):
+        close = True
+        raise
+    finally:
+        pool.putconn(connection, close = close)
+
+
+@pooled
 def get_traded_isin_company(date, countrycode = 213, currencyid = 160, mktcap_thres = 250, adv_thres = 1e6, connection = None):
     '''
     get the idmaps from company id to corresponding isin
@@ -173,7 +471,8 @@ def get_traded_isin_company(date, countrycode = 213, currencyid = 160, mktcap_th
 get_tradable_company = get_traded_isin_company
 
 
-def get_company_transcripts(start, end, ls_ids, connection = None):
+@pooled
+def get_company_transcripts(start, end, ls_ids, connection = None, chunksize = None):
     """
     Get the transcripts of given companies id from start date to end date
     Args:
@@ -181,6 +480,7 @@ def get_company_transcripts(start, end, ls_ids, connection = None):
         end (str): end date (incl.)    '2020-03-04'
         ls_ids (list): list of companyid   [11686323, ]
         connection (None, optional): Description
+        chunksize (int, optional): stream the result in chunks of this many rows (returns a generator of pd.DataFrame)
     
     Returns:
         sample ouput: 
@@ -219,21 +519,11 @@ def get_company_transcripts(start, end, ls_ids, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
-
-    company_list = ""
-    for cid in ls_ids:
-        company_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    tschema = get_temp_schema(connection)
+
+    id_table = load_id_table(cursor, ls_ids, f'{tschema}.temp_universe')
         
     sql = f"""
-            {company_list}
             SELECT t.transcriptId, t.transcriptCreationDateUTC, 
             comp.companyId,
             CAST(tc.componentText AS TEXT) AS componenttext,tcty.transcriptComponentTypeName, 
@@ -265,18 +555,21 @@ def get_company_transcripts(start, end, ls_ids, connection = None):
             GROUP BY keyDevId
             ) mtm
             WHERE a.keyDevId = mtm.keyDevId AND a.transcriptCreationDateUTC = mtm.minTm)
-            AND comp.companyid in (SELECT companyid FROM {tschema}.temp_universe)
+            AND comp.companyid in (SELECT companyid FROM {id_table})
             AND t.transcriptCreationDateUTC >= '{startdatestr}'
             AND t.transcriptCreationDateUTC <= '{enddatestr}'           
             ORDER BY t.transcriptCreationDateUTC asc;
             """    
     
+    if chunksize:
+        return read_sql_to_chunks(sql, connection, chunksize)
     return read_sql_to_df(sql, connection, cursor)
 
 # function alias
 get_transcripts = get_company_transcripts
 
 
+@pooled
 def get_pricing(start, end, ls_ids, connection = None):
     """
     Get pricing of given companies from start date to end date
@@ -325,21 +618,11 @@ def get_pricing(start, end, ls_ids, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    company_list = ""
-    for cid in ls_ids:
-        company_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    id_table = load_id_table(cursor, ls_ids, f'{tschema}.temp_universe')
 
     sql = f"""
-    {company_list}
     SELECT c.companyid
     ,pe.pricingDate
     ,pe.priceClose
@@ -356,7 +639,7 @@ def get_pricing(start, end, ls_ids, connection = None):
     left join targetskma.ciqPriceEquityDivAdjFactor daf on pe.tradingItemId=daf.tradingItemId
     and daf.fromDate<=pe.pricingDate --Find dividend adjustment factor on pricing date
     and (daf.toDate is null or daf.toDate>=pe.pricingDate)
-    WHERE c.companyid in (SELECT companyid FROM {tschema}.temp_universe)
+    WHERE c.companyid in (SELECT companyid FROM {id_table})
     and s.primaryflag=1
     and ti.primaryflag=1
     and pe.pricingDate>='{startdatestr}'
@@ -369,6 +652,7 @@ def get_pricing(start, end, ls_ids, connection = None):
     return pr
 
 
+@pooled
 def get_PIT_fundamental(ls_ids, date, ls_dataitemid, lookback = 365, connection = None):
     """
     Get point in time shares from CIQ PIT premium financials
@@ -425,21 +709,11 @@ def get_PIT_fundamental(ls_ids, date, ls_dataitemid, lookback = 365, connection
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    sec_list = ""
-    for cid in ls_ids:
-        sec_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    id_table = load_id_table(cursor, ls_ids, f'{tschema}.temp_universe')
 
     sql = f"""
-        {sec_list}
         with PIT as
             (
             select fid.financialInstanceId,fid.instanceDate,fid.instanceDateTypeId, fidt.description
@@ -467,7 +741,7 @@ def get_PIT_fundamental(ls_ids, date, ls_dataitemid, lookback = 365, connection
         join targetskma.ciqFinCollection fc on fc.financialCollectionId = ic.financialCollectionId
         join targetskma.ciqFinCollectionData fd on fd.financialCollectionId = ic.financialCollectionId
         join targetskma.ciqDataItem di on di.dataItemId = fd.dataItemId
-        where c.companyId in (SELECT companyid FROM {tschema}.temp_universe)
+        where c.companyId in (SELECT companyid FROM {id_table})
         -- c.companyId=112350
         --and fi.formType = '10-Q'
         --and rt.restatementTypeName in ('Press Release', 'Original')
@@ -484,6 +758,7 @@ def get_PIT_fundamental(ls_ids, date, ls_dataitemid, lookback = 365, connection
     return read_sql_to_df(sql, connection, cursor)         
 
 
+@pooled
 def get_funds_contain_words(words, connection = None):
     """
     List the funds with name containing words in a given list
@@ -529,6 +804,7 @@ def get_funds_contain_words(words, connection = None):
 
 
 
+@pooled
 def get_funds_details(fund_ids, connection = None):
     """
     List the characteristics of a fund at a given date (based on most recently available reporting and current prices)
@@ -596,6 +872,7 @@ def get_funds_details(fund_ids, connection = None):
     
     return read_sql_to_df(sql, connection, cursor)             
 
+@pooled
 def get_pit_portfolio_holdings(pid, date, connection = None):
     """
     List the holdings of a fund at a given date (based on most recently available reporting and current prices)
@@ -655,6 +932,7 @@ def get_pit_portfolio_holdings(pid, date, connection = None):
 
 
 
+@pooled
 def get_current_portfolio_holdings(pid, connection = None):
     """
     List the current holdings of a fund (based on most recently available reporting and current prices)
@@ -704,6 +982,7 @@ def get_current_portfolio_holdings(pid, connection = None):
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_co_analysts_network(date, lookback = 360, connection = None):
     """Extract analysis coverage (FROM EARNING CALL) given a date range (from date-looback to date)
     currently, DEPRECIATED
@@ -785,6 +1064,7 @@ def get_co_analysts_network(date, lookback = 360, connection = None):
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_transcript_ref_earliest(ls_ids, startdate, enddate=None, connection = None):
     """
     Get historical reference table for a list of companyid with asscoiated transcriptid from given a date range (from startdate to enddate)
@@ -859,12 +1139,14 @@ def get_transcript_ref_earliest(ls_ids, startdate, enddate=None, connection = No
     return read_sql_to_df(sql, connection, cursor) 
 
 
-def get_transcript(ls_transcript_ids, connection = None):
+@pooled
+def get_transcript(ls_transcript_ids, connection = None, chunksize = None):
     """Get transcript given a list of transcript ids
     
     Args:
         ls_transcript_ids (list): list of transcriptid e.g. [2228812, ]
         connection (None, optional): Description
+        chunksize (int, optional): stream the result in chunks of this many rows (returns a generator of pd.DataFrame)
     
     Returns:
         sample output
@@ -890,9 +1172,12 @@ def get_transcript(ls_transcript_ids, connection = None):
         connection = get_connection(DBINFO)
     cursor = connection.cursor()
         
+    if chunksize:
+        return read_sql_to_chunks(sql, connection, chunksize)
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_latest_pricing(asofdate, sec_ids, is_eod = False, connection = None):
     """
     TODO: what about split during real time
@@ -939,21 +1224,11 @@ def get_latest_pricing(asofdate, sec_ids, is_eod = False, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    sec_list = ""
-    for sid in sec_ids:
-        sec_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,sid)
+    id_table = load_id_table(cursor, sec_ids, f'{tschema}.temp_universe')
 
     sql = f"""
-    {sec_list}
     SELECT s.securityId
     ,pe.pricingDate
     ,pe.priceClose
@@ -969,7 +1244,7 @@ def get_latest_pricing(asofdate, sec_ids, is_eod = False, connection = None):
     left join targetskma.ciqPriceEquityDivAdjFactor daf on pe.tradingItemId=daf.tradingItemId
     and daf.fromDate<=pe.pricingDate --Find dividend adjustment factor on pricing date
     and (daf.toDate is null or daf.toDate>=pe.pricingDate)
-    WHERE s.securityId in (SELECT securityid FROM {tschema}.temp_universe)
+    WHERE s.securityId in (SELECT securityid FROM {id_table})
     and s.primaryflag=1
     and ti.primaryflag=1
     and pe.pricingDate>='{startdatestr}'
@@ -990,6 +1265,7 @@ def get_latest_pricing(asofdate, sec_ids, is_eod = False, connection = None):
     return pr#pd.pivot_table(pr, values='divadjprice', index = 'pricingdate', columns = 'companyid', aggfunc='first')    
 
 
+@pooled
 def get_historical_marketcap(cids, start_date = '2010-01-01', end_date = '2021-01-01', connection = None):
     """
     author: zheng Apr.29.2021
@@ -1017,6 +1293,7 @@ def get_historical_marketcap(cids, start_date = '2010-01-01', end_date = '2021-0
     df.loc[:,'marketcap'] = df.loc[:,'marketcap'].astype(float) 
     return df
 
+@pooled
 def get_latest_marketcap(asofdate, cids, is_eod = False, connection = None):
     """
     TODO: what about split during real time
@@ -1075,22 +1352,12 @@ def get_latest_marketcap(asofdate, cids, is_eod = False, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    sec_list = ""
-    for cid in cids:
-        sec_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    id_table = load_id_table(cursor, cids, f'{tschema}.temp_universe')
 
 
     sql = f"""
-    {sec_list}
     select mc.companyID, mc.marketcap
     from targetskma.ciqMarketCap mc
     join (
@@ -1100,12 +1367,13 @@ def get_latest_marketcap(asofdate, cids, is_eod = False, connection = None):
         and pricingDate>='{startdatestr}'
         group by companyID
     ) tm on mc.companyID = tm.companyID and mc.pricingdate = tm.MaxDate
-    WHERE mc.companyID in (SELECT companyid FROM {tschema}.temp_universe)
+    WHERE mc.companyID in (SELECT companyid FROM {id_table})
     """
     df = read_sql_to_df(sql, connection, cursor)  
     df.loc[:,'marketcap'] = df.loc[:,'marketcap'].astype(float) 
     return df
 
+@pooled
 def get_industry(cids, connection = None):
     """
     return the simpleindustrycode for given company id list
@@ -1141,28 +1409,19 @@ def get_industry(cids, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    sec_list = ""
-    for cid in cids:
-        sec_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    id_table = load_id_table(cursor, cids, f'{tschema}.temp_universe')
 
 
     sql = f"""
-    {sec_list}
     select mc.companyID, mc.simpleindustryid
     from targetskma.ciqCompany mc
-    WHERE mc.companyID in (SELECT companyid FROM {tschema}.temp_universe)
+    WHERE mc.companyID in (SELECT companyid FROM {id_table})
     """
     return read_sql_to_df(sql, connection, cursor)   
 
+@pooled
 def get_sec_pricing(start, end, sec_ids, connection = None):
     """
     get the transcripts of given companies from start to end
@@ -1199,21 +1458,11 @@ def get_sec_pricing(start, end, sec_ids, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    company_list = ""
-    for sid in sec_ids:
-        company_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,sid)
+    id_table = load_id_table(cursor, sec_ids, f'{tschema}.temp_universe')
 
     sql = f"""
-    {company_list}
     SELECT s.securityid
     ,pe.pricingDate
     ,pe.priceClose
@@ -1229,7 +1478,7 @@ def get_sec_pricing(start, end, sec_ids, connection = None):
     left join targetskma.ciqPriceEquityDivAdjFactor daf on pe.tradingItemId=daf.tradingItemId
     and daf.fromDate<=pe.pricingDate --Find dividend adjustment factor on pricing date
     and (daf.toDate is null or daf.toDate>=pe.pricingDate)
-    WHERE s.securityid in (SELECT securityid FROM {tschema}.temp_universe)
+    WHERE s.securityid in (SELECT securityid FROM {id_table})
     and s.primaryflag=1
     and ti.primaryflag=1
     and pe.pricingDate>='{startdatestr}'
@@ -1244,6 +1493,7 @@ def get_sec_pricing(start, end, sec_ids, connection = None):
 
 
 
+@pooled
 def get_transcript_ref_by_transcriptid(transcriptid, connection = None):
     """Get historical reference table for a list of transcriptids from the startdate (NOT THE TRANSCRIPT CONTENT)
 
@@ -1271,22 +1521,12 @@ def get_transcript_ref_by_transcriptid(transcriptid, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    tids = ""
-    for tid in transcriptid:
-        tids += "INSERT INTO %s.temp_tids VALUES (%s);\n"%(tschema,tid)
+    id_table = load_id_table(cursor, transcriptid, f'{tschema}.temp_tids')
 
     
     sql = f"""
-            {tids}
             SELECT t.transcriptId, t.transcriptCreationDateUTC, comp.companyId, comp.companyName, t.keyDevId, t.transcriptCollectionTypeId,
             e.mostImportantDateUTC as EarningsDateUTC, e.announcedDateUTC, ct.transcriptCollectionTypeName, e.headline,
             eb.fiscalyear, eb.fiscalquarter, dr.delayReasonTypeId, drt.delayReasonTypeName, drt.isCancelledFlag, dr.delayReasonNotes
@@ -1300,13 +1540,14 @@ def get_transcript_ref_by_transcriptid(transcriptid, connection = None):
             LEFT JOIN targetskma.ciqTranscriptDelayReason dr on dr.keyDevId = t.keyDevId
             LEFT JOIN targetskma.ciqTranscriptDelayReasonType drt on dr.delayReasonTypeId = drt.delayReasonTypeId            
             WHERE et.keyDevEventTypeId='48' --Earnings Calls
-            AND t.transcriptId in (select transcriptid FROM {tschema}.temp_tids)        
+            AND t.transcriptId in (select transcriptid FROM {id_table})        
             ORDER BY t.transcriptCreationDateUTC asc;
             """    
 
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_current_index_values(connection = None):
     """Get all index historical pricing
     
@@ -1345,6 +1586,7 @@ def get_current_index_values(connection = None):
         """      
     return read_sql_to_df(sql, connection, cursor) 
 
+@pooled
 def get_current_index_constituents(index_id, connection = None):
     """Get current index constituents given index id (WE DONT HAVE HISTORICAL ETF CONSTITUENTS)
     
@@ -1376,6 +1618,7 @@ def get_current_index_constituents(index_id, connection = None):
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_est_analysts_network(date, lookback = 180, connection = None):
     """
     Get all analyst network (references) in the time range (date-lookback, date), 
@@ -1435,6 +1678,7 @@ def get_est_analysts_network(date, lookback = 180, connection = None):
 
 
 
+@pooled
 def get_traded_information_given_cid(companyid, connection = None):
     """
     get the basic information from company id to corresponding isin
@@ -1476,6 +1720,7 @@ def get_traded_information_given_cid(companyid, connection = None):
 ############################################## new ########################################################### 
 # apr.1. 2021 
 # @author: zheng
+@pooled
 def get_cur_fundamental(ls_ids, ls_dataitemid, connection = None):
 
 
@@ -1570,6 +1815,7 @@ def get_cur_fundamental(ls_ids, ls_dataitemid, connection = None):
         """
     return read_sql_to_df(sql, connection, cursor)       
 
+@pooled
 def get_backwards_fundamental(ls_ids, ls_dataitemid, calendaryear, connection = None):
 
 
@@ -1627,6 +1873,7 @@ def get_backwards_fundamental(ls_ids, ls_dataitemid, calendaryear, connection =
     return read_sql_to_df(sql, connection, cursor)       
 
 
+@pooled
 def get_historical_fundamental(ls_ids, ls_dataitemid, periodtypeid = [1, 2], startyear = 2007, startdate = '2007-01-01', connection = None):
 
 
@@ -1670,6 +1917,7 @@ def get_historical_fundamental(ls_ids, ls_dataitemid, periodtypeid = [1, 2], sta
     
     return read_sql_to_df(sql, connection, cursor)           
 
+@pooled
 def search_fundamental(pattern = 'Book', connection = None):
 
     if connection is None:
@@ -1710,6 +1958,7 @@ def search_fundamental(pattern = 'Book', connection = None):
     
     return read_sql_to_df(sql, connection, cursor)  
     
+@pooled
 def get_cur_miadj_pricing(asofdate, ls_ids, is_eod = True, connection = None):
     """
     Get as of date price data given a series of company ids, using miadjusted table 
@@ -1765,23 +2014,13 @@ def get_cur_miadj_pricing(asofdate, ls_ids, is_eod = True, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
 
-    sec_list = ""
-    for sid in ls_ids:
-        sec_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,sid)
+    id_table = load_id_table(cursor, ls_ids, f'{tschema}.temp_universe')
 
 
     sql = f"""
-    {sec_list}
     SELECT 
     c.companyid
     ,ti.tradingItemId
@@ -1798,7 +2037,7 @@ def get_cur_miadj_pricing(asofdate, ls_ids, is_eod = True, connection = None):
     JOIN ciqTradingItem ti on ti.securityId=s.securityId
     JOIN miadjprice mi on mi.tradingItemId=ti.tradingItemId
     
-    WHERE c.companyId in (SELECT securityid FROM {tschema}.temp_universe) 
+    WHERE c.companyId in (SELECT securityid FROM {id_table}) 
     AND s.primaryflag=1
     AND ti.primaryflag=1
     AND mi.priceDate <= '{enddatestr}'
@@ -1814,6 +2053,7 @@ def get_cur_miadj_pricing(asofdate, ls_ids, is_eod = True, connection = None):
     return pr
   
   
+@pooled
 def get_hist_miadj_pricing(start, end, ls_ids, connection = None):
     """
     Get a historical price data given a series of company ids, using miadjusted table 
@@ -1826,12 +2066,12 @@ def get_hist_miadj_pricing(start, end, ls_ids, connection = None):
         connection (None, optional): Description
     
     Returns:
-        sample ouput: 
-        companyid  tradingitemid   pricedate      priceclose       priceopen       pricehigh        pricelow                 volume       vwap               divadjclose  divadjfactor
-    0       24937        2590360  2020-05-05  74.39000000000  73.76500000000  75.25000000000  73.61500000000  147751200.00000000000  74.637500  73.273994703436000000000  0.9849979124
-    1       24937        2590360  2020-05-06  75.15750000000  75.11500000000  75.81000000000  74.71750000000  142333760.00000000000  75.437500  74.029980601203000000000  0.9849979124
-    2       24937        2590360  2020-05-07  75.93500000000  75.80500000000  76.29250000000  75.49250000000  115215040.00000000000  75.927500  74.795816478094000000000  0.9849979124
-    3       24937        2590360  2020-05-08  77.53250000000  76.41000000000  77.58750000000  76.07250000000  134047960.00000000000  76.947500  76.576081355087250000000  0.9876642873
+        sample ouput (float64 prices, datetime64 pricedate): 
+       companyid  tradingitemid  currencyid  pricedate  priceclose  priceopen  pricehigh  pricelow       volume     vwap  divadjclose  divadjfactor
+    0      24937        2590360         160 2020-05-05    74.39000   73.76500   75.25000  73.61500  147751200.0  74.6375    73.273995      0.984998
+    1      24937        2590360         160 2020-05-06    75.15750   75.11500   75.81000  74.71750  142333760.0  75.4375    74.029981      0.984998
+    2      24937        2590360         160 2020-05-07    75.93500   75.80500   76.29250  75.49250  115215040.0  75.9275    74.795816      0.984998
+    3      24937        2590360         160 2020-05-08    77.53250   76.41000   77.58750  76.07250  134047960.0  76.9475    76.576081      0.987664
 
     """
 
@@ -1874,12 +2114,49 @@ def get_hist_miadj_pricing(start, end, ls_ids, connection = None):
     AND mi.priceDate <= '{endstr}'
     ORDER BY mi.priceDate asc;
     """
-    return read_sql_to_df(sql, connection, cursor) 
+    return read_sql_to_df(sql, connection, cursor, dtypes = 'infer', copy = True) 
 
+def get_hist_miadj_pricing_by_company(start, end, ls_ids, chunksize = 200, connection = None):
+    """
+    Get historical miadj prices for a whole universe in a few chunked queries, handed out per company
+    
+    Each query covers chunksize companies, so a 5,000-name rebuild is 25 round trips instead of 5,000.
+    
+    Args:
+        start (str): '2000-01-01'
+        end (str): '2030-06-01'
+        ls_ids (list): list of companyid   [24937, 32307]
+        chunksize (int, optional): companies per query e.g. 200
+        connection (None, optional): Description
+    
+    Yields:
+        tuple: (companyid, pd.DataFrame) same columns as get_hist_miadj_pricing, sorted by pricedate,
+               companies without any price are skipped
+
+    Raises:
+        psycopg2.DatabaseError: the query of a chunk failed, its companyids are on the error
+                                (error.companyids) so the caller can retry them
+    """
+    ls_ids = list(ls_ids)
+    for i in range(0, len(ls_ids), chunksize):
+        chunk = ls_ids[i:i + chunksize]
+        pr = get_hist_miadj_pricing(start, end, chunk, connection = connection)
+        if pr is None:
+            # read_sql_to_df already printed the database error, a skipped chunk would look like
+            # companies without prices
+            error = psycopg2.DatabaseError(f'price query failed for {len(chunk)} companies: {chunk}')
+            error.companyids = chunk
+            raise error
+        for companyid, price in pr.groupby('companyid', sort = False):
+            yield companyid, price.reset_index(drop = True)
+
+
+@pooled
 def get_all_eps_estimates(cids, start, end, connection = None):
     return get_all_estimates(cids, start, end, itemid = 21634, connection = connection)
 
 
+@pooled
 def get_all_estimates(cids, start, end, itemid = 21634, connection = None):
     """
     get historical PIT analyst & broker estimates
@@ -1915,21 +2192,11 @@ def get_all_estimates(cids, start, end, itemid = 21634, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    company_list = ""
-    for cid in cids:
-        company_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    id_table = load_id_table(cursor, cids, f'{tschema}.temp_universe')
 
     sql = f"""
-    {company_list}
     select EP.periodEndDate
     , C.companyName
     , C.companyId
@@ -1959,7 +2226,7 @@ def get_all_estimates(cids, start, end, itemid = 21634, connection = None):
     --- on EB.estimateBrokerId = EDND.estimateBrokerId --- left outer join must be used if you receive any of the anonymous estimates packages
     --- left outer join targetskma.ciqEstimateAnalyst EA
     --- on EA.estimateAnalystId = EDND.estimateAnalystId --- left outer join must be used if you receive any of the anonymous estimates packages
-    where EP.companyId in (SELECT companyid FROM {tschema}.temp_universe)
+    where EP.companyId in (SELECT companyid FROM {id_table})
     --- and EP.periodTypeId in (2) -- quarter
     and EDND.dataItemId = {itemid} --- in (21634, 21642) --- EPS Normalized Estimate: 21634; Revenue Estimate: 21642 
     and EDND.effectiveDate between '{startstr}' and '{endstr}'
@@ -1969,6 +2236,7 @@ def get_all_estimates(cids, start, end, itemid = 21634, connection = None):
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_real_estimates_with_earningsdate_appended(asofdate, cids, connection = None):
     """
     Get real time estimates with earnings date appended  
@@ -2049,6 +2317,7 @@ def get_real_estimates_with_earningsdate_appended(asofdate, cids, connection = N
 
 
 
+@pooled
 def get_hist_mi_pricing(start, end, ls_ids, connection = None):
     """
     Get a historical price data given a series of company ids
@@ -2101,6 +2370,7 @@ def get_hist_mi_pricing(start, end, ls_ids, connection = None):
 
 
 
+@pooled
 def get_mi_pricing_ref_ti(start, end, ls_ids, connection = None):
     """
     get mi pricing with regerence of tradingitemid
@@ -2136,15 +2406,18 @@ def get_mi_pricing_ref_ti(start, end, ls_ids, connection = None):
 
 
 
+@pooled
 def get_all_target_price_estimates(cids, start, end, connection = None):
     return get_all_estimates(cids, start, end, itemid = 21626, connection = connection)
 
 
+@pooled
 def get_all_ltg_estimates(cids, start, end, connection = None):
     return get_all_estimates(cids, start, end, itemid = 21629, connection = connection)
 
 
 
+@pooled
 def get_detail_est_network(cids, start, end, connection = None):
     """
     get historical PIT analyst & broker estimates
@@ -2182,21 +2455,11 @@ def get_detail_est_network(cids, start, end, connection = None):
     """
     cursor.execute(sql)
 
-    sql = """SELECT * FROM information_schema.tables"""
-    cursor.execute(sql)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
-    for i in schema:
-        if 'pg_temp' in i:
-            tschema = i
+    tschema = get_temp_schema(connection)
 
-    company_list = ""
-    for cid in cids:
-        company_list += "INSERT INTO %s.temp_universe VALUES (%s);\n"%(tschema,cid)
+    id_table = load_id_table(cursor, cids, f'{tschema}.temp_universe')
 
     sql = f"""
-    {company_list}
     select C.companyId
     , EDND.estimateAnalystId
     , count(EDND.dataItemValue) as NumEst
@@ -2205,7 +2468,7 @@ def get_detail_est_network(cids, start, end, connection = None):
     on C.companyId = EP.companyId
     join targetskma.ciqEstimateDetailNumericData EDND
     on EDND.estimatePeriodId = EP.estimatePeriodId
-    where EP.companyId in (SELECT companyid FROM {tschema}.temp_universe)
+    where EP.companyId in (SELECT companyid FROM {id_table})
     and EDND.estimateAnalystId > 0
     --- and EDND.dataItemId = 21634 --- in (21634, 21642) --- EPS Normalized Estimate: 21634; Revenue Estimate: 21642 
     and EDND.effectiveDate between '{startstr}' and '{endstr}'
@@ -2214,6 +2477,7 @@ def get_detail_est_network(cids, start, end, connection = None):
 
     return read_sql_to_df(sql, connection, cursor) 
 
+@pooled
 def get_portfolio_universe(pid, asofdate, connection = None):
     """
     List the current holdings of a fund (based on most recently available reporting and current prices)
@@ -2321,6 +2585,7 @@ def get_portfolio_universe(pid, asofdate, connection = None):
 
 
 
+@pooled
 def get_hist_earnings_release_dates(ls_ids, fromdate, todate, sortby = 'projectedEarningDatesUTC', connection = None):
     """
         get the earning dates for a list of companies, the earning call dates are used as fallback
@@ -2371,6 +2636,7 @@ def get_hist_earnings_release_dates(ls_ids, fromdate, todate, sortby = 'projecte
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_earnings_announcement_dates(ls_ids, fromdate, todate, connection = None):
     """
     """
@@ -2415,6 +2681,7 @@ def get_earnings_announcement_dates(ls_ids, fromdate, todate, connection = None)
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_keydates(ls_ids, keydevids, fromdate, todate, connection = None):
     """
     """
@@ -2452,6 +2719,7 @@ def get_keydates(ls_ids, keydevids, fromdate, todate, connection = None):
 
 
 
+@pooled
 def get_afl_factor_express(date, ls_ids, factorids, connection = None):
 
     datestr = (
@@ -2509,6 +2777,7 @@ def get_afl_factor_express(date, ls_ids, factorids, connection = None):
 
 
 
+@pooled
 def get_afl_factor_monthly_pit(date, factorids, ls_ids, connection = None):
 
     datestr = (
@@ -2564,6 +2833,7 @@ def get_afl_factor_monthly_pit(date, factorids, ls_ids, connection = None):
     return afl.merge(cid, left_on='securityid', right_on='securityid')
 
 
+@pooled
 def get_afl_factor_monthly_period(begin, end, factorids, connection = None):
 
     begin_datestr = (
@@ -2627,6 +2897,7 @@ def get_afl_factor_monthly_period(begin, end, factorids, connection = None):
 
 
 
+@pooled
 def get_live_mipricing(asofdate, ls_ids, connection = None):
     """
     """
@@ -2664,6 +2935,7 @@ def get_live_mipricing(asofdate, ls_ids, connection = None):
 
 
 
+@pooled
 def get_company_industryid(ls_ids, connection = None):
     """
     """
@@ -2685,6 +2957,7 @@ def get_company_industryid(ls_ids, connection = None):
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_companyid_from_isin(isin_ids, connection = None):
     """
     """
@@ -2706,6 +2979,7 @@ def get_companyid_from_isin(isin_ids, connection = None):
     return read_sql_to_df(sql, connection, cursor) 
 
 
+@pooled
 def get_isin_from_secid(sec_ids, connection = None):
     """
     """
@@ -2729,6 +3003,7 @@ def get_isin_from_secid(sec_ids, connection = None):
 
 ##
 # mar. 22. 2022
+@pooled
 def get_ref_gvkeyiid(connection = None):
     '''
     get information about gvkeyiid s, including tradingitemid and related companyid
@@ -2766,6 +3041,7 @@ def get_ref_gvkeyiid(connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_ref_cik(ls_ids, get_cik = True, connection = None):
     '''
     get information about cik s, including tradingitemid and related companyid
@@ -2822,6 +3098,7 @@ def get_ref_cik(ls_ids, get_cik = True, connection = None):
 
 
 # mar. 21. 2022
+@pooled
 def get_universe(date, mktcap_thres, adv_thres, connection = None):
     '''
     get the idmaps from company id to corresponding isin
@@ -2950,6 +3227,7 @@ def get_universe(date, mktcap_thres, adv_thres, connection = None):
 
 
 # mar. 22. 2022
+@pooled
 def get_tradingitem_detail(tradingitems, connection = None):
     '''
     get information about gvkeyiid s, including tradingitemid and related companyid
@@ -3005,6 +3283,7 @@ def get_tradingitem_detail(tradingitems, connection = None):
 
 
 # mar. 24. 2022
+@pooled
 def get_companyid_from_securityid(securityids, connection = None):
 
     sql = f"""
@@ -3031,6 +3310,7 @@ def get_companyid_from_securityid(securityids, connection = None):
 
 
 # apr. 8. 2022
+@pooled
 def get_industryid(companyids, connection = None):
 
     sql = f"""
@@ -3057,6 +3337,7 @@ def get_industryid(companyids, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_target_price(asofdate, ls_ids, dataitemids, connection = None):
     """
     """
@@ -3099,6 +3380,7 @@ def get_target_price(asofdate, ls_ids, dataitemids, connection = None):
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_target_price_ref_ti(asofdate, ls_ids, dataitemids, connection = None):
     """
     """
@@ -3138,6 +3420,7 @@ def get_target_price_ref_ti(asofdate, ls_ids, dataitemids, connection = None):
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_hist_revenue_estimate(ls_ids, dataitemids, connection = None):
     """
     """
@@ -3170,6 +3453,7 @@ def get_hist_revenue_estimate(ls_ids, dataitemids, connection = None):
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_hist_target_price(ls_ids, dataitemids, connection = None):
     """
     """
@@ -3215,6 +3499,7 @@ def get_hist_target_price(ls_ids, dataitemids, connection = None):
 
 
 
+@pooled
 def get_live_with_hist_target_price(startdate, enddate, ls_ids, dataitemids, connection = None):
     """
     """
@@ -3261,6 +3546,7 @@ def get_live_with_hist_target_price(startdate, enddate, ls_ids, dataitemids, con
 
 
 # july 18 2022
+@pooled
 def get_hist_estimate_from_analysisdata(datestart, dateend, ls_ids, dataitemids, connection = None):
 
     if connection is None:
@@ -3294,6 +3580,7 @@ def get_hist_estimate_from_analysisdata(datestart, dateend, ls_ids, dataitemids,
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_cur_estimate_from_analysisdata(todate, startdate, ls_ids, dataitemids, connection = None):
 
     if connection is None:
@@ -3328,6 +3615,7 @@ def get_cur_estimate_from_analysisdata(todate, startdate, ls_ids, dataitemids, c
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_hist_estimate_from_numericdata(datestart, dateend, ls_ids, dataitemids, connection = None):
 
     if connection is None:
@@ -3364,6 +3652,7 @@ def get_hist_estimate_from_numericdata(datestart, dateend, ls_ids, dataitemids,
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_cur_estimate_from_numericdata(asofdate, ls_ids, dataitemids, connection = None):
 
     if connection is None:
@@ -3399,6 +3688,7 @@ def get_cur_estimate_from_numericdata(asofdate, ls_ids, dataitemids, connection
     return read_sql_to_df(sql, connection, cursor)  
 
 
+@pooled
 def get_companyname(ls_ids, connection = None):
 
     if connection is None:
@@ -3420,6 +3710,7 @@ def get_companyname(ls_ids, connection = None):
 
 
 # get stock split 
+@pooled
 def get_stocksplit(connection = None):
 
     if connection is None:
@@ -3439,6 +3730,7 @@ def get_stocksplit(connection = None):
 
     
 #######
+@pooled
 def test(ls_ids, ls_dataitemid, connection = None):
 
 
@@ -3504,6 +3796,7 @@ def test(ls_ids, ls_dataitemid, connection = None):
 
 
 # owner
+@pooled
 def get_live_holder_of_co(connection = None):
 
     if connection is None:
@@ -3546,6 +3839,7 @@ def get_live_holder_of_co(connection = None):
     return read_sql_to_df(sql, connection, cursor)   
 
 
+@pooled
 def get_live_type_of_holder_of_co(connection = None):
 
     if connection is None:
@@ -3575,6 +3869,7 @@ def get_live_type_of_holder_of_co(connection = None):
     return read_sql_to_df(sql, connection, cursor)   
 
 
+@pooled
 def get_netinsidertrading(connection = None):
 
     if connection is None:
@@ -3602,6 +3897,7 @@ def get_netinsidertrading(connection = None):
     
     return read_sql_to_df(sql, connection, cursor) 
 
+@pooled
 def get_hist_holder_of_co(connection = None):
 
     if connection is None:
@@ -3648,6 +3944,7 @@ def get_hist_holder_of_co(connection = None):
 
 
     
+@pooled
 def get_cur_miadj_pricing_tradingitem(asofdate, ls_ids, connection = None):
 
     if connection is None:
@@ -3697,6 +3994,7 @@ def get_cur_miadj_pricing_tradingitem(asofdate, ls_ids, connection = None):
     return pr
 
 
+@pooled
 def get_afl_factor_intl(date, ls_ids, factorids, connection = None):
 
     datestr = (
@@ -3736,6 +4034,7 @@ def get_afl_factor_intl(date, ls_ids, factorids, connection = None):
 
 
 #### global
+@pooled
 def get_universe_global(date, mktcap_thres, adv_thres, countrycode, currencyid, connection = None):
     '''
     get the idmaps from company id to corresponding isin
@@ -3864,6 +4163,7 @@ def get_universe_global(date, mktcap_thres, adv_thres, countrycode, currencyid,
 
 
 # fx rate  
+@pooled
 def get_cur_fxrate(asofdate, ls_ids, connection = None):
 
     if connection is None:
@@ -3883,13 +4183,21 @@ def get_cur_fxrate(asofdate, ls_ids, connection = None):
     AND fxrate.priceDate = '{asofdate}'
     AND fxrate.latestsnapflag = 1 
     """
-    pr = read_sql_to_df(sql, connection, cursor)  
-    pr.loc[:,'priceclose'] = pr.loc[:,'priceclose'].astype(float)
+    pr = read_sql_to_df(sql, connection, cursor, dtypes = {'priceclose': 'float64'})  
     pr = pr.rename(columns = {'priceclose':'fxrate'})
 
     return pr
 
-def get_hist_fxrate(fromdate, connection = None):
+@pooled
+def get_hist_fxrate(fromdate, connection = None, chunksize = None):
+    """
+    Get the history of fx rates since fromdate
+    
+    Args:
+        fromdate (str): '2010-01-01'
+        connection (None, optional): Description
+        chunksize (int, optional): stream the result in chunks of this many rows (returns a generator of pd.DataFrame)
+    """
 
     if connection is None:
         connection = get_connection(DBINFO)
@@ -3907,13 +4215,16 @@ def get_hist_fxrate(fromdate, connection = None):
     WHERE fxrate.priceDate >= '{fromdate}'
     AND fxrate.latestsnapflag = 1 
     """
-    pr = read_sql_to_df(sql, connection, cursor)  
-    pr.loc[:,'priceclose'] = pr.loc[:,'priceclose'].astype(float)
-    pr = pr.rename(columns = {'priceclose':'fxrate'})
+    def tidy(pr):
+        pr.loc[:,'priceclose'] = pr.loc[:,'priceclose'].astype(float)
+        return pr.rename(columns = {'priceclose':'fxrate'})
 
-    return pr
+    if chunksize:
+        return (tidy(pr) for pr in read_sql_to_chunks(sql, connection, chunksize))
+    return tidy(read_sql_to_df(sql, connection, cursor))
 
 
+@pooled
 def get_pit_universe_global(connection = None):
 
     sql = f"""
@@ -3975,7 +4286,13 @@ def get_pit_universe_global(connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
-def get_pit_universe_global_hist(connection = None):
+@pooled
+def get_pit_universe_global_hist(connection = None, chunksize = None):
+    """
+    Args:
+        connection (None, optional): Description
+        chunksize (int, optional): stream the result in chunks of this many rows (returns a generator of pd.DataFrame)
+    """
     
     sql = f"""
 
@@ -4024,8 +4341,11 @@ def get_pit_universe_global_hist(connection = None):
         connection = get_connection(DBINFO)
     cursor = connection.cursor()
     
+    if chunksize:
+        return read_sql_to_chunks(sql, connection, chunksize)
     return read_sql_to_df(sql, connection, cursor)
 
+@pooled
 def vol_filter(tids, date, connection = None):
 
     datestr = (
@@ -4060,6 +4380,7 @@ def vol_filter(tids, date, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_cur_mc_global(cids, date, lookback_date = 5, connection = None):
 
     datestr = (
@@ -4100,6 +4421,7 @@ def get_cur_mc_global(cids, date, lookback_date = 5, connection = None):
 
 
 
+@pooled
 def get_countrygeo_map(ls_ids, connection = None):
     sql = f"""
 		SELECT country, countryid
@@ -4117,6 +4439,7 @@ def get_countrygeo_map(ls_ids, connection = None):
 
 
 
+@pooled
 def test1(ls_ids, dataitemids, asofdate, forecastyear_start, forecastyear_end, connection = None):
     datestr = (
         pd.to_datetime(asofdate)
@@ -4170,6 +4493,7 @@ def test1(ls_ids, dataitemids, asofdate, forecastyear_start, forecastyear_end, c
 
 
 
+@pooled
 def get_estimates_hist(ls_ids, dataitemids, fromdate, periodtype = 1, connection = None):
     datestr = (
         pd.to_datetime(fromdate)
@@ -4210,6 +4534,7 @@ def get_estimates_hist(ls_ids, dataitemids, fromdate, periodtype = 1, connection
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_estimates_cur_q_ref_co(ls_ids, dataitemids, asofdate, connection = None):
     datestr = (
         pd.to_datetime(asofdate)
@@ -4257,6 +4582,7 @@ def get_estimates_cur_q_ref_co(ls_ids, dataitemids, asofdate, connection = None)
     
     return read_sql_to_df(sql, connection, cursor)
 
+@pooled
 def get_act_q_ref_co(ls_ids, dataitemids, startdate, connection = None):
     datestart = pd.to_datetime(startdate).tz_localize(SERVER_TIMEZONE).tz_convert("UTC").strftime("%Y-%m-%d")
 
@@ -4294,6 +4620,7 @@ def get_act_q_ref_co(ls_ids, dataitemids, startdate, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_hist_act_q_ref_co(ls_ids, dataitemids, startdate, enddate, connection = None):
 
     sql = f"""
@@ -4330,6 +4657,7 @@ def get_hist_act_q_ref_co(ls_ids, dataitemids, startdate, enddate, connection =
     
     return read_sql_to_df(sql, connection, cursor)
 
+@pooled
 def get_estimates_cur_q(ls_ids, dataitemids, asofdate, connection = None):
     datestr = (
         pd.to_datetime(asofdate)
@@ -4377,6 +4705,7 @@ def get_estimates_cur_q(ls_ids, dataitemids, asofdate, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_estimates_q(ls_ids, dataitemids, asofdate, connection = None):
     datestr = (
         pd.to_datetime(asofdate)
@@ -4422,6 +4751,7 @@ def get_estimates_q(ls_ids, dataitemids, asofdate, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_estimates_hist_q_ref_ti(ls_ids, dataitemids, datestart, tp = False, connection = None):
     datestart = (pd.to_datetime(datestart)
             .tz_localize(SERVER_TIMEZONE)
@@ -4472,6 +4802,7 @@ def get_estimates_hist_q_ref_ti(ls_ids, dataitemids, datestart, tp = False, conn
 
 
 # a query from cid --> gvkeyiid 
+@pooled
 def ref_cid_gvkeyiid(ls_ids, connection = None):
 
     sql = f"""
@@ -4502,6 +4833,7 @@ def ref_cid_gvkeyiid(ls_ids, connection = None):
 
 
 
+@pooled
 def get_transcript_ref_earliest_new(ls_ids, startdate, enddate=None, connection = None):
     """
     Get historical reference table for a list of companyid with asscoiated transcriptid from given a date range (from startdate to enddate)
@@ -4576,6 +4908,7 @@ def get_transcript_ref_earliest_new(ls_ids, startdate, enddate=None, connection
 
 
 ### new
+@pooled
 def earnings_on_the_date(ls_ids, connection = None):
     sql = f"""
     select et.objectId as CompanyID, e.keyDevId, e.mostImportantDateUTC as EarningsDate, em.marketIndicatorTypeName, e.headline, er.fiscalyear, er.fiscalquarter, er.calendaryear
@@ -4594,6 +4927,7 @@ def earnings_on_the_date(ls_ids, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def earnings_given_keydevid(ls_ids, connection = None):
     sql = f"""
     select et.objectId as CompanyID, e.keyDevId as linkedkeydevid, e.mostImportantDateUTC as EarningsDate, em.marketIndicatorTypeName, e.headline, er.fiscalyear, er.fiscalquarter, er.calendaryear
@@ -4612,6 +4946,7 @@ def earnings_given_keydevid(ls_ids, connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def eventtoevent(keydevids, connection = None):
     sql = f"""
         select * from ciqeventtoevent ete
@@ -4624,6 +4959,7 @@ def eventtoevent(keydevids, connection = None):
                 
     return read_sql_to_df(sql, connection, cursor)
 
+@pooled
 def get_epsestimatediff_ref_co(ls_ids, dataitemids, startdate, connection = None):
     datestr = pd.to_datetime(startdate).tz_localize(SERVER_TIMEZONE).tz_convert("UTC").strftime("%Y-%m-%d %H:%M:%S")
 
@@ -4657,6 +4993,7 @@ def get_epsestimatediff_ref_co(ls_ids, dataitemids, startdate, connection = None
     
     return read_sql_to_df(sql, connection, cursor)
 
+@pooled
 def get_hist_epsestimatediff_ref_co(ls_ids, dataitemids, startdate, enddate, connection = None):
 
     sql = f"""
@@ -4690,6 +5027,7 @@ def get_hist_epsestimatediff_ref_co(ls_ids, dataitemids, startdate, enddate, con
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_guidances(ls_ids, dataitemids, asofdate, connection = None):
     datestr = (
         pd.to_datetime(asofdate)
@@ -4737,6 +5075,7 @@ def get_guidances(ls_ids, dataitemids, asofdate, connection = None):
 
 
 # aug. 8 2024
+@pooled
 def get_all_us_universe(connection = None):
     '''
     get all us companies
@@ -4787,6 +5126,7 @@ def get_all_us_universe(connection = None):
     return read_sql_to_df(sql, connection, cursor)
 
 
+@pooled
 def get_all_transcript(ls_ids, connection = None):
     """
     Get historical reference table for a list of companyid with asscoiated transcriptid from given a date range (from startdate to enddate)
@@ -4830,6 +5170,7 @@ def get_all_transcript(ls_ids, connection = None):
 
 
 
+@pooled
 def get_transcript_metadata(ls_tids, connection = None):
     
     sql = f"""
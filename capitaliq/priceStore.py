@@ -0,0 +1,189 @@
+import os
+import os.path as osp
+import time
+import shutil
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from capitaliq.databaseManager import get_hist_miadj_pricing, get_hist_miadj_pricing_by_company
+
+
+class PriceStore():
+    """Local parquet warehouse of miadjprice rows, hive-partitioned by year of pricedate
+
+    Keyed on companyid / tradingitemid / pricedate. update() appends only the rows newer
+    than what is already stored, read() scans with column and date-range pushdown so a
+    query only touches the year partitions and columns it needs.
+
+    note: divadjclose / divadjfactor are stored as of the fetch date; a dividend paid later
+    changes the factor of older dates, use update(..., rebuild=True) to re-pull everything.
+
+    Args:
+        path (str): root of the dataset e.g. 'data/price/store/'
+    """
+    KEY = ['companyid', 'tradingitemid', 'pricedate']
+
+    def __init__(self, path = 'data/price/store/'):
+        self.path = path
+
+    def exists(self) -> bool:
+        return osp.isdir(self.path) and any(True for _ in self._files())
+
+    def _files(self):
+        for root, _, files in os.walk(self.path):
+            for f in files:
+                if f.endswith('.parquet'):
+                    yield osp.join(root, f)
+
+    def _dataset(self):
+        return ds.dataset(self.path, format = 'parquet', partitioning = 'hive')
+
+    def append(self, price: pd.DataFrame) -> int:
+        """append rows (as returned by get_hist_miadj_pricing) to the store
+
+        Args:
+            price (pd.DataFrame): must contain companyid, tradingitemid, pricedate
+
+        Returns:
+            int: number of rows written
+        """
+        if price is None or len(price) == 0:
+            return 0
+        price = price.copy()
+        price['pricedate'] = pd.to_datetime(price['pricedate'])
+        price['year'] = price['pricedate'].dt.year.astype('int32')
+        table = pa.Table.from_pandas(price, preserve_index = False)
+        ds.write_dataset(
+            table, self.path, format = 'parquet',
+            partitioning = ds.partitioning(pa.schema([('year', pa.int32())]), flavor = 'hive'),
+            # unique name per append, so earlier files are never overwritten
+            basename_template = f'part-{time.time_ns()}-{{i}}.parquet',
+            existing_data_behavior = 'overwrite_or_ignore')
+        return len(price)
+
+    def last_pricedate(self, by_company = False):
+        """latest stored pricedate, overall or per companyid
+
+        Returns:
+            pd.Timestamp or pd.Series (index companyid), None if the store is empty
+        """
+        if not self.exists():
+            return None
+        df = self._dataset().to_table(columns = ['companyid', 'pricedate']).to_pandas()
+        if by_company:
+            return df.groupby('companyid')['pricedate'].max()
+        return df['pricedate'].max()
+
+    def update(self, ls_ids, start = '2000-01-01', end = None, chunksize = 200, rebuild = False) -> int:
+        """append the miadjprice rows not yet in the store
+
+        Companies already stored are fetched from the day after their own latest stored pricedate,
+        companies new to the store get their full history from start.
+
+        Args:
+            ls_ids (list): list of companyid   [24937, 32307]
+            start (str, optional): history start for new companies '2000-01-01'
+            end (str, optional): defaults to today
+            chunksize (int, optional): companies per query
+            rebuild (bool, optional): drop the store and pull everything again
+
+        Returns:
+            int: number of rows appended
+
+        Raises:
+            psycopg2.DatabaseError: the query of a chunk failed, its companyids are on the error
+                                    (error.companyids), chunks before it are already stored
+        """
+        if end is None:
+            end = pd.Timestamp.today().strftime('%Y-%m-%d')
+        if rebuild and osp.isdir(self.path):
+            shutil.rmtree(self.path)
+
+        ls_ids = list(pd.unique(pd.Series(ls_ids)))
+        known = self.last_pricedate(by_company = True)
+        if known is None:
+            known = pd.Series(dtype = 'datetime64[ns]')
+        new_ids = [cid for cid in ls_ids if cid not in known.index]
+        old_ids = [cid for cid in ls_ids if cid in known.index]
+
+        nrows = 0
+        if old_ids:
+            # chunks of companies with similar last dates: each chunk is queried from its earliest
+            # own start and every company keeps only the rows after its own last stored pricedate
+            since = (known[old_ids] + pd.Timedelta(days = 1)).sort_values(kind = 'stable')
+            since = since[since <= pd.Timestamp(end)]
+            for i in range(0, len(since), chunksize):
+                chunk = since.iloc[i:i + chunksize]
+                price = get_hist_miadj_pricing(chunk.min().strftime('%Y-%m-%d'), end, list(chunk.index))
+                if price is None:
+                    # read_sql_to_df already printed the database error, a skipped chunk would look like
+                    # companies without new prices
+                    error = psycopg2.DatabaseError(f'price query failed for {len(chunk)} companies: {list(chunk.index)}')
+                    error.companyids = list(chunk.index)
+                    raise error
+                if len(price) == 0:
+                    continue
+                pricedate = pd.to_datetime(price['pricedate'])
+                nrows += self.append(price[(pricedate >= price['companyid'].map(chunk)).to_numpy()])
+        if new_ids:
+            # one append per query chunk keeps the files large
+            frames = []
+            for _, price in get_hist_miadj_pricing_by_company(start, end, new_ids, chunksize = chunksize):
+                frames.append(price)
+                if len(frames) >= chunksize:
+                    nrows += self.append(pd.concat(frames, ignore_index = True))
+                    frames = []
+            if frames:
+                nrows += self.append(pd.concat(frames, ignore_index = True))
+        return nrows
+
+    def read(self, start = None, end = None, ls_ids = None, columns = None) -> pd.DataFrame:
+        """scan the store with column and date-range pushdown
+
+        Args:
+            start (str, optional): '2020-01-01' (incl.)
+            end (str, optional): '2020-12-31' (incl.)
+            ls_ids (list, optional): list of companyid, None for all
+            columns (list, optional): e.g. ['companyid', 'pricedate', 'divadjclose'], None for all
+
+        Returns:
+            pd.DataFrame: sorted by pricedate, companyid (ready for pd.merge_asof(..., on='pricedate', by='companyid'))
+        """
+        flt = None
+        def both(a, b):
+            return b if a is None else a & b
+        if start is not None:
+            start = pd.Timestamp(start)
+            flt = both(flt, (ds.field('year') >= start.year) & (ds.field('pricedate') >= start))
+        if end is not None:
+            end = pd.Timestamp(end)
+            flt = both(flt, (ds.field('year') <= end.year) & (ds.field('pricedate') <= end))
+        if ls_ids is not None:
+            flt = both(flt, ds.field('companyid').isin([int(cid) for cid in ls_ids]))
+
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + ['companyid', 'pricedate']))
+        df = self._dataset().to_table(columns = columns, filter = flt).to_pandas()
+        if columns is None:
+            df = df.drop(columns = ['year'])
+        return df.sort_values(['pricedate', 'companyid'], kind = 'stable').reset_index(drop = True)
+
+    def compact(self):
+        """rewrite every year partition into one file, run after many daily updates"""
+        for year_dir in sorted(os.listdir(self.path)):
+            part = osp.join(self.path, year_dir)
+            if not osp.isdir(part):
+                continue
+            files = [osp.join(part, f) for f in os.listdir(part) if f.endswith('.parquet')]
+            if len(files) <= 1:
+                continue
+            table = ds.dataset(files, format = 'parquet').to_table()
+            df = table.to_pandas().drop_duplicates(subset = self.KEY, keep = 'last').sort_values(self.KEY)
+            # dot prefix keeps a half written file invisible to dataset discovery
+            tmp = osp.join(part, f'.compact-{time.time_ns()}.tmp')
+            df.to_parquet(tmp, index = False)
+            os.replace(tmp, osp.join(part, f'part-{time.time_ns()}-0.parquet'))
+            for f in files:
+                os.remove(f)
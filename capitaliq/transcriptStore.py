@@ -0,0 +1,229 @@
+import os
+import os.path as osp
+import json
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import tqdm
+import psycopg2
+
+from capitaliq.databaseManager import get_transcript
+
+
+class TranscriptStore():
+    """Local parquet store of transcript components, hive-partitioned by call year and companyid bucket
+
+    A bucket (companyid % BUCKETS) holds many companies, so a chunk of transcripts lands in a few
+    files instead of one per company. Rows are written sorted by companyid / transcriptid /
+    componentorder in small row groups, so the parquet row-group statistics let read() skip
+    everything but the groups holding the requested ids. A small _index.parquet (transcriptid ->
+    year, companyid) additionally prunes the partitions before any file footer is opened.
+    compact() merges the files of every partition after many downloads.
+
+    Args:
+        path (str): root of the dataset e.g. 'data/et/store/'
+    """
+    INDEX_FILE = '_index.parquet' # leading underscore: ignored by dataset discovery
+    MANIFEST_FILE = '_manifest.jsonl' # one line per downloaded chunk
+    ROWS_PER_GROUP = 5000
+    BUCKETS = 16
+
+    def __init__(self, path = 'data/et/store/'):
+        self.path = path
+
+    def _dataset(self):
+        return ds.dataset(self.path, format = 'parquet', partitioning = 'hive')
+
+    def index(self) -> pd.DataFrame:
+        """transcriptid, year, companyid of every stored transcript"""
+        path = osp.join(self.path, self.INDEX_FILE)
+        if not osp.exists(path):
+            return pd.DataFrame({'transcriptid': pd.Series(dtype = 'int64'),
+                                 'year': pd.Series(dtype = 'int32'),
+                                 'companyid': pd.Series(dtype = 'int64')})
+        return pd.read_parquet(path)
+
+    def write(self, transcripts: pd.DataFrame, ref: pd.DataFrame, name = None) -> int:
+        """write transcript components (as returned by get_transcript) in one pass
+
+        Args:
+            transcripts (pd.DataFrame): component rows with transcriptid
+            ref (pd.DataFrame): reference table with transcriptid, companyid, earningscalldateutc
+                                (e.g. data/us_et_ref.csv), gives each transcript its partition
+            name (str, optional): file name stem; writing the same rows again under the same
+                                  name overwrites instead of duplicating them. Unique per call by default
+
+        Returns:
+            int: number of rows written
+        """
+        if transcripts is None or len(transcripts) == 0:
+            return 0
+        keys = ref[['transcriptid', 'companyid', 'earningscalldateutc']].drop_duplicates('transcriptid')
+        keys = keys.assign(year = pd.to_datetime(keys['earningscalldateutc']).dt.year.astype('int32'))
+        keys = keys[['transcriptid', 'companyid', 'year']].astype({'transcriptid': 'int64', 'companyid': 'int64'})
+
+        df = transcripts.astype({'transcriptid': 'int64'}).merge(keys, on = 'transcriptid', how = 'inner')
+        if len(df) < len(transcripts):
+            print(f'{len(transcripts) - len(df)} component rows without a reference entry are not stored')
+        df['bucket'] = (df['companyid'] % self.BUCKETS).astype('int32')
+        df = df.sort_values(['year', 'bucket', 'companyid', 'transcriptid', 'componentorder'])
+
+        os.makedirs(self.path, exist_ok = True)
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index = False), self.path, format = 'parquet',
+            partitioning = ds.partitioning(pa.schema([('year', pa.int32()), ('bucket', pa.int32())]), flavor = 'hive'),
+            # unique name per write unless given, earlier files are never overwritten
+            basename_template = f'{name or f"part-{time.time_ns()}"}-{{i}}.parquet',
+            max_rows_per_group = self.ROWS_PER_GROUP, min_rows_per_group = self.ROWS_PER_GROUP,
+            existing_data_behavior = 'overwrite_or_ignore')
+
+        index = pd.concat([self.index(), keys[keys['transcriptid'].isin(df['transcriptid'])]])
+        index = index.drop_duplicates('transcriptid', keep = 'last').sort_values('transcriptid')
+        tmp = osp.join(self.path, f'.index-{time.time_ns()}.tmp')
+        index.to_parquet(tmp, index = False)
+        os.replace(tmp, osp.join(self.path, self.INDEX_FILE))
+        return len(df)
+
+    def downloaded(self) -> set:
+        """transcriptids of every chunk recorded in the manifest"""
+        path = osp.join(self.path, self.MANIFEST_FILE)
+        done = set()
+        if not osp.exists(path):
+            return done
+        with open(path) as f:
+            for line in f:
+                try:
+                    done.update(json.loads(line)['transcriptids'])
+                except (ValueError, KeyError):
+                    pass # a line cut short by a crash, its chunk is simply downloaded again
+        return done
+
+    def download(self, ls_transcript_ids, ref, chunksize = 200) -> int:
+        """bulk download into the store in chunks of transcripts, resumable
+
+        Every chunk is one get_transcript query written straight to the store, then recorded in
+        the manifest. A rerun skips the recorded transcripts and continues with the rest; a chunk
+        that was written but not recorded is written again under the same file name, so it
+        overwrites itself instead of leaving duplicate rows. A failed query stops the download
+        before its chunk is recorded, so a rerun retries it.
+
+        Args:
+            ls_transcript_ids (list): list of transcriptid
+            ref (pd.DataFrame): see write
+            chunksize (int, optional): transcripts per query
+
+        Returns:
+            int: number of component rows written by this run
+
+        Raises:
+            psycopg2.DatabaseError: the query of a chunk failed, its transcriptids are on the error (error.transcriptids)
+        """
+        done = self.downloaded()
+        todo = sorted(set(int(tid) for tid in ls_transcript_ids) - done)
+        chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+        print(f'{len(done)} transcripts already downloaded, {len(todo)} to go in {len(chunks)} chunks')
+
+        os.makedirs(self.path, exist_ok = True)
+        nrows = 0
+        for chunk in tqdm.tqdm(chunks):
+            transcripts = get_transcript(chunk)
+            if transcripts is None:
+                # read_sql_to_df already printed the database error, recording the chunk would skip it for good
+                error = psycopg2.DatabaseError(f'transcript query failed for {len(chunk)} transcripts: {chunk}')
+                error.transcriptids = chunk
+                raise error
+            rows = self.write(transcripts, ref, name = f'chunk-{chunk[0]}-{chunk[-1]}')
+            nrows += rows
+            with open(osp.join(self.path, self.MANIFEST_FILE), 'a') as f:
+                f.write(json.dumps({'first': chunk[0], 'last': chunk[-1], 'rows': rows,
+                                    'finished': time.time(), 'transcriptids': chunk}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        return nrows
+
+    def read(self, transcriptids, columns = None) -> pd.DataFrame:
+        """components of one or many transcripts, with partition and transcriptid pushdown
+
+        Args:
+            transcriptids (int or list): e.g. 2228812 or [2228812, 2231468]
+            columns (list, optional): e.g. ['transcriptid', 'componentorder', 'componenttext'], None for all
+
+        Returns:
+            pd.DataFrame: sorted by transcriptid, componentorder
+        """
+        transcriptids = [int(tid) for tid in np.atleast_1d(transcriptids)]
+
+        flt = ds.field('transcriptid').isin(transcriptids)
+        index = self.index()
+        hits = index[index['transcriptid'].isin(transcriptids)]
+        if len(hits):
+            # only the year / bucket directories that hold the requested ids are scanned
+            flt = flt & ds.field('year').isin(hits['year'].unique().tolist()) \
+                      & ds.field('bucket').isin((hits['companyid'] % self.BUCKETS).unique().tolist())
+        return self._scan(flt, columns)
+
+    def _scan(self, flt, columns):
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + ['transcriptid', 'componentorder']))
+        df = self._dataset().to_table(columns = columns, filter = flt).to_pandas()
+        if columns is None:
+            df = df.drop(columns = ['bucket'])
+        return df.sort_values(['transcriptid', 'componentorder']).reset_index(drop = True)
+
+    def read_company(self, companyid, year = None, columns = None) -> pd.DataFrame:
+        """all stored components of one company, optionally of one call year"""
+        flt = (ds.field('bucket') == int(companyid) % self.BUCKETS) & (ds.field('companyid') == int(companyid))
+        if year is not None:
+            flt = flt & (ds.field('year') == int(year))
+        return self._scan(flt, columns)
+
+    def compact(self):
+        """rewrite every year / bucket partition into one file, run after many downloads
+
+        Also moves a store of the earlier year / companyid layout over to the buckets.
+        Do not run while a download is writing to the store.
+        """
+        for year_dir in sorted(os.listdir(self.path)):
+            year_path = osp.join(self.path, year_dir)
+            if not (year_dir.startswith('year=') and osp.isdir(year_path)):
+                continue
+            # bucket -> [(file, companyid of an earlier companyid partition or None)]
+            parts = {}
+            for sub in sorted(os.listdir(year_path)):
+                key, _, value = sub.partition('=')
+                if key not in ('bucket', 'companyid'):
+                    continue
+                bucket = int(value) if key == 'bucket' else int(value) % self.BUCKETS
+                companyid = int(value) if key == 'companyid' else None
+                for f in sorted(os.listdir(osp.join(year_path, sub))):
+                    if f.endswith('.parquet') and not f.startswith('.'):
+                        parts.setdefault(bucket, []).append((osp.join(year_path, sub, f), companyid))
+
+            for bucket, files in parts.items():
+                if len(files) <= 1 and files[0][1] is None:
+                    continue
+                tables = []
+                for f, companyid in files:
+                    table = pq.ParquetFile(f).read()
+                    if companyid is not None:
+                        table = table.append_column('companyid', pa.array([companyid] * len(table), pa.int64()))
+                    tables.append(table)
+                df = pa.concat_tables(tables, promote_options = 'default').to_pandas()
+                # a chunk written again after an earlier compact would otherwise be stored twice
+                df = df.drop_duplicates(['transcriptid', 'componentorder'], keep = 'last')
+                df = df.sort_values(['companyid', 'transcriptid', 'componentorder'])
+
+                part = osp.join(year_path, f'bucket={bucket}')
+                os.makedirs(part, exist_ok = True)
+                # dot prefix keeps a half written file invisible to dataset discovery
+                tmp = osp.join(part, f'.compact-{time.time_ns()}.tmp')
+                pq.write_table(pa.Table.from_pandas(df, preserve_index = False), tmp, row_group_size = self.ROWS_PER_GROUP)
+                os.replace(tmp, osp.join(part, f'compact-{time.time_ns()}-0.parquet'))
+                for f, _ in files:
+                    os.remove(f)
+            for sub in os.listdir(year_path):
+                if sub.startswith('companyid=') and not os.listdir(osp.join(year_path, sub)):
+                    os.rmdir(osp.join(year_path, sub))
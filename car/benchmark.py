@@ -0,0 +1,52 @@
+import os
+import pandas as pd
+
+from car.trading_calendar import get_trading_calendar
+
+# index series as downloaded from yahoo: Date, Open, High, Low, Close, Adj Close, Volume
+INDEX_PATH = 'data/index/'
+
+# process wide cache, ticker -> frame
+_BENCHMARKS = {}
+
+
+def benchmark_series(ticker = 'SPY'):
+    """dividend adjusted open / close of an index series, loaded once per process
+
+    The series is put on the trading calendar: every trading day between its first and last date
+    is a row, days the file misses are NaN rather than silently skipped. Treat the frame as read only.
+
+    Args:
+        ticker (str, optional): file name under INDEX_PATH, e.g. 'SPY' for data/index/SPY.csv
+
+    Returns:
+        pd.DataFrame: index pricedate, columns adjopen, adjclose
+    """
+    if ticker in _BENCHMARKS:
+        return _BENCHMARKS[ticker]
+
+    index = pd.read_csv(os.path.join(INDEX_PATH, f'{ticker}.csv'))
+    index['pricedate'] = pd.to_datetime(index['Date'])
+    index['discount_factor'] = index['Adj Close']/index['Close']
+    index['adjclose'] = index['Close'] * index['discount_factor']
+    index['adjopen'] = index['Open'] * index['discount_factor']
+    index = index.set_index('pricedate')[['adjopen', 'adjclose']].sort_index()
+
+    try:
+        tradingday = pd.DatetimeIndex(get_trading_calendar().between(index.index[0], index.index[-1]))
+        index = index.reindex(index.index.union(tradingday))
+    except FileNotFoundError:
+        pass # no calendar yet, keep the days of the file
+    index.index.name = 'pricedate'
+
+    _BENCHMARKS[ticker] = index
+    return index
+
+
+def set_benchmark_series(benchmarks):
+    """seed the process cache, e.g. in a worker with the series its parent already loaded
+
+    Args:
+        benchmarks (dict): ticker -> frame as returned by benchmark_series
+    """
+    _BENCHMARKS.update(benchmarks)
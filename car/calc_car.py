@@ -3,47 +3,80 @@
 import pandas as pd 
 import sys
 from statsmodels.regression.rolling import RollingOLS
-import tqdm
 import os
 import numpy as np 
+from numpy.lib.stride_tricks import sliding_window_view
 
 ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management 
 sys.path.append(ROOTPATH)
 # internal import
 from capitaliq.databaseManager import get_hist_miadj_pricing
-from gff.gff_function import famaFrench5Factor, momentumFactor
+from gff.gff_function import dailyFactors
+from car.rolling_ols import batched_rolling_ols
+from car.trading_calendar import get_trading_calendar
+from fhandler.fileHandler import FileHandler
+from fhandler.datasetHandler import DatasetHandler
 
 
+# output column -> horizon in trading days, compounded on top of one_d_car
+CAR_HORIZONS = {'one_w_car': 5, 'one_m_car': 22, 'one_q_car': 66}
 
-def calculate_car(companyid = 32307, addr = 'data/car_data/v1/', start_date = '2018-01-01', end_date = '2030-06-01', rolling_window = 252):
-    os.makedirs(addr, exist_ok=True)
-    # calculate CAR cumulative abnormal return
-    #   FOR ONE STOCK
 
-    # step 0: paramter declarations & data preparation
+def rolling_compound(compound, horizons = CAR_HORIZONS):
+    """compound (1 + r) over trailing windows for several horizons without a python callback per row
 
-    # load in ref_table
+    Same result as compound.rolling(window).apply(np.prod, raw=True) - 1 for every horizon:
+    NaN for the first window - 1 rows and for any window containing a NaN.
 
-    companyid = companyid # nvidia 32307 # please read from ref_table
+    Args:
+        compound (pd.Series): 1 + daily abnormal return
+        horizons (dict): {output column: window}, e.g. {'one_w_car': 5, 'one_m_car': 22}
 
-    start_date, end_date = start_date, end_date
+    Returns:
+        pd.DataFrame: one column per horizon, aligned with compound.index
+    """
+    x = compound.to_numpy(dtype = float)
+    res = {}
+    for name, window in horizons.items():
+        car = np.full(len(x), np.nan)
+        if len(x) >= window:
+            car[window - 1:] = sliding_window_view(x, window).prod(axis = 1)
+        res[name] = car - 1
+    return pd.DataFrame(res, index = compound.index)
 
-    # rolling_window = 252 # 252 trading days a year 
-    addr = addr
 
-    # step 0: trading calendar
-    tcalendar = pd.read_csv('data/tradingcalendar/tradingcalendar.csv')
-    tcalendar['tradingday'] = pd.to_datetime(tcalendar['tradingday'])
+# exog of the rolling factor regression
+FACTORS = ['Mkt-RF','SMB','HML','RMW', 'CMA', 'Mom   ']
 
-    # step 1: pull out daily return of one individual stock
-    price = get_hist_miadj_pricing(start_date, end_date, [companyid, ])[['priceopen', 'priceclose', 'divadjclose', 'pricedate']]
-    price.dropna(inplace = True)
+
+def load_car_inputs(factors = None):
+    """trading calendar (TradingCalendar) and the daily fama french 5 + momentum factors keyed on pricedate
+
+    Args:
+        factors (pd.DataFrame, optional): date indexed factor frame, defaults to the process wide dailyFactors()
+    """
+    # step 0: trading calendar, loaded once per process
+    tcalendar = get_trading_calendar()
+
+    # step 2: pull out fama french factors, parsed once per process
+    if factors is None:
+        factors = dailyFactors()
+    factors = factors.rename_axis('pricedate').reset_index()
+    return tcalendar, factors
+
+
+def prepare_car_price(price, tcalendar, factors, rolling_window = 252):
+    """daily excess return of one stock on the trading calendar with the factors attached
+
+    Returns:
+        pd.DataFrame or None: None if the price history is too short for the rolling regression
+    """
+    price = price[['priceopen', 'priceclose', 'divadjclose', 'pricedate']].dropna()
 
     if len(price) <= 2 * rolling_window: # just to have a big buffer, otherwise = rolling_window will do
-        return 1 # price history too short 
+        return None # price history too short 
 
 
-    price['divadjclose'] = price['divadjclose'].astype(float)
     price['pricedate'] = pd.to_datetime(price['pricedate'])
 
     # line by line, we should not calculate the car if the price is smaller than a number (e.g. 1)
@@ -57,39 +90,35 @@ def calculate_car(companyid = 32307, addr = 'data/car_data/v1/', start_date = '2
     latest_price_date = price['pricedate'].iloc[-1]
 
     # trim tcalendar based on that 
-    tcalendar = tcalendar.query('tradingday >= @earliest_price_date and tradingday <= @latest_price_date')
+    tcalendar = tcalendar.frame(earliest_price_date, latest_price_date)
+    # the sessions as the strings of the csv schedule, the saved car files keep their column types
+    tcalendar['market_open'] = tcalendar['market_open'].astype(str)
+    tcalendar['market_close'] = tcalendar['market_close'].astype(str)
     price['divadjclose'] = price['divadjclose'].ffill()
     price['stock_ret'] = 100*(price['divadjclose'].pct_change())
 
     if len(price) <= 1.5 * rolling_window: # just to have a big buffer, otherwise = rolling_window will do
-        return 1 # price history too short 
+        return None # price history too short 
 
     price = pd.merge(tcalendar, price, left_on = 'tradingday', right_on = 'pricedate', how = 'left')
 
-    # step 2: pull out fama french factors 
-    ff_factor = famaFrench5Factor('d')
-    ff_factor['date_ff_factors'] = pd.to_datetime(ff_factor['date_ff_factors'])
-    ff_factor = ff_factor.rename(columns = {'date_ff_factors':'pricedate'})
-
-    mom_factor = momentumFactor('d')
-    mom_factor['date_ff_factors'] = pd.to_datetime(mom_factor['date_ff_factors'])
-    mom_factor = mom_factor.rename(columns = {'date_ff_factors':'pricedate'})
-
     # attach factors on price_df
-    price = pd.merge(price, ff_factor, on = 'pricedate', how = 'inner')
-    price = pd.merge(price, mom_factor, on = 'pricedate', how = 'inner')
+    price = pd.merge(price, factors, on = 'pricedate', how = 'inner')
     price['stock_ret-RF'] = price['stock_ret'] - price['RF']
+    return price
 
-    # step 3: decide rolling window and other parameters 
-    rwindow = rolling_window 
 
-    # step 4: run linear regression
-    model = RollingOLS(endog =price['stock_ret-RF'].values , exog=price[['Mkt-RF','SMB','HML','RMW', 'CMA', 'Mom   ']],window=rwindow)
+def finish_car(price, params, horizons = CAR_HORIZONS):
+    """abnormal return from the rolling factor betas and the CAR at different time horizons
 
-    rres = model.fit()
-    params = rres.params
+    Args:
+        price (pd.DataFrame): output of prepare_car_price
+        params (pd.DataFrame): rolling betas, columns FACTORS, aligned with price.index
 
-    price['y_hat'] = (params * price[['Mkt-RF','SMB','HML','RMW', 'CMA', 'Mom   ']]).sum(axis = 1)
+    Returns:
+        pd.DataFrame: the rows with an estimate
+    """
+    price['y_hat'] = (params * price[FACTORS]).sum(axis = 1)
     price['abnormal_ret'] = price['stock_ret-RF'] - price['y_hat']
     price = price.query('y_hat != 0') # filter out the first xxx rows
 
@@ -100,24 +129,97 @@ def calculate_car(companyid = 32307, addr = 'data/car_data/v1/', start_date = '2
     
     car['compound'] = (1 + car['abnormal_ret']/100)
     car['one_d_car'] = car['compound'] - 1
-    car['one_w_car'] = car['compound'].rolling(window=5).apply(np.prod, raw=True) - 1
-    car['one_m_car'] = car['compound'].rolling(window=22).apply(np.prod, raw=True) - 1
-    car['one_q_car'] = car['compound'].rolling(window=66).apply(np.prod, raw=True) - 1
+    # horizons e.g. {'one_w_car': 5, 'one_m_car': 22, 'one_q_car': 66}
+    for name, values in rolling_compound(car['compound'], horizons).items():
+        car[name] = values
+    return car
+
+
+def calculate_car(companyid = 32307, addr = 'data/car_data/v1/', start_date = '2018-01-01', end_date = '2030-06-01', rolling_window = 252, price = None, horizons = CAR_HORIZONS, factors = None, dataset = None):
+    # calculate CAR cumulative abnormal return
+    #   FOR ONE STOCK
+
+    # step 0: paramter declarations & data preparation
+    #   factors can be handed in, otherwise the process wide dailyFactors() is used
+    tcalendar, factors = load_car_inputs(factors)
+
+    # step 1: pull out daily return of one individual stock
+    #   price can be handed in from a batched fetch (get_hist_miadj_pricing_by_company)
+    if price is None:
+        price = get_hist_miadj_pricing(start_date, end_date, [companyid, ])
+    price = prepare_car_price(price, tcalendar, factors, rolling_window)
+    if price is None:
+        return 1 # price history too short 
+
+    # step 4: run linear regression
+    model = RollingOLS(endog =price['stock_ret-RF'].values , exog=price[FACTORS],window=rolling_window)
+
+    rres = model.fit()
+    car = finish_car(price, rres.params, horizons)
 
     print(car)
-    price.to_parquet(addr + f'{companyid}.parquet')
+    if dataset is not None:
+        dataset.append({companyid: car})
+    else:
+        FileHandler.save_with_dir_create(addr, 'parquet', companyid, car, checksum = True)
 
     return 0
 
 
+def calculate_car_batch(prices, addr = 'data/car_data/v2/', rolling_window = 252, horizons = CAR_HORIZONS, factors = None, dataset = None):
+    """calculate_car for many stocks at once, all rolling regressions solved in one batched_rolling_ols pass
+
+    Every stock keeps its own rows (the frame calculate_car would regress on), the stocks are only
+    stacked for the solver, so each window is the stock's own last rolling_window rows exactly as
+    in RollingOLS and the output is the same as calculate_car per stock.
+
+    Args:
+        prices (dict): companyid -> price frame as returned by get_hist_miadj_pricing
+        addr (str, optional): output folder, one {companyid}.parquet per stock
+        rolling_window (int, optional): 252 trading days a year
+        horizons (dict, optional): see rolling_compound
+        factors (pd.DataFrame, optional): see load_car_inputs
+        dataset (DatasetHandler, optional): append the whole batch to this dataset in one write instead of addr
+
+    Returns:
+        dict: companyid -> 0 written, 1 price history too short
+    """
+    tcalendar, factors = load_car_inputs(factors)
+
+    status = {}
+    frames = {}
+    for companyid, price in prices.items():
+        price = prepare_car_price(price, tcalendar, factors, rolling_window)
+        if price is None:
+            status[companyid] = 1
+        else:
+            frames[companyid] = price
+    if not frames:
+        return status
+
+    y = np.concatenate([frame['stock_ret-RF'].to_numpy(dtype = float) for frame in frames.values()])
+    x = np.concatenate([frame[FACTORS].to_numpy(dtype = float) for frame in frames.values()])
+    lengths = [len(frame) for frame in frames.values()]
+    params = batched_rolling_ols(y, x, lengths, rolling_window)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    cars = {}
+    for j, (companyid, frame) in enumerate(frames.items()):
+        frame_params = pd.DataFrame(params[offsets[j]:offsets[j + 1]], columns = FACTORS, index = frame.index)
+        cars[companyid] = finish_car(frame, frame_params, horizons)
+        status[companyid] = 0
+    if dataset is not None:
+        dataset.append(cars)
+    else:
+        for companyid, car in cars.items():
+            FileHandler.save_with_dir_create(addr, 'parquet', companyid, car, checksum = True)
+    return status
+
+
 
 # internal import
-from gff.gff_function import famaFrench5Factor, momentumFactor
-from capitaliq.databaseManager import get_hist_miadj_pricing
 from car.calc_et_car import calc_et_car
 
-from car.calc_car import calculate_car
-
 if __name__ == "__main__":
 
     universe = pd.read_csv('data/us_et_ref.csv', index_col = [0])# .query('companyid == 24937')
@@ -125,12 +227,20 @@ if __name__ == "__main__":
     # just to check whetehr our pricing function extract the right thing 
     # print(get_hist_miadj_pricing('2020-01-01', '2025-01-01', [24937, ])[['divadjclose', 'pricedate']])
 
-    # this step calculate one day car for every company in the universe 
-    for companyid in tqdm.tqdm(universe['companyid'].unique()):
-        # print(companyid)
-        if not os.path.exists(f'data/car_data/v2/{companyid}.parquet'):
-            calculate_car(companyid, addr='data/car_data/v2/', start_date='2000-01-01', end_date='2030-06-01')
-            print(f'{companyid} is done!')
+    # this step calculate one day car for every company in the universe
+    #   prices are pulled in chunks of companies, the rolling regressions are solved for a whole
+    #   chunk at once, and the chunks are spread over a process pool (workers from argv, default all cores)
+    from car.parallel import run_parallel, build_car_shard
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    #   every shard is appended to one partitioned dataset instead of one file per company,
+    #   the to-do list comes from the companyids already in it
+    car_dataset = DatasetHandler('data/car_data/v3/')
+    companyids = universe['companyid'].unique()
+    todo = list(set(companyids) - set(car_dataset.keys()))
+    report = run_parallel(build_car_shard, todo, workers = workers, shard_size = 200, dataset = car_dataset)
+    print(report)
+    #   the many small shard files into one large file per bucket
+    car_dataset.compact()
 
     # this step calculate car but in aggregated manner for every company in the universe
     #   and output one file in total
@@ -1,6 +1,7 @@
 # do this after calc_car.py
 import tqdm
 import pandas as pd 
+import numpy as np
 import warnings
 import sys
 import os
@@ -9,52 +10,91 @@ ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
 sys.path.append(ROOTPATH)
 
 from fhandler.fileHandler import FileHandler
+from fhandler.datasetHandler import DatasetHandler
 # internal
+from car.event_window import event_start_rows
 from capitaliq.databaseManager import get_hist_miadj_pricing
 
 warnings.filterwarnings("ignore")
 
-def calc_et_car(universe):
+# columns written by calc_car for every trading day
+CAR_COLUMNS = ['one_d_car', 'one_w_car', 'one_m_car', 'one_q_car']
+
+
+def resolve_event_rows(pricedate, ec_et):
+    """row of the first trading day that reflects each earnings call, for all calls of one company at once
+
+    A call before noon is priced in the same day (first pricedate >= call day), a call from 16:00 on
+    the next trading day (first pricedate > call day). Calls between 12:00 and 16:00 have no market
+    indicator type and, like calls after the last pricedate, get -1.
+
+    Args:
+        pricedate (np.ndarray): sorted datetime64 trading days of the company
+        ec_et (pd.Series): tz-naive call timestamps
+
+    Returns:
+        np.ndarray: int row position into pricedate per call, -1 if unresolved
+    """
+    hour = ec_et.dt.hour.to_numpy(dtype = float) # NaN for a missing timestamp
+    pos = event_start_rows(pricedate, ec_et.dt.normalize().to_numpy(), hour < 12)
+    pos[~((hour < 12) | (hour >= 16))] = -1
+    return pos
+
+
+def calc_et_car(universe, addr = 'data/car_data/v2/', dataset = None):
+    """car of every earnings call in the universe, written to data/car_et_data/car_et_total.csv
+
+    Events are grouped by company so each car file is read once, and all calls of a company are
+    resolved against its pricedates in one searchsorted (see resolve_event_rows).
+
+    Args:
+        universe (pd.DataFrame): one row per call with companyid, transcriptid, ec_et
+        addr (str, optional): folder of the {companyid}.parquet files written by calc_car
+        dataset (DatasetHandler, optional): read all companies from this dataset in one scan instead of addr
+    """
+    events = universe[['companyid', 'transcriptid', 'ec_et']].copy()
+    events['ec_et'] = pd.to_datetime(events['ec_et'])
+    if events['ec_et'].dt.tz is not None:
+        # keep the local wall clock, the timing rule is about local hours
+        events['ec_et'] = events['ec_et'].dt.tz_localize(None)
+    events['order'] = np.arange(len(events))
+
+    companyids = events['companyid'].unique()
+    if dataset is not None:
+        # the whole panel of the universe in one scan, split per company below
+        panel = dict(tuple(dataset.read(companyids, columns = ['pricedate'] + CAR_COLUMNS).groupby(dataset.key, sort = False)))
+        available = set(panel)
+    else:
+        # which car files exist, from one manifest lookup of the folder
+        available = set(companyids[FileHandler.existing_files(addr, '.parquet', companyids)])
 
     res = []
-    for _, row in tqdm.tqdm(universe.iterrows()):
-        cid = row['companyid']
-
-        ec_et = pd.to_datetime(row['ec_et'])# .tz_localize(None)
-        ec_et_day = pd.to_datetime(ec_et.date())
-        # print(ec_et)
-        # print(ec_et_day.year)
-
-        car_data_addr = f'data/car_data/v2/{cid}.parquet'
-        if FileHandler.check_file_existence(path='data/car_data/v2/', ext='.parquet', filename=cid):
-            car = pd.read_parquet(car_data_addr)
-        else:
+    for cid, group in tqdm.tqdm(events.groupby('companyid', sort = False)):
+        if cid not in available:
             print(f'companyid {cid} does not exist!')
-            continue 
-
-
-        # one_d_car, ten_d_car, one_m_car, one_q_car
-        
-        if ec_et.hour < 12:
-            car = car.query('pricedate >= @ec_et_day')
-        elif ec_et.hour >= 16:
-            car = car.query('pricedate > @ec_et_day')
-        else:
-            print(f'no such market indicator type! {ec_et}')
-            continue
-
-        if len(car) == 0:
             continue
-        car.reset_index(inplace = True, drop = True)
-
-        one_d_car = car['one_d_car'].iloc[0]
-        one_w_car = car['one_w_car'].iloc[0]
-        one_m_car = car['one_m_car'].iloc[0]
-        one_q_car = car['one_q_car'].iloc[0]
+        if dataset is not None:
+            car = panel[cid]
+        else:
+            car = pd.read_parquet(os.path.join(addr, f'{cid}.parquet'), columns = ['pricedate'] + CAR_COLUMNS)
+        car = car.sort_values('pricedate', kind = 'stable')
 
-        res.append([row['transcriptid'], one_d_car, one_w_car, one_m_car , one_q_car])
+        hour = group['ec_et'].dt.hour
+        for ec_et in group['ec_et'][~((hour < 12) | (hour >= 16))]:
+            print(f'no such market indicator type! {ec_et}')
 
-    df = pd.DataFrame(res, columns = ['transcriptid', 'one_d_car', 'one_w_car', 'one_m_car', 'one_q_car'])
+        pos = resolve_event_rows(car['pricedate'].to_numpy(), group['ec_et'])
+        found = pos >= 0
+        hits = pd.DataFrame(car[CAR_COLUMNS].to_numpy()[pos[found]], columns = CAR_COLUMNS)
+        hits.insert(0, 'transcriptid', group['transcriptid'].to_numpy()[found])
+        hits['order'] = group['order'].to_numpy()[found]
+        res.append(hits)
+
+    if res:
+        # back to the order of the universe
+        df = pd.concat(res).sort_values('order').drop(columns = ['order']).reset_index(drop = True)
+    else:
+        df = pd.DataFrame(columns = ['transcriptid'] + CAR_COLUMNS)
     print(df)
     os.makedirs('data/car_et_data', exist_ok=True)
     df.to_csv('data/car_et_data/car_et_total.csv')
@@ -64,5 +104,5 @@ def calc_et_car(universe):
 if __name__ == "__main__":
 
     universe = pd.read_csv('/home/ubuntu/ciqcoldcopy/data/et_ref/complete_info/us_et_ref.csv')
-    calc_et_car(universe=universe)
+    calc_et_car(universe=universe, dataset=DatasetHandler('data/car_data/v3/'))
     
\ No newline at end of file
@@ -3,110 +3,123 @@ import tqdm
 import pandas as pd 
 import warnings
 import sys
-from statsmodels.regression.rolling import RollingOLS
+import os
+import numpy as np
 
 ROOTPATH = '/Users/zhenggong/Documents/Github/ba_thesis/' # for importing and reference management 
 sys.path.append(ROOTPATH)
 
 from fhandler.fileHandler import FileHandler
+from fhandler.datasetHandler import DatasetHandler
 # internal
+from car.event_window import event_start_rows, forward_abnormal_returns
+from car.rolling_ols import rolling_beta
 from capitaliq.databaseManager import get_hist_miadj_pricing
 
 warnings.filterwarnings("ignore")
 
-def calc_et_car(universe):
+# forward windows in trading days, one output column _{h}d_fwd_ret each
+FWD_HORIZONS = [1, 2, 3, 4, 5, 10, 22]
+
+
+def event_betas(fwd_ret, event_day, window = 252):
+    """market beta of each event, looked up in the company's rolling beta series
+
+    The series is computed once per company (rolling_beta). An event gets the beta of the window ending
+    two rows before its day: stock_ret_close of a row is the return to the next close, so that window
+    stops at the close before the event day. 1 where there is no estimate (e.g. too little history).
+
+    Args:
+        fwd_ret (pd.DataFrame): one company's fwd_ret file, sorted by pricedate
+        event_day (np.ndarray): datetime64 day of each event
+        window (int, optional): 252 trading days
+
+    Returns:
+        np.ndarray: beta per event
+    """
+    beta = rolling_beta(fwd_ret['stock_ret_close'].to_numpy(dtype = float),
+                        fwd_ret['sp500_ret_close'].to_numpy(dtype = float), window)
+    pos = np.searchsorted(fwd_ret['pricedate'].to_numpy(), event_day, side = 'left') - 2
+    res = np.ones(len(pos))
+    res[pos >= 0] = beta[pos[pos >= 0]]
+    res[np.isnan(res)] = 1.
+    return res
+
+
+def calc_et_car(universe, horizons = FWD_HORIZONS, addr = 'data/fwd_ret_data/v1/', dataset = None):
+    """market-adjusted forward returns of every earnings call, written to data/fwd_et_data/fwd_et_total.csv
+
+    Calls before 9:00 or from 16:00 use open-to-open returns, starting on the call day or the next
+    trading day respectively; calls between 10:00 and 15:00 use close-to-close returns from the call day.
+    Events are grouped by company so each fwd_ret file is read once, and all horizons of all calls
+    of a company come out of one forward_abnormal_returns pass.
+
+    Args:
+        universe (pd.DataFrame): one row per call with companyid, transcriptid, ec_et, ec_et_day
+        horizons (list, optional): window lengths in trading days
+        addr (str, optional): folder of the {companyid}.parquet files written by calc_fwd_ret
+        dataset (DatasetHandler, optional): read all companies from this dataset in one scan instead of addr
+    """
+    events = universe[['companyid', 'transcriptid', 'ec_et', 'ec_et_day']].copy()
+    events['ec_et'] = pd.to_datetime(events['ec_et'])
+    if events['ec_et'].dt.tz is not None:
+        # keep the local wall clock, the timing rule is about local hours
+        events['ec_et'] = events['ec_et'].dt.tz_localize(None)
+    events['ec_et_day'] = pd.to_datetime(events['ec_et_day'])
+
+    # we do not want to calculate car for the 2023 earnings call
+    events = events[events['ec_et_day'].dt.year < 2023]
+
+    hour = events['ec_et'].dt.hour
+    on_open = (hour < 9) | (hour >= 16)
+    known = on_open | ((hour >= 10) & (hour < 15))
+    for ec_et in events.loc[~known, 'ec_et']:
+        print(f'no such market indicator type! {ec_et}')
+    events = events.assign(on_open = on_open, same_day = hour < 16)[known]
+    events['order'] = np.arange(len(events))
+
+    columns = [f'_{h}d_fwd_ret' for h in horizons]
+    companyids = events['companyid'].unique()
+    if dataset is not None:
+        # the whole panel of the universe in one scan, split per company below
+        panel = dict(tuple(dataset.read(companyids).groupby(dataset.key, sort = False)))
+        available = set(panel)
+    else:
+        # which fwd_ret files exist, from one manifest lookup of the folder
+        available = set(companyids[FileHandler.existing_files(addr, '.parquet', companyids)])
 
     res = []
-    for _, row in tqdm.tqdm(universe.iterrows()):
-        cid = row['companyid']
-        ec_et = pd.to_datetime(row['ec_et'])# .tz_localize(None)
-        ec_et_day = pd.to_datetime(row['ec_et_day'])
-        print(ec_et)
-        # print(ec_et_day.year)
-
-        # we do not want to calculate car for the 2023 earnings call
-        if ec_et_day.year >= 2023:
-            continue
-
-        car_data_addr = f'data/fwd_ret_data/v1/{cid}.parquet'
-        if FileHandler.check_file_existence(path='data/car_data/v1/', ext='.parquet', filename=cid):
-            fwd_ret = pd.read_parquet(car_data_addr)
-        else:
+    for cid, group in tqdm.tqdm(events.groupby('companyid', sort = False)):
+        if cid not in available:
             print(f'companyid {cid} does not exist!')
-            continue 
-
-        # print(fwd_ret)
-
-        # step 4: run linear regression
-        fwd_ret_hist = fwd_ret.query("pricedate < @ec_et_day")
-        fwd_ret_hist['intercept'] = 1
-        model = RollingOLS(endog =fwd_ret_hist['stock_ret_close'].values , exog=fwd_ret_hist[['sp500_ret_close' , 'intercept']],window=252)
-
-        try:
-            rres = model.fit()
-            beta = float(rres.params.iloc[-2])
-        except:
-            beta = 1
-        
-        if ec_et.hour < 9:
-            fwd_ret = fwd_ret.query('pricedate >= @ec_et_day')
-            fwd_ret['stock_ret_compound'] = (1 + fwd_ret['stock_ret_open'].astype(float)).cumprod()
-            fwd_ret['sp500_ret_compound'] = (1 + fwd_ret['sp500_ret_open'].astype(float)).cumprod()
-
-
-        elif ec_et.hour >= 16:
-            fwd_ret = fwd_ret.query('pricedate > @ec_et_day')
-            fwd_ret['stock_ret_compound'] = (1 + fwd_ret['stock_ret_open'].astype(float)).cumprod()
-            fwd_ret['sp500_ret_compound'] = (1 + fwd_ret['sp500_ret_open'].astype(float)).cumprod()
-
-        elif ec_et.hour >= 10 and ec_et.hour < 15:
-            fwd_ret = fwd_ret.query('pricedate >= @ec_et_day')
-            fwd_ret['stock_ret_compound'] = (1 + fwd_ret['stock_ret_close'].astype(float)).cumprod()
-            fwd_ret['sp500_ret_compound'] = (1 + fwd_ret['sp500_ret_close'].astype(float)).cumprod()
-
-        else:
-            print(f'no such market indicator type! {ec_et}')
             continue
-        
-        try:
-            _1d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[0] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[0] - 1) * beta)
-        except:
-            _1d_fwd_ret = None
-
-        try:
-            _2d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[1] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[1] - 1) * beta)
-        except:
-            _2d_fwd_ret = None
-
-        try:
-            _3d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[2] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[2] - 1) * beta)
-        except:
-            _3d_fwd_ret = None
-        
-        try:
-            _4d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[3] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[3] - 1) * beta)
-        except:
-            _4d_fwd_ret = None
-
-        try:
-            _5d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[4] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[4] - 1) * beta)
-        except:
-            _5d_fwd_ret = None
-
-        try:
-            _10d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[9] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[9] - 1) * beta)
-        except:
-            _10d_fwd_ret = None
-        
-        try:
-            _22d_fwd_ret = fwd_ret['stock_ret_compound'].iloc[21] - 1  - ((fwd_ret['sp500_ret_compound'].iloc[21] - 1) * beta)
-        except:
-            _22d_fwd_ret = None
-
-        res.append([row['transcriptid'], _1d_fwd_ret, _2d_fwd_ret, _3d_fwd_ret, _4d_fwd_ret, _5d_fwd_ret , _10d_fwd_ret, _22d_fwd_ret])
-
-    df = pd.DataFrame(res, columns = ['transcriptid', '_1d_fwd_ret', '_2d_fwd_ret', '_3d_fwd_ret', '_4d_fwd_ret', '_5d_fwd_ret', '_10d_fwd_ret', '_22d_fwd_ret'])
+        fwd_ret = panel[cid] if dataset is not None else pd.read_parquet(os.path.join(addr, f'{cid}.parquet'))
+        fwd_ret = fwd_ret.sort_values('pricedate', kind = 'stable')
+
+        beta = event_betas(fwd_ret, group['ec_et_day'].to_numpy())
+        start = event_start_rows(fwd_ret['pricedate'].to_numpy(), group['ec_et_day'].to_numpy(), group['same_day'].to_numpy())
+
+        out = np.full((len(group), len(horizons)), np.nan)
+        for use_open, (stock_col, mkt_col) in ((True, ('stock_ret_open', 'sp500_ret_open')),
+                                               (False, ('stock_ret_close', 'sp500_ret_close'))):
+            sel = group['on_open'].to_numpy() == use_open
+            if sel.any():
+                out[sel] = forward_abnormal_returns(fwd_ret[stock_col].to_numpy(dtype = float),
+                                                    fwd_ret[mkt_col].to_numpy(dtype = float),
+                                                    start[sel], horizons, beta[sel])
+
+        hits = pd.DataFrame(out, columns = columns)
+        hits.insert(0, 'transcriptid', group['transcriptid'].to_numpy())
+        hits['order'] = group['order'].to_numpy()
+        res.append(hits)
+
+    if res:
+        # back to the order of the universe
+        df = pd.concat(res).sort_values('order').drop(columns = ['order']).reset_index(drop = True)
+    else:
+        df = pd.DataFrame(columns = ['transcriptid'] + columns)
     print(df)
+    os.makedirs('data/fwd_et_data', exist_ok=True)
     df.to_csv('data/fwd_et_data/fwd_et_total.csv')
 
 
@@ -114,5 +127,5 @@ def calc_et_car(universe):
 if __name__ == "__main__":
 
     universe = pd.read_csv('data/processed/universeAugmented.csv', index_col = [0])
-    calc_et_car(universe=universe)
+    calc_et_car(universe=universe, dataset=DatasetHandler('data/fwd_ret_data/v2/'))
     
\ No newline at end of file
@@ -9,43 +9,34 @@ sys.path.append(ROOTPATH)
 # internal import
 from capitaliq.databaseManager import get_hist_miadj_pricing
 from gff.gff_function import famaFrench5Factor, momentumFactor
+from fhandler.fileHandler import FileHandler
+from fhandler.datasetHandler import DatasetHandler
+from car.benchmark import benchmark_series
 
 
 
-def calculate_fwd_ret(companyid = 32307, addr = 'data/car_data/v1/', start_date = '2018-01-01', end_date = '2023-06-01', rolling_window = 252):
-    # calculate CAR cumulative abnormal return
-    #   FOR ONE STOCK
-
-    # step 0: paramter declarations & data preparation
-
-    # load in ref_table
-
-    companyid = companyid # nvidia 32307 # please read from ref_table
-
-    start_date, end_date = start_date, end_date
+def prepare_fwd_ret(price, rolling_window = 252):
+    """next-day open and close returns of one stock and of the SPY benchmark
 
-    # rolling_window = 252 # 252 trading days a year 
-    addr = addr
-
-    # step 1: pull out daily return of one individual stock
-    price = get_hist_miadj_pricing(start_date, end_date, [companyid, ])
+    Args:
+        price (pd.DataFrame): as returned by get_hist_miadj_pricing
+        rolling_window (int, optional): minimum history, 252 trading days a year
 
+    Returns:
+        pd.DataFrame: None if the price history is too short
+    """
     if len(price) <= rolling_window:
-        return 1 # price history too short 
+        return None # price history too short 
 
     price['divadjopen'] = price['priceopen'] * price['divadjfactor']
-    price['divadjclose'] = price['divadjclose'].astype(float)
     price['pricedate'] = pd.to_datetime(price['pricedate'])
     price = price[['divadjopen', 'divadjclose', 'pricedate']]
     # print(price)
 
-    # step 2: pull out market data
-    sp_500 = pd.read_csv('data/index/SPY.csv')
-    sp_500['discount_factor'] = sp_500['Adj Close']/sp_500['Close']
-    sp_500['sp500_adjclose'] = sp_500['Close'] * sp_500['discount_factor']
-    sp_500['sp500_adjopen'] = sp_500['Open'] * sp_500['discount_factor']
-    sp_500.rename(columns={'Date':'pricedate'}, inplace = True)
-    sp_500['pricedate'] = pd.to_datetime(sp_500['pricedate'])
+    # step 2: pull out market data, loaded once per process
+    #   days the index file misses are dropped, the merge below only keeps days with both prices
+    sp_500 = benchmark_series('SPY').dropna().reset_index()
+    sp_500 = sp_500.rename(columns = {'adjclose':'sp500_adjclose', 'adjopen':'sp500_adjopen'})
     # print(sp_500)
 
     # attach factors on price_df
@@ -57,9 +48,37 @@ def calculate_fwd_ret(companyid = 32307, addr = 'data/car_data/v1/', start_date
     price['sp500_ret_open'] = price['sp500_adjopen'].pct_change().shift(-1)
     price['sp500_ret_close'] = price['sp500_adjclose'].pct_change().shift(-1)
     # print(price)
-    # assert False
+    return price
+
+
+def calculate_fwd_ret(companyid = 32307, addr = 'data/car_data/v1/', start_date = '2018-01-01', end_date = '2023-06-01', rolling_window = 252, price = None, dataset = None):
+    # calculate CAR cumulative abnormal return
+    #   FOR ONE STOCK
+
+    # step 0: paramter declarations & data preparation
+
+    # load in ref_table
+
+    companyid = companyid # nvidia 32307 # please read from ref_table
+
+    start_date, end_date = start_date, end_date
 
-    price.to_parquet(addr + f'{companyid}.parquet')
+    # rolling_window = 252 # 252 trading days a year 
+    addr = addr
+
+    # step 1: pull out daily return of one individual stock
+    #   price can be handed in from a batched fetch (get_hist_miadj_pricing_by_company)
+    if price is None:
+        price = get_hist_miadj_pricing(start_date, end_date, [companyid, ])
+
+    price = prepare_fwd_ret(price, rolling_window)
+    if price is None:
+        return 1 # price history too short 
+
+    if dataset is not None:
+        dataset.append({companyid: price})
+    else:
+        FileHandler.save_with_dir_create(addr, 'parquet', companyid, price, checksum = True)
 
     return 0
 
@@ -82,11 +101,14 @@ if __name__ == "__main__":
     universe = pd.read_csv('data/processed/et_ref_COMPLETE_Big500_2012_2022.csv', index_col = [0])
 
     # print(ref)
-    for companyid in tqdm.tqdm(universe['companyid'].unique()):
-        # print(companyid)
-        if not os.path.exists(f'data/fwd_ret_data/v1/{companyid}.parquet'):
-            calculate_fwd_ret(companyid, addr='data/fwd_ret_data/v1/', start_date='2010-01-01', end_date='2023-06-01')
-            print(f'{companyid} is done!')
-
-
-    
\ No newline at end of file
+    #   companies are spread over a process pool (workers from argv, default all cores)
+    from car.parallel import run_parallel, build_fwd_ret_shard
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    companyids = universe['companyid'].unique()
+    #   every shard is appended to one partitioned dataset instead of one file per company
+    fwd_ret_dataset = DatasetHandler('data/fwd_ret_data/v2/')
+    todo = list(set(companyids) - set(fwd_ret_dataset.keys()))
+    report = run_parallel(build_fwd_ret_shard, todo, workers = workers, dataset = fwd_ret_dataset, start_date = '2010-01-01', end_date = '2023-06-01')
+    print(report)
+    #   the many small shard files into one large file per bucket
+    fwd_ret_dataset.compact()
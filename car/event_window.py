@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def event_start_rows(pricedate, event_day, same_day):
+    """row of the first trading day in the window of each event, all events of one stock at once
+
+    Args:
+        pricedate (np.ndarray): sorted datetime64 trading days of the stock
+        event_day (np.ndarray): datetime64 day of each event
+        same_day (np.ndarray): bool per event, True: the window starts at the first pricedate >= event_day,
+                               False: at the first pricedate > event_day (e.g. calls after the close)
+
+    Returns:
+        np.ndarray: int row position per event, -1 when the event lies after the last pricedate
+    """
+    same_day = np.asarray(same_day, dtype = bool)
+    pos = np.where(same_day,
+                   np.searchsorted(pricedate, event_day, side = 'left'),
+                   np.searchsorted(pricedate, event_day, side = 'right'))
+    pos[pos >= len(pricedate)] = -1
+    return pos
+
+
+def _log_growth(ret):
+    # cumulative log growth with a leading 0, so a window [a, b] is g[b + 1] - g[a];
+    # a missing day contributes nothing, as in pandas cumprod which skips NaN
+    return np.concatenate([[0.], np.cumsum(np.log1p(np.nan_to_num(ret, nan = 0.)))])
+
+
+def forward_abnormal_returns(ret, mkt_ret, start, horizons, beta = 1.):
+    """market-adjusted forward return of many events over several horizons in one vectorized pass
+
+    For an event whose window starts at row s, the h-day value is
+        prod(1 + ret[s:s+h]) - 1 - beta * (prod(1 + mkt_ret[s:s+h]) - 1)
+
+    Args:
+        ret (np.ndarray): daily decimal returns of the stock, aligned with mkt_ret, NaN where missing
+        mkt_ret (np.ndarray): daily decimal returns of the market (e.g. SPY)
+        start (np.ndarray): int row of the first day in each event's window, -1 for no window (see event_start_rows)
+        horizons (list): window lengths in trading days e.g. [1, 2, 3, 4, 5, 10, 22]
+        beta (float or np.ndarray, optional): market beta, scalar or one per event
+
+    Returns:
+        np.ndarray: events x horizons, NaN where the window is incomplete or its last day has no return
+    """
+    ret = np.asarray(ret, dtype = float)
+    mkt_ret = np.asarray(mkt_ret, dtype = float)
+    start = np.asarray(start, dtype = int)
+    horizons = np.asarray(horizons, dtype = int)
+    beta = np.broadcast_to(np.asarray(beta, dtype = float), start.shape)
+    if len(ret) == 0:
+        return np.full((len(start), len(horizons)), np.nan)
+
+    first = np.broadcast_to(start[:, None], (len(start), len(horizons)))
+    last = first + horizons[None, :] - 1
+    valid = (first >= 0) & (last < len(ret))
+    first = np.where(valid, first, 0)
+    last = np.where(valid, last, 0)
+    valid &= ~np.isnan(ret[last]) & ~np.isnan(mkt_ret[last])
+
+    g_stock = _log_growth(ret)
+    g_mkt = _log_growth(mkt_ret)
+    stock = np.expm1(g_stock[last + 1] - g_stock[first])
+    mkt = np.expm1(g_mkt[last + 1] - g_mkt[first])
+
+    out = stock - beta[:, None] * mkt
+    out[~valid] = np.nan
+    return out
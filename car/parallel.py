@@ -0,0 +1,139 @@
+import os
+import time
+import multiprocessing as mp
+import pandas as pd
+import tqdm
+
+# internal import
+from capitaliq import databaseManager
+from capitaliq.databaseManager import get_hist_miadj_pricing_by_company
+from gff.gff_function import shareDailyFactors, attachDailyFactors
+from car.benchmark import benchmark_series, set_benchmark_series
+from car.calc_car import calculate_car_batch
+from car.calc_fwd_ret import calculate_fwd_ret, prepare_fwd_ret
+
+
+def build_car_shard(companyids, addr = 'data/car_data/v2/', start_date = '2000-01-01', end_date = '2030-06-01', chunksize = 200, dataset = None):
+    """price fetch + batched car regressions for one shard of companies, runs inside a worker
+
+    Returns:
+        dict: companyid -> 0 written, 1 price history too short
+    """
+    prices = dict(get_hist_miadj_pricing_by_company(start_date, end_date, companyids, chunksize = chunksize))
+    return calculate_car_batch(prices, addr = addr, dataset = dataset)
+
+
+def build_fwd_ret_shard(companyids, addr = 'data/fwd_ret_data/v1/', start_date = '2010-01-01', end_date = '2023-06-01', chunksize = 200, dataset = None):
+    """price fetch + forward returns for one shard of companies, runs inside a worker
+
+    With a dataset the whole shard is appended in one write, otherwise one file per company under addr.
+
+    Returns:
+        dict: companyid -> 0 written, 1 price history too short
+    """
+    status = {}
+    frames = {}
+    for companyid, price in get_hist_miadj_pricing_by_company(start_date, end_date, companyids, chunksize = chunksize):
+        if dataset is not None:
+            frames[companyid] = prepare_fwd_ret(price)
+            status[companyid] = 1 if frames[companyid] is None else 0
+        else:
+            status[companyid] = calculate_fwd_ret(companyid, addr = addr, start_date = start_date, end_date = end_date, price = price)
+    if frames:
+        dataset.append(frames)
+    # companies without any price row never come out of the fetch
+    for companyid in companyids:
+        status.setdefault(companyid, 1)
+    return status
+
+
+def _init_worker(handle, benchmarks):
+    if handle is not None:
+        attachDailyFactors(handle)
+    set_benchmark_series(benchmarks)
+
+
+def _run_shard(args):
+    build, shard, kwargs = args
+    start = time.perf_counter()
+    try:
+        status = build(shard, **kwargs)
+        error = None
+    except Exception as e:
+        status = {}
+        error = f'{type(e).__name__}: {e}'
+    return {
+        'pid': os.getpid(),
+        'companies': len(shard),
+        'written': sum(1 for s in status.values() if s == 0),
+        'seconds': time.perf_counter() - start,
+        'status': status,
+        'error': error,
+        'shard': shard,
+    }
+
+
+def run_parallel(build, companyids, workers = None, shard_size = 50, **kwargs):
+    """shard the companies over a process pool and run one of the build_*_shard functions on every shard
+
+    Each worker process holds its own database connection and gets the daily factors through
+    shared memory (shareDailyFactors) and the benchmark series from the parent instead of
+    parsing them again. Outputs are written atomically, per company (FileHandler.save_with_dir_create)
+    or per shard (DatasetHandler.append), so an interrupted run can simply be restarted on the
+    companies not written yet. Shards are small and handed out on demand so slow companies
+    do not leave the other workers idle.
+
+    e.g.
+        run_parallel(build_car_shard, todo, workers = 8, dataset = DatasetHandler('data/car_data/v3/'))
+
+    Args:
+        build (callable): build_car_shard or build_fwd_ret_shard
+        companyids (list): list of companyid   [24937, 32307]
+        workers (int, optional): processes, defaults to os.cpu_count(); 1 runs in this process
+        shard_size (int, optional): companies per task
+        **kwargs: passed on to build (addr or dataset, start_date, end_date, chunksize)
+
+    Returns:
+        pd.DataFrame: one row per worker pid: shards, companies, written, failed_shards, seconds, companies_per_sec
+    """
+    workers = workers or os.cpu_count()
+    companyids = list(companyids)
+    if not companyids:
+        return pd.DataFrame(columns = ['shards', 'companies', 'written', 'failed_shards', 'seconds', 'companies_per_sec'])
+    tasks = [(build, companyids[i:i + shard_size], kwargs) for i in range(0, len(companyids), shard_size)]
+
+    results = []
+    if workers == 1:
+        for task in tqdm.tqdm(tasks):
+            results.append(_run_shard(task))
+    else:
+        # no parent connection may be open across the fork, every worker then opens its own
+        # through the module level pool (which also refuses to reuse sockets inherited by a fork)
+        databaseManager.close_pool()
+        # the factors are parsed once here and attached by every worker from shared memory,
+        # the benchmark series is loaded once here and handed to every worker at start
+        shm, handle = shareDailyFactors() if build is build_car_shard else (None, None)
+        benchmarks = {'SPY': benchmark_series('SPY')} if build is build_fwd_ret_shard else {}
+        try:
+            with mp.Pool(workers, initializer = _init_worker, initargs = (handle, benchmarks)) as pool:
+                for res in tqdm.tqdm(pool.imap_unordered(_run_shard, tasks), total = len(tasks)):
+                    results.append(res)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    for res in results:
+        if res['error'] is not None:
+            print(f"shard of {res['companies']} companies failed in worker {res['pid']}: {res['error']} (first companyid {res['shard'][0]})")
+
+    report = pd.DataFrame(results)
+    report['failed_shards'] = report['error'].notna()
+    report = report.groupby('pid').agg(
+        shards = ('companies', 'size'),
+        companies = ('companies', 'sum'),
+        written = ('written', 'sum'),
+        failed_shards = ('failed_shards', 'sum'),
+        seconds = ('seconds', 'sum'))
+    report['companies_per_sec'] = report['companies'] / report['seconds']
+    return report
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+def _window_sum(cum, window):
+    # rolling sum over axis 0 from a cumulative sum: s[t] = c[t] - c[t - window]
+    out = cum.copy()
+    out[window:] -= cum[:-window]
+    return out
+
+
+def batched_rolling_ols(y, x, lengths, window, min_nobs = None, batch = 64):
+    """Rolling OLS of many stocks, each on its own rows, solved in a single numpy pass per batch of stocks
+
+    Same estimates as statsmodels RollingOLS(y_j, x_j, window, missing='drop') on every stock j:
+    the window ending at a row is the last `window` rows of that stock's own frame (never rows of
+    another stock or days outside its frame), rows with a missing y or x inside a window are dropped,
+    the first window - 1 rows of a stock and windows with fewer than min_nobs observations give NaN.
+
+    The stocks are stacked one after the other, so the rolling X'X and X'y of all of them come
+    out of one cumulative sum over the stacked rows.
+
+    Args:
+        y (np.ndarray): T endog of all stocks stacked, NaN where the stock has no observation
+        x (np.ndarray): T x K exog stacked the same way (e.g. the factors on each stock's dates)
+        lengths (list): rows of every stock, in stacking order, summing to T
+        window (int): e.g. 252
+        min_nobs (int, optional): defaults to K
+        batch (int, optional): stocks processed together, bounds the rows x K x K arrays in memory
+
+    Returns:
+        np.ndarray: T x K params, NaN where no estimate is available
+    """
+    y = np.asarray(y, dtype = float)
+    x = np.asarray(x, dtype = float)
+    lengths = np.asarray(lengths, dtype = int)
+    K = x.shape[1]
+    if min_nobs is None:
+        min_nobs = K
+
+    params = np.full((len(y), K), np.nan)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    for first in range(0, len(lengths), batch):
+        last = min(first + batch, len(lengths))
+        rows = slice(offsets[first], offsets[last])
+        yb, xb = y[rows], x[rows]
+        # position of every row inside its own stock
+        local = np.arange(len(yb)) - np.repeat(offsets[first:last] - offsets[first], lengths[first:last])
+
+        ok = ~(np.isnan(yb) | np.isnan(xb).any(axis = 1))
+        yb = np.where(ok, yb, 0.)
+        xb = np.where(ok[:, None], xb, 0.)
+        # a window never reaches back into the previous stock: it only counts from local position window - 1
+        xtx = _window_sum(np.cumsum(np.einsum('tk,tl->tkl', xb, xb), axis = 0), window)
+        xty = _window_sum(np.cumsum(xb * yb[:, None], axis = 0), window)
+        nobs = _window_sum(np.cumsum(ok), window)
+
+        est = np.nonzero((local >= window - 1) & (nobs >= min_nobs))[0]
+        if len(est):
+            params[offsets[first] + est] = np.einsum('wkl,wl->wk', np.linalg.pinv(xtx[est]), xty[est])
+    return params
+
+
+def rolling_beta(y, x, window, min_nobs = 2):
+    """Rolling slope of y on x (with intercept) for every window of a series, from running sums
+
+    Same slope as statsmodels RollingOLS(y, [x, 1], window, missing='drop'): rows where y or x is
+    missing are left out of their windows, the first window - 1 rows and windows with fewer than
+    min_nobs observations give NaN. O(T) for the whole series instead of one fit per window.
+
+    Args:
+        y (np.ndarray): T endog e.g. stock returns
+        x (np.ndarray): T exog e.g. market returns
+        window (int): e.g. 252
+        min_nobs (int, optional): defaults to the 2 parameters
+
+    Returns:
+        np.ndarray: T slopes, the estimate of the window ending at each row
+    """
+    y = np.asarray(y, dtype = float)
+    x = np.asarray(x, dtype = float)
+    beta = np.full(len(y), np.nan)
+    if len(y) < window:
+        return beta
+
+    ok = ~(np.isnan(y) | np.isnan(x))
+    y = np.where(ok, y, 0.)
+    x = np.where(ok, x, 0.)
+    n = _window_sum(np.cumsum(ok), window)
+    sx = _window_sum(np.cumsum(x), window)
+    sy = _window_sum(np.cumsum(y), window)
+    sxx = _window_sum(np.cumsum(x * x), window)
+    sxy = _window_sum(np.cumsum(x * y), window)
+
+    var = n * sxx - sx * sx
+    cov = n * sxy - sx * sy
+    est = (window - 1 <= np.arange(len(y))) & (n >= min_nobs) & (var > 0)
+    beta[est] = cov[est] / var[est]
+    return beta
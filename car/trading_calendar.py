@@ -0,0 +1,180 @@
+import os
+import numpy as np
+import pandas as pd
+
+# compact binary calendar written by runnables/get_tradingcalendar.py, the csv is the fallback source
+TRADINGCALENDAR_PATH = 'data/tradingcalendar/tradingcalendar.npz'
+TRADINGCALENDAR_CSV_PATH = 'data/tradingcalendar/tradingcalendar.csv'
+
+# process wide cache of get_trading_calendar()
+_CALENDAR = None
+
+
+def _to_days(dates):
+    # any date-like scalar or array -> int64 days since epoch, NaT as the int64 minimum
+    dates = pd.to_datetime(pd.Series(np.atleast_1d(dates)))
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy(dtype = 'datetime64[ns]').astype('datetime64[D]').astype('int64')
+
+
+class TradingCalendar():
+    """NYSE trading days as an int day-index, every lookup vectorized over arrays of dates
+
+    A dense table over all calendar days between the first and last trading day maps a date to
+    its trading-day index in O(1), so offsets, windows and session lookups are plain array arithmetic.
+
+    e.g.
+        cal = get_trading_calendar()
+        cal.offset(['2020-03-06', '2020-03-07'], 1)   # next trading day: 2020-03-09 for both
+
+    Args:
+        days (np.ndarray): sorted trading days, datetime64
+        market_open (np.ndarray): session open per trading day, datetime64 UTC
+        market_close (np.ndarray): session close per trading day, datetime64 UTC
+    """
+
+    def __init__(self, days, market_open, market_close):
+        self.days = np.asarray(days, dtype = 'datetime64[D]')
+        self.market_open = np.asarray(market_open, dtype = 'datetime64[ns]')
+        self.market_close = np.asarray(market_close, dtype = 'datetime64[ns]')
+
+        day_numbers = self.days.astype('int64')
+        self._first = day_numbers[0]
+        # for every calendar day in range: index of the first trading day on or after it
+        self._next = np.searchsorted(day_numbers, np.arange(day_numbers[0], day_numbers[-1] + 1), side = 'left')
+        self._is_trading = np.zeros(len(self._next), dtype = bool)
+        self._is_trading[day_numbers - self._first] = True
+
+    @classmethod
+    def from_csv(cls, path = TRADINGCALENDAR_CSV_PATH):
+        """build from the csv schedule (tradingday, market_open, market_close) of get_tradingcalendar.py"""
+        df = pd.read_csv(path)
+        return cls(pd.to_datetime(df['tradingday']).to_numpy(),
+                   pd.to_datetime(df['market_open'], utc = True).dt.tz_localize(None).to_numpy(),
+                   pd.to_datetime(df['market_close'], utc = True).dt.tz_localize(None).to_numpy())
+
+    @classmethod
+    def load(cls, path = TRADINGCALENDAR_PATH):
+        with np.load(path) as z:
+            return cls(z['days'], z['market_open'], z['market_close'])
+
+    def save(self, path = TRADINGCALENDAR_PATH):
+        # np.savez wants the .npz suffix, the temp file keeps it
+        tmp = path[:-len('.npz')] + f'.{os.getpid()}.tmp.npz'
+        np.savez(tmp, days = self.days, market_open = self.market_open, market_close = self.market_close)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.days)
+
+    def day_index(self, dates, roll = 'forward'):
+        """trading-day index of each date
+
+        Args:
+            dates: date-like scalar or array
+            roll (str, optional): a non-trading day maps to the next trading day ('forward'),
+                                  the previous one ('backward'), or to -1 (None)
+
+        Returns:
+            np.ndarray: int index into self.days, -1 outside the calendar
+        """
+        days = _to_days(dates)
+        offset = np.where(days == np.iinfo(np.int64).min, -1, days - self._first) # NaT is outside
+        inside = (offset >= 0) & (offset < len(self._next))
+        pos = np.full(len(offset), -1)
+        k = offset[inside]
+        idx = self._next[k]
+        if roll == 'backward':
+            idx = np.where(self._is_trading[k], idx, idx - 1)
+        elif roll is None:
+            idx = np.where(self._is_trading[k], idx, -1)
+        pos[inside] = idx
+        return pos
+
+    def is_trading_day(self, dates):
+        return self.day_index(dates, roll = None) >= 0
+
+    def _days_at(self, pos):
+        out = np.full(len(pos), np.datetime64('NaT'), dtype = 'datetime64[ns]')
+        ok = (pos >= 0) & (pos < len(self.days))
+        out[ok] = self.days[pos[ok]]
+        return out
+
+    def offset(self, dates, n, roll = 'forward'):
+        """the trading day n trading days after each date (before for n < 0), NaT outside the calendar
+
+        Args:
+            dates: date-like scalar or array
+            n (int or np.ndarray): trading days, scalar or one per date
+            roll (str, optional): how a non-trading date is anchored, see day_index
+
+        Returns:
+            np.ndarray: datetime64[ns]
+        """
+        pos = self.day_index(dates, roll)
+        return self._days_at(np.where(pos >= 0, pos + n, -1))
+
+    def window(self, dates, before, after, roll = 'forward'):
+        """first and last trading day of the window from `before` trading days before each date to `after` days after it
+
+        Returns:
+            tuple: (start, end) datetime64[ns] arrays, NaT where the window leaves the calendar
+        """
+        pos = self.day_index(dates, roll)
+        ok = (pos >= 0) & (pos - before >= 0) & (pos + after < len(self.days))
+        return self._days_at(np.where(ok, pos - before, -1)), self._days_at(np.where(ok, pos + after, -1))
+
+    def count(self, start, end):
+        """number of trading days in [start, end] (both inside the calendar), vectorized over arrays of equal length"""
+        return np.maximum(self.day_index(end, roll = 'backward') - self.day_index(start, roll = 'forward') + 1, 0)
+
+    def session(self, dates):
+        """(market_open, market_close) in UTC of each date, NaT on non-trading days"""
+        pos = self.day_index(dates, roll = None)
+        market_open = np.full(len(pos), np.datetime64('NaT'), dtype = 'datetime64[ns]')
+        market_close = market_open.copy()
+        market_open[pos >= 0] = self.market_open[pos[pos >= 0]]
+        market_close[pos >= 0] = self.market_close[pos[pos >= 0]]
+        return market_open, market_close
+
+    def between(self, start = None, end = None):
+        """trading days in [start, end] as datetime64[ns]"""
+        day_numbers = self.days.astype('int64')
+        lo = 0 if start is None else np.searchsorted(day_numbers, _to_days(start)[0], side = 'left')
+        hi = len(self.days) if end is None else np.searchsorted(day_numbers, _to_days(end)[0], side = 'right')
+        return self.days[lo:hi].astype('datetime64[ns]')
+
+    def frame(self, start = None, end = None):
+        """trading days in [start, end] with their session, the layout of the csv schedule
+
+        Returns:
+            pd.DataFrame: tradingday, market_open, market_close (UTC)
+        """
+        tradingday = self.between(start, end)
+        market_open, market_close = self.session(tradingday)
+        return pd.DataFrame({
+            'tradingday': tradingday,
+            'market_open': pd.to_datetime(market_open).tz_localize('UTC'),
+            'market_close': pd.to_datetime(market_close).tz_localize('UTC'),
+        })
+
+
+def get_trading_calendar(path = TRADINGCALENDAR_PATH):
+    """the trading calendar, loaded once per process
+
+    Reads the compact binary file; if only the csv schedule exists it is converted once.
+
+    Raises:
+        FileNotFoundError: neither file exists, run runnables/get_tradingcalendar.py
+    """
+    global _CALENDAR
+    if _CALENDAR is None:
+        if os.path.exists(path):
+            _CALENDAR = TradingCalendar.load(path)
+        elif os.path.exists(TRADINGCALENDAR_CSV_PATH):
+            _CALENDAR = TradingCalendar.from_csv(TRADINGCALENDAR_CSV_PATH)
+            _CALENDAR.save(path)
+        else:
+            raise FileNotFoundError(f'no trading calendar at {path}, run runnables/get_tradingcalendar.py')
+    return _CALENDAR
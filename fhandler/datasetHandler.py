@@ -0,0 +1,146 @@
+import os
+import os.path as osp
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+class DatasetHandler():
+    """One hive-partitioned parquet dataset in place of one file per company
+
+    Per-company frames are appended with a bucket column (companyid % buckets) as the partition,
+    so a company always lives in one bucket directory and read() of one company only opens that
+    bucket, while the whole panel is one scan over all of them. Appends write small files;
+    compact() rewrites every bucket into one file with large row groups.
+
+    Appending a company again supersedes its earlier rows: read() and compact() keep, per company,
+    only the rows of the newest file it appears in. Do not compact while other processes append.
+
+    e.g.
+        car_ds = DatasetHandler('data/car_data/v3/')
+        car_ds.append({32307: car})
+        car = car_ds.read(32307)
+
+    Args:
+        path (str): root of the dataset e.g. 'data/car_data/v3/'
+        key (str, optional): column identifying a company
+        buckets (int, optional): number of partitions
+    """
+    ROW_GROUP_SIZE = 1_000_000
+
+    def __init__(self, path, key = 'companyid', buckets = 64):
+        self.path = path
+        self.key = key
+        self.buckets = buckets
+
+    def exists(self) -> bool:
+        return osp.isdir(self.path) and any(f.endswith('.parquet') for _, _, files in os.walk(self.path) for f in files)
+
+    def _dataset(self):
+        return ds.dataset(self.path, format = 'parquet', partitioning = 'hive')
+
+    def append(self, frames) -> int:
+        """append per-company frames in one write
+
+        Args:
+            frames (dict or pd.DataFrame): companyid -> frame, or one frame that already has the key column
+
+        Returns:
+            int: number of rows written
+        """
+        if isinstance(frames, dict):
+            frames = [frame.assign(**{self.key: key}) for key, frame in frames.items() if frame is not None and len(frame)]
+            if not frames:
+                return 0
+            df = pd.concat(frames, ignore_index = True)
+        else:
+            df = frames.reset_index(drop = True)
+        if len(df) == 0:
+            return 0
+        df['bucket'] = (df[self.key].astype('int64') % self.buckets).astype('int32')
+        df = df.sort_values(self.key, kind = 'stable')
+
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index = False), self.path, format = 'parquet',
+            partitioning = ds.partitioning(pa.schema([('bucket', pa.int32())]), flavor = 'hive'),
+            # time first so names sort by age, pid keeps concurrent workers apart
+            basename_template = f'part-{time.time_ns()}-{os.getpid()}-{{i}}.parquet',
+            existing_data_behavior = 'overwrite_or_ignore')
+        return len(df)
+
+    def _latest(self, table):
+        # per company, only the rows of the newest file it appears in
+        df = table.to_pandas()
+        newest = df.groupby(self.key)['_file'].transform('max')
+        return df[df['_file'] == newest].drop(columns = ['_file'])
+
+    def read(self, keys = None, columns = None, filter = None) -> pd.DataFrame:
+        """one company, several, or the whole panel in one scan
+
+        Args:
+            keys (int or list, optional): companyid(s), None for all
+            columns (list, optional): None for all
+            filter (ds.Expression, optional): extra predicate e.g. ds.field('pricedate') >= pd.Timestamp('2020-01-01')
+
+        Returns:
+            pd.DataFrame: sorted by key, in the row order each company was written
+        """
+        # buckets prune the fragments (the bucket is in their path, not in the files),
+        # the key and the extra predicate filter the rows inside each file
+        buckets = None
+        flt = filter
+        if keys is not None:
+            keys = [int(key) for key in np.atleast_1d(keys)]
+            buckets = ds.field('bucket').isin(sorted({key % self.buckets for key in keys}))
+            by_key = ds.field(self.key).isin(keys)
+            flt = by_key if flt is None else flt & by_key
+        if columns is not None:
+            columns = list(dict.fromkeys([self.key] + list(columns)))
+
+        if not self.exists():
+            return pd.DataFrame(columns = columns or [self.key])
+        tables = []
+        for fragment in self._dataset().get_fragments(filter = buckets):
+            table = fragment.to_table(columns = columns, filter = flt)
+            tables.append(table.append_column('_file', pa.array([osp.basename(fragment.path)] * len(table), pa.string())))
+        if not tables:
+            return pd.DataFrame(columns = columns or [self.key])
+        df = self._latest(pa.concat_tables(tables, promote_options = 'default'))
+        if columns is None:
+            df = df.drop(columns = ['bucket'], errors = 'ignore')
+        return df.sort_values(self.key, kind = 'stable').reset_index(drop = True)
+
+    def keys(self) -> list:
+        """every companyid in the dataset"""
+        if not self.exists():
+            return []
+        return sorted(pd.unique(self._dataset().to_table(columns = [self.key]).column(self.key).to_pandas()))
+
+    def compact(self):
+        """rewrite every bucket into one file with large row groups, dropping superseded rows"""
+        if not osp.isdir(self.path):
+            return
+        for bucket_dir in sorted(os.listdir(self.path)):
+            part = osp.join(self.path, bucket_dir)
+            if not osp.isdir(part):
+                continue
+            files = sorted(f for f in os.listdir(part) if f.endswith('.parquet'))
+            if len(files) <= 1:
+                continue
+            tables = []
+            for f in files:
+                table = pq.read_table(osp.join(part, f))
+                tables.append(table.append_column('_file', pa.array([f] * len(table), pa.string())))
+            df = self._latest(pa.concat_tables(tables, promote_options = 'default'))
+            df = df.drop(columns = ['bucket'], errors = 'ignore').sort_values(self.key, kind = 'stable')
+
+            # dot prefix keeps a half written file invisible to dataset discovery
+            tmp = osp.join(part, f'.compact-{time.time_ns()}.tmp')
+            pq.write_table(pa.Table.from_pandas(df, preserve_index = False), tmp, row_group_size = self.ROW_GROUP_SIZE)
+            # the compacted file sorts after the files it replaces
+            os.replace(tmp, osp.join(part, f'part-{time.time_ns()}-{os.getpid()}-0.parquet'))
+            for f in files:
+                os.remove(osp.join(part, f))
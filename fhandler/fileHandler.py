@@ -1,52 +1,362 @@
 import os 
 import os.path as osp
+import json
+import fcntl
+import hashlib
+import time
+import statistics
+import numpy as np
 import pandas as pd 
+import pyarrow.feather as feather
 
 class FileHandler():
     @staticmethod
-    def save_with_dir_create(path: str, ext: str, filename: str, file: any) -> bool:
+    def save_with_dir_create(path: str, ext: str, filename: str, file: any, fsync: bool = False, lock: bool = False, checksum: bool = False,
+                             compression: str = None, level: int = None, downcast: bool = False, categorical: bool = False) -> bool:
         """_summary_
 
+        Every format is written to a temp file in the same folder and renamed over the final
+        path, so a killed or crashed writer never leaves a truncated file behind.
+
         Args:
             path (str): _description_
             ext (str): _description_
             filename (str): _description_
             file (any): _description_
+            fsync (bool, optional): flush the file and the folder to disk before returning
+            lock (bool, optional): hold a per-file lock (.{name}.lock) while writing, for concurrent writers of the same file
+            checksum (bool, optional): write a .{name}.sha256 sidecar (size + sha256), see verify_file
+            compression (str, optional): codec, see CODECS; None keeps the format default
+                (csv plain, parquet snappy, feather uncompressed). A compressed csv is written as
+                {filename}.csv.zst / .csv.gz (see CSV_SUFFIXES) so every pd.read_csv infers the codec,
+                ext 'csv.zst' / 'csv.gz' finds it again. A compressed feather file can no longer be
+                served zero-copy from the memory map
+            level (int, optional): codec level, None for the codec default
+            downcast (bool, optional): smallest lossless integer / float dtypes, see compact_dtypes.
+                The dtypes follow the values of this one file, leave it off for families of files
+                that are read together (e.g. one file per company)
+            categorical (bool, optional): repeated strings as categoricals, see compact_dtypes
 
         Raises:
             TypeError: _description_
+            ValueError: codec not supported by the format
 
         Returns:
             bool: Succeed True, failed False
         """
         os.makedirs(path, exist_ok=True)
+
+        suffix = FileHandler._suffix(ext)
+        codecs = FileHandler.CODECS.get(suffix.split('.')[0] if suffix else None, ())
+        if compression is not None and compression not in codecs:
+            raise ValueError(f'{suffix} files cannot be written with {compression}, one of {codecs}')
+        if (downcast or categorical) and isinstance(file, pd.DataFrame):
+            file = FileHandler.compact_dtypes(file, downcast = downcast, categorical = categorical)
         
         if ext.__contains__("txt"): # this way, more rebust and tolerant on "ext" var
-            with open(osp.join(path, f'{filename}.txt'), 'w') as f:
-                if type(file) is str:
+            if type(file) is not str:
+                raise TypeError('The file to save must be a str!')
+            def write(tmp):
+                with open(tmp, 'w') as f:
                     f.write(file)
-                    return True
-                else:
-                    raise TypeError('The file to save must be a str!')
-                
-        if ext.__contains__("csv"): # this way, more rebust and tolerant on "ext" var
-            file.to_csv(osp.join(path, f'{filename}.csv'))
-            return True
-
-        if ext.__contains__("parquet"): # this way, more rebust and tolerant on "ext" var
-            file.to_parquet(osp.join(path, f'{filename}.parquet'))
-            return True
- 
-        return False
-
-    @staticmethod
-    def check_file_existence(path: str, ext: str, filename: str) -> bool:
+            suffix = 'txt'
+
+        elif ext.__contains__("csv"): # this way, more rebust and tolerant on "ext" var
+            # a compressed csv carries the codec in its name, ext 'csv.zst' alone also compresses
+            codec = compression or {v: k for k, v in FileHandler.CSV_SUFFIXES.items()}.get(suffix)
+            method = None if codec is None else dict({'method': codec}, **({} if level is None else {'compresslevel' if codec == 'gzip' else 'level': level}))
+            write = lambda tmp: file.to_csv(tmp, compression = method)
+            suffix = 'csv' if codec is None else FileHandler.CSV_SUFFIXES[codec]
+
+        elif ext.__contains__("parquet"): # this way, more rebust and tolerant on "ext" var
+            write = lambda tmp: file.to_parquet(tmp, compression = compression or 'snappy', compression_level = level)
+            suffix = 'parquet'
+
+        elif ext.__contains__("feather"): # arrow ipc, stored uncompressed so reads can be memory mapped
+            write = lambda tmp: feather.write_feather(file, tmp, compression = compression or 'uncompressed', compression_level = level)
+            suffix = 'feather'
+
+        else:
+            return False
+
+        FileHandler._write_atomic(osp.join(path, f'{filename}.{suffix}'), write, fsync = fsync, lock = lock, checksum = checksum)
+        return True
+
+    CODECS = {
+        'csv': ('zstd', 'gzip'), # zstd csv needs the zstandard package
+        'parquet': ('zstd', 'lz4', 'snappy', 'gzip', 'brotli'),
+        'feather': ('zstd', 'lz4'),
+    }
+    CSV_SUFFIXES = {'zstd': 'csv.zst', 'gzip': 'csv.gz'}
+
+    @staticmethod
+    def compact_dtypes(df: pd.DataFrame, downcast: bool = True, categorical: bool = True, max_unique_ratio: float = 0.5) -> pd.DataFrame:
+        """smaller dtypes for a frame, without changing any value
+
+        e.g. companyid int64 -> int32, fiscalquarter float64 (1.0 .. 4.0, no NaN) -> int8,
+        normal_price_flag object (True / False / None) -> boolean, a price float64 -> float32 only if
+        every value survives the cast. The dtypes follow the values, so two files of the same table
+        can come out differently (e.g. one with NaN keeps a float column)
+
+        Args:
+            df (pd.DataFrame): not modified
+            downcast (bool, optional): integers to the smallest integer dtype, integral floats without
+                NaN to integers, object columns of bools to boolean, floats to float32 where exact
+            categorical (bool, optional): object columns of strings with few distinct values to category
+            max_unique_ratio (float, optional): at most this share of distinct values per non-null value to become a category
+
+        Returns:
+            pd.DataFrame: copy with the new dtypes
+        """
+        df = df.copy()
+        for col in df.columns:
+            s = df[col]
+            if downcast and pd.api.types.is_bool_dtype(s):
+                continue
+            if downcast and pd.api.types.is_numeric_dtype(s):
+                values = s.to_numpy()
+                if pd.api.types.is_float_dtype(s) and len(s) and s.notna().all() \
+                        and np.array_equal(values, np.round(values)) and np.abs(values).max() < 2**53:
+                    s = s.astype('int64')
+                if pd.api.types.is_integer_dtype(s):
+                    df[col] = pd.to_numeric(s, downcast = 'integer')
+                elif pd.api.types.is_float_dtype(s) and s.dtype.itemsize > 4:
+                    as32 = s.astype('float32')
+                    if (as32.astype(s.dtype).eq(s) | s.isna()).all():
+                        df[col] = as32
+            elif s.dtype == object:
+                non_null = s.dropna()
+                if not len(non_null):
+                    continue
+                kinds = non_null.map(type)
+                if downcast and kinds.isin([bool, np.bool_]).all():
+                    df[col] = s.astype('boolean')
+                elif categorical and kinds.eq(str).all() and non_null.nunique() <= max_unique_ratio * len(non_null):
+                    df[col] = s.astype('category')
+        return df
+
+    @staticmethod
+    def file_report(path: str, ext: str, filename: str, n_reads: int = 5) -> dict:
+        """size on disk and read latency of one file through get_file
+
+        Returns:
+            dict: file, size (bytes), read_ms (median of n_reads full reads)
+        """
+        file_path = osp.join(path, f'{filename}.{FileHandler._suffix(ext)}')
+        times = []
+        for _ in range(n_reads):
+            start = time.perf_counter()
+            FileHandler.get_file(path, ext, filename)
+            times.append(time.perf_counter() - start)
+        return {'file': file_path, 'size': osp.getsize(file_path), 'read_ms': 1000 * statistics.median(times)}
+
+    @staticmethod
+    def _sidecar(file_path: str, kind: str) -> str:
+        # dot prefix keeps sidecars out of directory listings and dataset discovery
+        return osp.join(osp.dirname(file_path), f'.{osp.basename(file_path)}.{kind}')
+
+    @staticmethod
+    def _sha256(file_path: str) -> str:
+        h = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def _write_atomic(file_path: str, write, fsync: bool = False, lock: bool = False, checksum: bool = False):
+        """write(tmp_path) to a temp file next to file_path, then rename it over file_path"""
+        lock_fd = None
+        if lock:
+            lock_fd = os.open(FileHandler._sidecar(file_path, 'lock'), os.O_CREAT | os.O_RDWR)
+            fcntl.flock(lock_fd, fcntl.LOCK_EX) # released by the OS if this process dies
+        # dot prefix and pid keep concurrent writers and directory scans apart
+        tmp = FileHandler._sidecar(file_path, f'{os.getpid()}.tmp')
+        try:
+            write(tmp)
+            if fsync:
+                with open(tmp, 'rb') as f:
+                    os.fsync(f.fileno())
+            if checksum:
+                # the old sidecar goes first: a crash in between leaves a file that fails verify_file
+                if osp.exists(FileHandler._sidecar(file_path, 'sha256')):
+                    os.remove(FileHandler._sidecar(file_path, 'sha256'))
+            os.replace(tmp, file_path)
+            meta = {'size': osp.getsize(file_path)}
+            if checksum:
+                meta['sha256'] = FileHandler._sha256(file_path)
+                sidecar_tmp = FileHandler._sidecar(file_path, f'sha256.{os.getpid()}.tmp')
+                with open(sidecar_tmp, 'w') as f:
+                    json.dump(meta, f)
+                os.replace(sidecar_tmp, FileHandler._sidecar(file_path, 'sha256'))
+            FileHandler._manifest_record(file_path, meta['size'], verified = checksum)
+            if fsync:
+                dir_fd = os.open(osp.dirname(file_path) or '.', os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+        except BaseException:
+            if osp.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            if lock_fd is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+                os.close(lock_fd)
+
+    MANIFEST = '.manifest.jsonl' # per output folder, one line per written file, the last line per file wins
+
+    @staticmethod
+    def _manifest_lock(path: str):
+        lock_fd = os.open(osp.join(path, '.manifest.lock'), os.O_CREAT | os.O_RDWR)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        return lock_fd
+
+    @staticmethod
+    def _manifest_unlock(lock_fd):
+        fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        os.close(lock_fd)
+
+    @staticmethod
+    def _manifest_record(file_path: str, size: int, verified: bool):
+        # only appended to an existing manifest: a missing one is built from a full scan on first use
+        path = osp.dirname(file_path) or '.'
+        manifest = osp.join(path, FileHandler.MANIFEST)
+        if not osp.exists(manifest):
+            return
+        entry = {'filename': osp.basename(file_path), 'size': size,
+                 'mtime': osp.getmtime(file_path), 'verified': verified}
+        lock_fd = FileHandler._manifest_lock(path)
+        try:
+            with open(manifest, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        finally:
+            FileHandler._manifest_unlock(lock_fd)
+
+    @staticmethod
+    def _scan_directory(path: str) -> list:
+        # one directory listing; checksum sidecars come from the same listing
+        entries = [e for e in os.scandir(path) if e.is_file()]
+        sidecars = {e.name for e in entries if e.name.startswith('.') and e.name.endswith('.sha256')}
+        res = []
+        for e in entries:
+            if e.name.startswith('.'):
+                continue
+            st = e.stat()
+            verified = False
+            if f'.{e.name}.sha256' in sidecars:
+                with open(osp.join(path, f'.{e.name}.sha256')) as f:
+                    verified = json.load(f)['size'] == st.st_size
+            res.append({'filename': e.name, 'size': st.st_size, 'mtime': st.st_mtime, 'verified': verified})
+        return res
+
+    @staticmethod
+    def directory_manifest(path: str, rebuild: bool = False) -> pd.DataFrame:
+        """index of the files in an output folder, kept up to date by save_with_dir_create
+
+        Built lazily from one scan of the folder the first time it is asked for, afterwards every
+        save_with_dir_create into the folder appends its file. Files written or removed by other
+        means are only seen after rebuild=True.
+
+        Args:
+            path (str): folder e.g. 'data/car_data/v2/'
+            rebuild (bool, optional): rescan the folder
+
+        Returns:
+            pd.DataFrame: index filename, columns size, mtime, verified (written with a matching checksum sidecar)
+        """
+        columns = ['filename', 'size', 'mtime', 'verified']
+        if not osp.isdir(path):
+            return pd.DataFrame(columns = columns).set_index('filename')
+
+        manifest = osp.join(path, FileHandler.MANIFEST)
+        lock_fd = FileHandler._manifest_lock(path)
+        try:
+            if rebuild or not osp.exists(manifest):
+                entries = FileHandler._scan_directory(path)
+                tmp = osp.join(path, f'{FileHandler.MANIFEST}.{os.getpid()}.tmp')
+                with open(tmp, 'w') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry) + '\n')
+                os.replace(tmp, manifest)
+            else:
+                entries = []
+                with open(manifest) as f:
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            pass # a line cut short by a crash
+        finally:
+            FileHandler._manifest_unlock(lock_fd)
+
+        df = pd.DataFrame(entries, columns = columns)
+        return df.drop_duplicates('filename', keep = 'last').set_index('filename')
+
+    @staticmethod
+    def existing_files(path: str, ext: str, filenames, verify: bool = False) -> np.ndarray:
+        """check_file_existence for many files of one folder at once, answered from directory_manifest
+
+        e.g.
+            done = FileHandler.existing_files('data/car_data/v2/', 'parquet', companyids, verify = True)
+            todo = companyids[~done]
+
+        Args:
+            path (str): folder
+            ext (str): as in check_file_existence
+            filenames (list): file names without extension
+            verify (bool, optional): only count files written with a matching checksum sidecar
+
+        Returns:
+            np.ndarray: bool per filename
+        """
+        suffix = FileHandler._suffix(ext)
+        manifest = FileHandler.directory_manifest(path)
+        if verify:
+            manifest = manifest[manifest['verified'].astype(bool)]
+        names = pd.Index([f'{filename}.{suffix}' for filename in filenames])
+        return names.isin(manifest.index)
+
+    @staticmethod
+    def _suffix(ext: str) -> str:
+        for suffix in FileHandler.CSV_SUFFIXES.values():
+            if ext.endswith(suffix):
+                return suffix
+        for suffix in ['txt', 'csv', 'parquet', 'feather']:
+            if ext.__contains__(suffix):
+                return suffix
+        return None
+
+    @staticmethod
+    def verify_file(file_path: str, full: bool = False) -> bool:
+        """check a file against its checksum sidecar
+
+        Args:
+            file_path (str): e.g. 'data/car_data/v2/32307.parquet'
+            full (bool, optional): also recompute the sha256, otherwise only the size is compared (one stat)
+
+        Returns:
+            bool: False if the file or its sidecar is missing or does not match
+        """
+        sidecar = FileHandler._sidecar(file_path, 'sha256')
+        if not (osp.isfile(file_path) and osp.isfile(sidecar)):
+            return False
+        with open(sidecar) as f:
+            meta = json.load(f)
+        if osp.getsize(file_path) != meta['size']:
+            return False
+        return not full or FileHandler._sha256(file_path) == meta['sha256']
+
+    @staticmethod
+    def check_file_existence(path: str, ext: str, filename: str, verify: bool = False) -> bool:
         """_summary_
 
         Args:
             path (str): _description_
             ext (str): _description_
             filename (str): _description_
+            verify (bool, optional): also require a matching checksum sidecar (size check, see verify_file)
 
         Returns:
             bool: _description_
@@ -56,25 +366,32 @@ class FileHandler():
             # print(file_path)
         
         if ext.__contains__("csv"):
-            file_path = osp.join(path, f'{filename}.csv')
+            file_path = osp.join(path, f'{filename}.{FileHandler._suffix(ext)}')
             # print(file_path)
 
         if ext.__contains__("parquet"):
             file_path = osp.join(path, f'{filename}.parquet')
+
+        if ext.__contains__("feather"):
+            file_path = osp.join(path, f'{filename}.feather')
                     
+        if verify:
+            return FileHandler.verify_file(file_path)
         if osp.isfile(file_path):
             return True 
         else:
             return False
         
     @staticmethod
-    def get_file(path: str, ext: str, filename: str) -> bool:
+    def get_file(path: str, ext: str, filename: str, columns: list = None) -> bool:
         """_summary_
 
         Args:
             path (str): _description_
             ext (str): _description_
             filename (str): _description_
+            columns (list, optional): only load these columns (csv, parquet, feather), None for all.
+                feather files are memory mapped, only the projected columns are ever paged in
 
         Returns:
             bool: _description_
@@ -88,10 +405,17 @@ class FileHandler():
 
         if ext.__contains__("parquet"):
             file_path = osp.join(path, f'{filename}.parquet')
-            return pd.read_parquet(file_path)
+            return pd.read_parquet(file_path, columns = columns)
+
+        if ext.__contains__("feather"):
+            file_path = osp.join(path, f'{filename}.feather')
+            table = feather.read_table(file_path, columns = columns, memory_map = True)
+            # one block per column: numeric columns without nulls stay views on the mapped file
+            return table.to_pandas(split_blocks = True)
 
         if ext.__contains__("csv"):
-            file_path = osp.join(path, f'{filename}.csv')
-            return pd.read_csv(file_path, index_col = [0])
+            file_path = osp.join(path, f'{filename}.{FileHandler._suffix(ext)}') # .csv.zst / .csv.gz by name
+            df = pd.read_csv(file_path, index_col = [0])
+            return df if columns is None else df[columns]
 
         return False
\ No newline at end of file
@@ -22,200 +22,326 @@ Adds support for annual data in addition to monthly data.
 """
 
 import pandas as pd
-from dateutil.relativedelta import relativedelta
-import requests
-from bs4 import BeautifulSoup
 import os
+import os.path as osp
+import json
+import time
+import warnings
+import numpy as np
+from multiprocessing import shared_memory
+
+# requests is only imported when something has to be downloaded,
+# importing this module touches neither the network nor the disk
+
+FF5_DAILY_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_5_Factors_2x3_daily_CSV.zip"
+MOM_DAILY_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Momentum_Factor_daily_CSV.zip"
+# published monthly files, each with an annual section below the monthly one
+FF5_MONTHLY_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_5_Factors_2x3_CSV.zip"
+MOM_MONTHLY_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Momentum_Factor_CSV.zip"
+
+# raw data library files are cached here, next to cache.json holding version and fetch time per file
+FACTOR_CACHE_DIR = 'data/factors/'
+# bump when the cached file layout changes, older entries are then downloaded again
+FACTOR_CACHE_VERSION = 1
+# days after which a cached file is refreshed, the data library is updated about monthly
+FACTOR_CACHE_MAX_AGE = 30
+# offline: serve everything from the cache, never download (env GFF_OFFLINE=1 or setOffline())
+OFFLINE = os.environ.get('GFF_OFFLINE', '0') not in ('', '0')
+
+
+def setOffline(offline=True):
+    '''
+    Switches offline mode on or off for this process
+    '''
+    global OFFLINE
+    OFFLINE = offline
+
 
-# Extract URLs to download
-url = "http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/data_library.html"
-response = requests.get(url)
-soup = BeautifulSoup(response.text, 'lxml')
+def _readCacheMeta():
+    path = osp.join(FACTOR_CACHE_DIR, 'cache.json')
+    if not osp.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
 
-text_to_search = ['Fama/French 3 Factors', 'Momentum Factor (Mom)']
-all_factors_text = soup.findAll('b', text=text_to_search)
 
-home_url = "http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/"
-all_factor_links = []
-for text in all_factors_text:
-    links_for_factor = []  # Stores all links for a factor
-    for sib in text.next_siblings:  # Find next element
-        # URLs are stored in bold tags, hence...
-        if sib.name == 'b':
-            bold_tags = sib
-            try:
-                link = bold_tags.find('a')['href']
-                links_for_factor.append(link)
-            except TypeError:
-                pass
-    csv_links = [home_url + link for link in links_for_factor if 'csv' in link.lower()]
-    txt_links = [home_url + link for link in links_for_factor if 'txt' in link.lower()]
-    factor_dict = {'factor' : text, 'csv_links' : csv_links, 'txt_links' : txt_links}
-    all_factor_links.append(factor_dict)
+def _writeCacheMeta(meta):
+    path = osp.join(FACTOR_CACHE_DIR, 'cache.json')
+    tmp = path + f'.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, path)
 
 
-ff3factor_dict = dict(all_factor_links[0])
-momAndOthers_dict = dict(all_factor_links[1])
+def _cachedFile(name, url):
+    '''
+    Returns the local path of the raw data library file `name`, downloading it
+    first if it is not cached, cached by an older FACTOR_CACHE_VERSION or older
+    than FACTOR_CACHE_MAX_AGE days.
 
+    In offline mode any cached copy is served as is. If a refresh fails the stale
+    copy is served with a warning.
 
-def famaFrench5Factor(frequency='m'):
+    url: the download url
     '''
-    Returns Fama French 5 factors (Market Risk Premium, SMB, HML, RMW, CMA),
-    and the risk-free rate (RF)
+    path = osp.join(FACTOR_CACHE_DIR, f'{name}.zip')
+    entry = _readCacheMeta().get(name)
+    cached = osp.exists(path)
+    fresh = (cached and entry is not None
+             and entry.get('version') == FACTOR_CACHE_VERSION
+             and time.time() - entry.get('fetched', 0) < FACTOR_CACHE_MAX_AGE * 86400)
+    if fresh or (OFFLINE and cached):
+        return path
+    if OFFLINE:
+        raise FileNotFoundError(f'{path} is not cached and gff is in offline mode, '
+                                f'run once with network access (GFF_OFFLINE unset) to fill {FACTOR_CACHE_DIR}')
+
+    try:
+        import requests
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+    except Exception as e:
+        if cached:
+            warnings.warn(f'could not refresh {name} ({e}), serving the cached copy')
+            return path
+        raise
+
+    os.makedirs(FACTOR_CACHE_DIR, exist_ok=True)
+    tmp = path + f'.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp, path)
+
+    meta = _readCacheMeta()
+    meta[name] = {'version': FACTOR_CACHE_VERSION, 'url': url, 'fetched': time.time()}
+    _writeCacheMeta(meta)
+    return path
+
+
+# one daily source per factor family; legacy: the csv cache of earlier versions of this module
+# (the raw file as read, skiprows applied), served when the daily file is neither cached nor downloadable
+FACTOR_FAMILIES = {
+    'ff5': {'cache_name': 'ff5_daily', 'url': FF5_DAILY_URL, 'skiprows': 3, 'footer_rows': 0,
+            'legacy': 'data/ff5_factors.csv'},
+    'mom': {'cache_name': 'mom_daily', 'url': MOM_DAILY_URL, 'skiprows': 13, 'footer_rows': 1,
+            'legacy': 'data/factor_momentum.csv'},
+}
+
+# the published monthly / annual files: the line opening the annual section and the rows
+# after it to skip (header, for mom also a blank line), footer rows at the end of the file
+PUBLISHED_FACTORS = {
+    'ff5': {'cache_name': 'ff5_monthly', 'url': FF5_MONTHLY_URL, 'skiprows': 3,
+            'annual_marker': ' Annual Factors: January-December ', 'annual_skip': 2, 'footer_rows': 0},
+    'mom': {'cache_name': 'mom_monthly', 'url': MOM_MONTHLY_URL, 'skiprows': 13,
+            'annual_marker': 'Annual Factors:', 'annual_skip': 3, 'footer_rows': 1},
+}
+
+# process wide cache of factorStore(), family -> frame
+_FACTOR_STORE = {}
+
+
+def factorStore(family):
     '''
-    if frequency == 'd':
-        #############
-        # new  by GZ# 
-        # to accelerate batch compute
-        if os.path.exists('data/ff5_factors.csv'):
-            ff5_factors = pd.read_csv('data/ff5_factors.csv')
-        else:
-            ff5_raw_data = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_5_Factors_2x3_daily_CSV.zip"
-
-            ff5_factors = pd.read_csv(ff5_raw_data, skiprows=3)
-            ff5_factors.to_csv('data/ff5_factors.csv', index=False)
-
-        ff5_factors.rename(columns = {ff5_factors.columns[0] : 'date_ff_factors'},
-                        inplace=True)
-
-        # Convert dates to datetime objects (note: values will be int64)
-        ff5_factors['date_ff_factors'] = pd.to_datetime(ff5_factors['date_ff_factors'],
-                                                        format='%Y%m%d')
-        # print(ff5_factors.tail(10))
-        #############
+    Returns the daily series of a factor family ('ff5' or 'mom') as a date indexed
+    float64 frame (index name 'date_ff_factors'), in percent as published.
+
+    Kept on disk as one parquet file per family next to the raw data library file,
+    rebuilt whenever the raw file was refreshed, and held in memory for the life
+    of the process, so treat it as read only.
+    '''
+    if family in _FACTOR_STORE:
+        return _FACTOR_STORE[family]
+
+    spec = FACTOR_FAMILIES[family]
+    try:
+        raw = _cachedFile(spec['cache_name'], spec['url'])
+    except Exception as e:
+        if not osp.exists(spec['legacy']):
+            raise
+        # a machine set up before FACTOR_CACHE_DIR: keep serving its old csv cache until a download succeeds
+        warnings.warn(f"{spec['cache_name']} is not in {FACTOR_CACHE_DIR} ({e}), serving the legacy cache {spec['legacy']}")
+        factors = _parseDaily(pd.read_csv(spec['legacy']), spec['footer_rows'])
+        _FACTOR_STORE[family] = factors
+        return factors
+
+    path = osp.join(FACTOR_CACHE_DIR, f'{family}.parquet')
+    if osp.exists(path) and osp.getmtime(path) >= osp.getmtime(raw):
+        factors = pd.read_parquet(path)
     else:
-        rows_to_skip = 3
-        ff5_raw_data = ff3factor_dict['csv_links'][3]
+        factors = _parseDaily(pd.read_csv(raw, skiprows=spec['skiprows']), spec['footer_rows'])
 
-        ff5_factors = pd.read_csv(ff5_raw_data, skiprows=rows_to_skip)
+        tmp = path + f'.{os.getpid()}.tmp'
+        factors.to_parquet(tmp)
+        os.replace(tmp, path)
 
-        ff5_factors.rename(columns = {ff5_factors.columns[0] : 'date_ff_factors'},
-                        inplace=True)
+    _FACTOR_STORE[family] = factors
+    return factors
 
-        # Get index of annual factor returns
-        annual_factor_index_loc = ff5_factors[
-                ff5_factors.values == ' Annual Factors: January-December '].index
 
+def _parseDaily(factors, footer_rows):
+    '''
+    Date indexed float64 frame from a daily file as read by read_csv.
+    '''
+    if footer_rows:
+        factors = factors.iloc[:-footer_rows]  # copyright footer
+    factors = factors.rename(columns={factors.columns[0]: 'date_ff_factors'})
+    factors['date_ff_factors'] = pd.to_datetime(factors['date_ff_factors'].astype(str).str.strip(),
+                                                format='%Y%m%d')
+    return factors.set_index('date_ff_factors').astype('float64').sort_index()
 
-        # Clean annual and monthly versions
-        if frequency == 'm':
-            ff5_factors.drop(ff5_factors.index[annual_factor_index_loc[0]:], inplace=True)
 
-            # Convert dates to pd datetime objects
-            ff5_factors['date_ff_factors'] = pd.to_datetime(ff5_factors['date_ff_factors'],
-                                                            format='%Y%m')
-            # Shift dates to end of month
-            ff5_factors['date_ff_factors'] = ff5_factors['date_ff_factors'].apply(
-                lambda date : date + relativedelta(day = 1, months = +1, days = -1))
+def publishedFactors(family, frequency='m'):
+    '''
+    Returns the monthly ('m', dated month end) or annual ('a', dated by int year)
+    factors of a family ('ff5' or 'mom') as published in the data library, in decimals.
+    '''
+    spec = PUBLISHED_FACTORS[family]
+    factors = pd.read_csv(_cachedFile(spec['cache_name'], spec['url']), skiprows=spec['skiprows'])
+    factors = factors.rename(columns={factors.columns[0]: 'date_ff_factors'})
+
+    # Get index of annual factor returns
+    annual_factor_index_loc = factors[factors.values == spec['annual_marker']].index
+
+    # Clean annual and monthly versions
+    if frequency == 'm':
+        factors = factors.drop(factors.index[annual_factor_index_loc[0]:])
+        # Convert dates to the end of their month
+        factors['date_ff_factors'] = pd.to_datetime(factors['date_ff_factors'], format='%Y%m') + pd.offsets.MonthEnd(0)
+    elif frequency == 'a':
+        # Extract annual data only, without header rows and copyright footer
+        factors = factors.drop(factors.index[:annual_factor_index_loc[0]])
+        factors = factors.iloc[spec['annual_skip']:len(factors) - spec['footer_rows']].reset_index(drop=True)
+        # Deal with spacing issues (e.g. '  1927' instead of '1927')
+        factors['date_ff_factors'] = pd.to_datetime(factors['date_ff_factors'].str.strip(), format='%Y').dt.year.values
+    else:
+        raise ValueError(f"frequency must be 'm' or 'a', not {frequency!r}")
 
-        elif frequency == 'a':
-            # Extract annual data only
-            ff5_factors.drop(ff5_factors.index[:annual_factor_index_loc[0]],
-                            inplace=True)
+    # Convert all factors to numeric and decimals (%)
+    for col in factors.columns[1:]:
+        factors[col] = pd.to_numeric(factors[col]) / 100
+    return factors
 
-            # Ignore copyright footer & first 2 header rows
-            ff5_factors = ff5_factors.iloc[2:]
-            ff5_factors.reset_index(inplace=True)
-            ff5_factors.drop(columns=ff5_factors.columns[0], inplace=True)
 
-            # Deal with spacing issues (e.g. '  1927' instead of '1927')
-            ff5_factors['date_ff_factors'] = ff5_factors['date_ff_factors'].apply(
-                lambda x : x.strip())
+def _resampleFactors(daily, frequency):
+    '''
+    Compounds daily percent returns into monthly ('m', dated month end) or annual
+    ('a', dated by int year) decimal returns. A first or last period the daily
+    series only partly covers is dropped.
+    '''
+    periods = daily.index.to_period('M' if frequency == 'm' else 'Y')
+    # compounding as a sum of log growth, one vectorized groupby
+    resampled = np.expm1(np.log1p(daily / 100).groupby(periods).sum())
+
+    dates = pd.Series(daily.index, index=daily.index).groupby(periods)
+    slack = pd.Timedelta(days=4)  # weekends and holidays at the period edges
+    complete = ((dates.min() - resampled.index.start_time <= slack)
+                & (resampled.index.end_time.normalize() - dates.max() <= slack))
+    resampled = resampled[complete.values]
+
+    if frequency == 'm':
+        index = resampled.index.to_timestamp(how='end').normalize()
+    else:
+        index = resampled.index.year
+    resampled.index = pd.Index(index, name='date_ff_factors')
+    return resampled.reset_index()
 
-            # Convert dates to datetime objects (note: values will be int64)
-            ff5_factors['date_ff_factors'] = pd.to_datetime(ff5_factors['date_ff_factors'],
-                                                            format='%Y').dt.year.values
 
-        # Convert all factors to numeric and decimals (%)
-        for col in ff5_factors.columns[1:]:
-            ff5_factors[col] = pd.to_numeric(ff5_factors[col]) / 100
+def famaFrench5Factor(frequency='m', fromDaily=False):
+    '''
+    Returns Fama French 5 factors (Market Risk Premium, SMB, HML, RMW, CMA),
+    and the risk-free rate (RF)
 
-    return ff5_factors
+    Set frequency as:
+        'd' for daily factors (in percent)
+        'm' for monthly factors
+        'a' for annual factors
+
+    Monthly and annual factors are the published series (publishedFactors). With
+    fromDaily=True they are compounded from the daily factor store instead
+    (_resampleFactors), which differs from the published values, RF in particular,
+    and leaves out partly covered first and last periods.
+    '''
+    if frequency == 'd':
+        return factorStore('ff5').reset_index()
+    if fromDaily:
+        return _resampleFactors(factorStore('ff5'), frequency)
+    return publishedFactors('ff5', frequency)
 
-def momentumFactor(frequency='m'):
+
+def momentumFactor(frequency='m', fromDaily=False):
     '''
     Returns the Momentum factor
 
     Set frequency as:
+        'd' for daily factors (in percent, column 'Mom   ' as published)
         'm' for monthly factors
         'a' for annual factors
 
+    fromDaily: see famaFrench5Factor
     '''
     if frequency == 'd':
-        #############
-        # new  by GZ# 
-        # to accelerate batch compute
-        if os.path.exists('data/factor_momentum.csv'):
-            mom_factor = pd.read_csv('data/factor_momentum.csv')
-        else:
-            mom_raw_data = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Momentum_Factor_daily_CSV.zip"
+        return factorStore('mom').reset_index()
+    if fromDaily:
+        mom_factor = _resampleFactors(factorStore('mom'), frequency)
+    else:
+        mom_factor = publishedFactors('mom', frequency)
+    # Rename momentum factor to eliminate white space
+    mom_factor.rename(columns={mom_factor.columns[1] : 'MOM'}, inplace=True)
+    return mom_factor
+
+
+# process wide cache of dailyFactors(), filled on first use or by attachDailyFactors in a worker
+_DAILY_FACTORS = None
 
-            mom_factor = pd.read_csv(mom_raw_data, skiprows=13)
-            mom_factor.to_csv('data/factor_momentum.csv', index=False)
 
+def dailyFactors():
+    '''
+    Returns the daily Fama French 5 factors, the risk-free rate and momentum
+    joined on date, as one float64 frame indexed by date (index name 'date_ff_factors').
 
-        mom_factor.rename(columns = {mom_factor.columns[0] : 'date_ff_factors'},
-                        inplace=True)
+    The factor stores are loaded and joined once per process, every later call
+    returns the same frame, so treat it as read only (copy before mutating).
+    Use .to_numpy() for the bare factor matrix.
+    '''
+    global _DAILY_FACTORS
+    if _DAILY_FACTORS is None:
+        _DAILY_FACTORS = factorStore('ff5').join(factorStore('mom'), how='inner')
+    return _DAILY_FACTORS
 
-        mom_factor.drop(mom_factor.tail(1).index,inplace=True) # drop last n rows
 
-        # print(mom_factor)
+def shareDailyFactors():
+    '''
+    Copies dailyFactors() into a shared memory block so worker processes can attach
+    to it instead of parsing the csv caches themselves.
 
-        # Convert dates to datetime objects (note: values will be int64)
-        mom_factor['date_ff_factors'] = pd.to_datetime(mom_factor['date_ff_factors'],
-                                                        format='%Y%m%d')
-        # print(mom_factor.tail(10))
-        #############
-    else:
-        rows_to_skip = 13
-        mom_raw_data = momAndOthers_dict['csv_links'][0]
-
-        mom_factor = pd.read_csv(mom_raw_data, skiprows=rows_to_skip)
-        mom_factor.rename(columns = {mom_factor.columns[0] : 'date_ff_factors'},
-                        inplace=True)
-
-        # Get index of annual factor returns
-        annual_factor_index_loc = mom_factor[
-                mom_factor.values == 'Annual Factors:'].index
-        # Clean annual and monthly versions
-        if frequency == 'm':
-            # Exclude annual factor returns
-            mom_factor.drop(mom_factor.index[annual_factor_index_loc[0]:], inplace=True)
-
-            # Convert dates to pd datetime objects
-            mom_factor['date_ff_factors'] = pd.to_datetime(mom_factor['date_ff_factors'],
-                                                        format='%Y%m')
-
-            # Shift dates to end of month
-            mom_factor['date_ff_factors'] = mom_factor['date_ff_factors'].apply(
-                lambda date : date + relativedelta(day = 1, months = +1, days = -1))
-
-        elif frequency == 'a':
-            # Extract annual data only
-            mom_factor.drop(mom_factor.index[:annual_factor_index_loc[0]],
-                            inplace=True)
-
-            # Ignore copyright footer & first 2 header rows
-            mom_factor = mom_factor.iloc[3:-1]
-            mom_factor.reset_index(inplace=True)
-            mom_factor.drop(columns=mom_factor.columns[0], inplace=True)
-
-            # Deal with spacing issues (e.g. '  1927' instead of '1927')
-            mom_factor['date_ff_factors'] = mom_factor['date_ff_factors'].apply(
-                lambda x : x.strip())
-
-            # Convert dates to datetime objects (note: values will be int64)
-            mom_factor['date_ff_factors'] = pd.to_datetime(mom_factor['date_ff_factors'],
-                                                        format='%Y').dt.year.values
-
-        # Convert all factors to numeric and decimals (%)
-        for col in mom_factor.columns[1:]:
-            mom_factor[col] = pd.to_numeric(mom_factor[col]) / 100
-
-        # Rename momentum factor to eliminate white space
-        mom_factor.rename(columns={mom_factor.columns[1] : 'MOM'}, inplace=True)
+    Returns (shm, handle): hand the picklable handle to attachDailyFactors in the workers
+    (e.g. as a Pool initializer); the caller owns shm and must close() and unlink() it
+    once the workers are done.
+    '''
+    factors = dailyFactors()
+    # first column: days since epoch, exact in float64
+    days = factors.index.values.astype('datetime64[D]').astype('int64')
+    matrix = np.column_stack([days, factors.to_numpy()]).astype('float64')
 
-    return mom_factor
+    shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    np.ndarray(matrix.shape, dtype='float64', buffer=shm.buf)[:] = matrix
+    handle = {'name': shm.name, 'shape': matrix.shape, 'columns': list(factors.columns)}
+    return shm, handle
+
+
+def attachDailyFactors(handle):
+    '''
+    Fills the process cache of dailyFactors() from a block made by shareDailyFactors.
+    '''
+    global _DAILY_FACTORS
+    shm = shared_memory.SharedMemory(name=handle['name'])
+    try:
+        matrix = np.ndarray(handle['shape'], dtype='float64', buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    index = pd.DatetimeIndex(matrix[:, 0].astype('int64').astype('datetime64[D]'), name='date_ff_factors')
+    _DAILY_FACTORS = pd.DataFrame(matrix[:, 1:], index=index, columns=handle['columns'])
+    return _DAILY_FACTORS
 
 
 if __name__ == "__main__":
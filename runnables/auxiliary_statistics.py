@@ -16,6 +16,7 @@ from src.merge_tot_equity import merge_tot_equity
 from src.get_earning_release_date import get_earning_release_date
 from src.earnings_change import merge_earnings_estimates
 from src.monthly_return import get_monthly_return
+from capitaliq.priceStore import PriceStore
 
 from car.calc_car import calculate_car
 
@@ -28,7 +29,7 @@ revenue_PATH = 'data/revenue.csv'
 revenueDiff_PATH = 'data/revenueDiff.csv'
 marketcap_PATH = 'data/mc/marketcap.csv'
 tot_equity_PATH = 'data/fundamentals/tot_equity.csv'
-price_PATH = 'data/price/us_price.csv'
+price_store_PATH = 'data/price/store/' # build / refresh with runnables/update_price_store.py
 earnings_release_date_PATH = 'data/earning_release_date.csv'
 monthly_return_PATH = 'data/price/monthly_return.csv'
 
@@ -59,8 +60,7 @@ if __name__ == "__main__":
     universe.dropna(subset=['earningsdate-5days'], inplace=True)
 
     # price
-    price = pd.read_csv(price_PATH, index_col=[0])
-    price['pricedate'] = pd.to_datetime(price['pricedate'])
+    price = PriceStore(price_store_PATH).read(columns=['companyid', 'pricedate', 'divadjclose'])
     # print(price.head())
 
     universe.sort_values(by=['earningsdate-5days'], inplace=True)
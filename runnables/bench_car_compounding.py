@@ -0,0 +1,34 @@
+import pandas as pd 
+import numpy as np 
+import time
+import sys
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management 
+sys.path.append(ROOTPATH)
+
+# internal
+from car.calc_car import rolling_compound, CAR_HORIZONS
+
+# multi-horizon CAR on a 20-year daily series: rolling().apply(np.prod) vs rolling_compound
+N_DAYS = 20 * 252
+N_REPEAT = 5
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    compound = pd.Series(1 + rng.normal(0, 0.02, N_DAYS))
+    compound.iloc[rng.choice(N_DAYS, 20, replace = False)] = np.nan # missing days
+
+    start = time.perf_counter()
+    for _ in range(N_REPEAT):
+        old = pd.DataFrame({name: compound.rolling(window=window).apply(np.prod, raw=True) - 1 for name, window in CAR_HORIZONS.items()})
+    t_old = (time.perf_counter() - start) / N_REPEAT
+
+    start = time.perf_counter()
+    for _ in range(N_REPEAT):
+        new = rolling_compound(compound, CAR_HORIZONS)
+    t_new = (time.perf_counter() - start) / N_REPEAT
+
+    pd.testing.assert_frame_equal(old, new, check_exact = False, rtol = 1e-12)
+    print(f'rolling().apply(np.prod): {1000 * t_old:10.2f} ms')
+    print(f'rolling_compound:         {1000 * t_new:10.2f} ms')
+    print(f'speedup:                  {t_old / t_new:10.1f}x on {N_DAYS} days x {len(CAR_HORIZONS)} horizons')
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from statsmodels.regression.rolling import RollingOLS
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+
+# internal
+from car.calc_et_fwd_ret import event_betas
+
+# event beta over the full event file: one RollingOLS over the whole pre-event history per event
+#   vs one running-sum rolling beta per company looked up by event date
+#   python runnables/bench_event_beta.py [max companies]
+EVENT_FILE = 'data/processed/universeAugmented.csv'
+FWD_RET_PATH = 'data/fwd_ret_data/v1/'
+WINDOW = 252
+
+
+def beta_per_event(fwd_ret, ec_et_day):
+    # what calc_et_fwd_ret used to run for every event
+    fwd_ret_hist = fwd_ret.query("pricedate < @ec_et_day")
+    fwd_ret_hist['intercept'] = 1
+    model = RollingOLS(endog =fwd_ret_hist['stock_ret_close'].values , exog=fwd_ret_hist[['sp500_ret_close' , 'intercept']],window=WINDOW)
+    try:
+        beta = float(model.fit().params['sp500_ret_close'].iloc[-2])
+    except Exception:
+        beta = np.nan
+    return 1. if np.isnan(beta) else beta
+
+
+if __name__ == "__main__":
+    universe = pd.read_csv(EVENT_FILE, index_col = [0])
+    universe['ec_et_day'] = pd.to_datetime(universe['ec_et_day'])
+    groups = list(universe.groupby('companyid'))
+    if len(sys.argv) > 1:
+        groups = groups[:int(sys.argv[1])]
+
+    t_old = t_new = 0.
+    n_events = 0
+    max_diff = 0.
+    for cid, group in groups:
+        path = os.path.join(FWD_RET_PATH, f'{cid}.parquet')
+        if not os.path.exists(path):
+            continue
+        fwd_ret = pd.read_parquet(path).sort_values('pricedate', kind = 'stable')
+
+        start = time.perf_counter()
+        old = np.array([beta_per_event(fwd_ret, day) for day in group['ec_et_day']])
+        t_old += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = event_betas(fwd_ret, group['ec_et_day'].to_numpy(), WINDOW)
+        t_new += time.perf_counter() - start
+
+        n_events += len(group)
+        max_diff = max(max_diff, float(np.max(np.abs(old - new), initial = 0.)))
+
+    print(f'{n_events} events over {len(groups)} companies')
+    print(f'RollingOLS per event:     {t_old:10.2f} s')
+    print(f'rolling beta per company: {t_new:10.2f} s')
+    print(f'speedup:                  {t_old / max(t_new, 1e-9):10.1f}x, max |beta diff| {max_diff:.2e}')
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+import pandas as pd
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+
+# internal
+from fhandler.fileHandler import FileHandler
+
+# read latency of one typical CAR file through FileHandler in every format, full and projected
+#   python runnables/bench_file_formats.py [path to a car parquet file]
+CAR_FILE = 'data/car_data/v2/32307.parquet'
+COLUMNS = ['pricedate', 'one_d_car', 'one_w_car', 'one_m_car', 'one_q_car'] # what calc_et_car reads
+N_READS = 50
+FORMATS = ['csv', 'parquet', 'feather']
+
+
+def read_time(path, ext, filename, columns, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        FileHandler.get_file(path, ext, filename, columns = columns)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    car = pd.read_parquet(sys.argv[1] if len(sys.argv) > 1 else CAR_FILE)
+    print(f'{len(car)} rows x {car.shape[1]} columns')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'format':>8} {'size MB':>9} {'full ms':>9} {'projected ms':>13}")
+        for ext in FORMATS:
+            FileHandler.save_with_dir_create(tmp, ext, 'car', car)
+            size = os.path.getsize(os.path.join(tmp, f'car.{ext}')) / 1e6
+            full = read_time(tmp, ext, 'car', None, N_READS)
+            projected = read_time(tmp, ext, 'car', COLUMNS, N_READS)
+            print(f'{ext:>8} {size:9.2f} {1000 * full:9.2f} {1000 * projected:13.2f}')
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import statistics
+import sys
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+
+# cold import time of gff.gff_function in a fresh interpreter
+#   pandas is loaded before the clock starts, so only what the module itself does at import is timed;
+#   that used to include an http request and an html parse of the data library page
+N_RUNS = 10
+
+SNIPPET = '''
+import sys, time
+sys.path.append({root!r})
+import pandas
+start = time.perf_counter()
+{stmt}
+print(time.perf_counter() - start)
+'''
+
+
+def import_time(stmt, n):
+    times = []
+    for _ in range(n):
+        out = subprocess.run([sys.executable, '-c', SNIPPET.format(root = ROOTPATH, stmt = stmt)],
+                             capture_output = True, text = True, check = True, env = {**os.environ, 'GFF_OFFLINE': '1'})
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    baseline = import_time('pass', N_RUNS)
+    gff = import_time('import gff.gff_function', N_RUNS)
+
+    print(f'empty statement:        {1000 * baseline:8.2f} ms')
+    print(f'import gff.gff_function: {1000 * gff:8.2f} ms (median of {N_RUNS}, offline mode)')
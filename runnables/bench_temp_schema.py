@@ -0,0 +1,47 @@
+import pandas as pd
+import time
+import sys
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+
+# internal
+from capitaliq.databaseManager import get_pool, get_temp_schema
+
+# per-call overhead of finding the pg_temp_N schema: the old full catalog scan vs the cached lookup
+N_CALLS = 50
+
+
+def scan_information_schema(connection):
+    # what every temp-table function used to run before building its query
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM information_schema.tables")
+    data = cursor.fetchall()
+    columns = [desc[0] for desc in cursor.description]
+    schema = pd.DataFrame(data,columns = columns).table_schema.unique()
+    for i in schema:
+        if 'pg_temp' in i:
+            tschema = i
+    return tschema
+
+
+def timeit(func, connection, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        tschema = func(connection)
+    return (time.perf_counter() - start) / n, tschema
+
+
+if __name__ == "__main__":
+    pool = get_pool()
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("CREATE TEMP TABLE temp_universe (companyid int) ON COMMIT DELETE ROWS;")
+
+        scan, scan_schema = timeit(scan_information_schema, connection, N_CALLS)
+        cached, cached_schema = timeit(get_temp_schema, connection, N_CALLS)
+        assert scan_schema == cached_schema, (scan_schema, cached_schema)
+
+    print(f'information_schema scan: {1000 * scan:10.3f} ms/call')
+    print(f'get_temp_schema:         {1000 * cached:10.3f} ms/call')
+    print(f'speedup:                 {scan / cached:10.1f}x ({scan_schema})')
@@ -0,0 +1,46 @@
+import time
+import sys
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+
+# internal
+from capitaliq.databaseManager import get_pool, read_sql_to_df
+
+# rows/sec of the three read_sql_to_df decoding paths on one year of miadjprice
+SQL = """
+SELECT
+mi.tradingItemId
+,mi.priceDate
+,mi.priceClose
+,mi.priceOpen
+,mi.priceHigh
+,mi.priceLow
+,mi.volume
+,mi.vwap
+FROM miadjprice mi
+WHERE mi.priceDate >= '2022-01-01'
+AND mi.priceDate <= '2022-12-31'
+"""
+
+
+def run(connection, **kwargs):
+    start = time.perf_counter()
+    df = read_sql_to_df(SQL, connection, connection.cursor(), **kwargs)
+    if kwargs.get('dtypes') is None and not kwargs.get('copy'):
+        # what downstream code has to do with the Decimal/object columns today
+        for col in ['priceclose', 'priceopen', 'pricehigh', 'pricelow', 'volume', 'vwap']:
+            df[col] = df[col].astype(float)
+    elapsed = time.perf_counter() - start
+    return len(df), elapsed, df.memory_usage(deep = True).sum()
+
+
+if __name__ == "__main__":
+    pool = get_pool()
+    with pool.connection() as connection:
+        for name, kwargs in [
+                ('tuples + astype(float)', {}),
+                ('tuples, dtypes=infer', {'dtypes': 'infer'}),
+                ('COPY csv, dtypes=infer', {'dtypes': 'infer', 'copy': True})]:
+            nrows, elapsed, nbytes = run(connection, **kwargs)
+            print(f'{name:25s} {nrows:>10d} rows {elapsed:8.2f}s {nrows / elapsed:12.0f} rows/s {nbytes / 1e6:8.1f} MB')
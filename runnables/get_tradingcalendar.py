@@ -1,5 +1,11 @@
 import pandas_market_calendars as mcal
 import os
+import sys
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+# internal
+from car.trading_calendar import TradingCalendar, TRADINGCALENDAR_PATH, TRADINGCALENDAR_CSV_PATH
 
 nyse = mcal.get_calendar('NYSE')
 
@@ -9,4 +15,7 @@ tcalendar.rename(columns = {'index': 'tradingday'}, inplace = True)
 
 print(tcalendar)
 os.makedirs('data/tradingcalendar', exist_ok=True)
-tcalendar.to_csv('data/tradingcalendar/tradingcalendar.csv', index=False)
\ No newline at end of file
+tcalendar.to_csv(TRADINGCALENDAR_CSV_PATH, index=False)
+
+# compact binary copy read by car.trading_calendar.get_trading_calendar
+TradingCalendar.from_csv(TRADINGCALENDAR_CSV_PATH).save(TRADINGCALENDAR_PATH)
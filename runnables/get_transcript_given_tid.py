@@ -14,6 +14,7 @@ sys.path.append(ROOTPATH)
 
 # internal
 from capitaliq.databaseManager import get_all_transcript, get_all_us_universe, get_transcript
+from capitaliq.transcriptStore import TranscriptStore
 
 
 print('running get_et.py')
@@ -25,9 +26,8 @@ print('total: ' + str(len(transcripts_ref['transcriptid'].unique())))
 
 total_ecs = transcripts_ref['transcriptid'].unique()
 
-transcripts = get_transcript(total_ecs)
-transcripts.to_parquet('data/et/all_transcripts.parquet')
-for transcriptid in tqdm.tqdm(transcripts['transcriptid'].unique()):
-    os.makedirs('data/et/individual', exist_ok=True)
-    transcripts.query("transcriptid == @transcriptid").to_parquet(f"data/et/individual/{transcriptid}.parquet")
+# chunked download straight into the partitioned store, a rerun resumes after the last finished chunk
+#   read back with TranscriptStore('data/et/store/').read([transcriptid, ...])
+nrows = TranscriptStore('data/et/store/').download(total_ecs, transcripts_ref, chunksize = 200)
+print(f'{nrows} component rows stored')
 
@@ -0,0 +1,67 @@
+import os
+import os.path as osp
+import sys
+import pandas as pd
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management
+sys.path.append(ROOTPATH)
+
+# internal
+from fhandler.fileHandler import FileHandler
+
+# size / read latency of every parquet file under the data tree, optionally rewritten in place
+# with a codec, downcast dtypes and categorical strings (same file name and format)
+#   csv files are left alone: a compressed csv needs a new name (.csv.zst) and plain pd.read_csv
+#   callers all over the repo read the .csv names, write new csv outputs with compression= instead
+#   per-company families (numeric file names, e.g. data/car_data/v2/32307.parquet) only get the
+#   codec, their dtypes would otherwise follow each file's values and the schemas drift apart
+#   python runnables/shrink_data_tree.py [root] [codec] [level] [--apply]
+#   e.g. python runnables/shrink_data_tree.py data/ zstd 3 --apply
+DATA_ROOT = 'data/'
+CODEC = 'zstd'
+REPORT_NAME = 'shrink_report.csv'
+EXTS = ['parquet']
+
+
+def data_files(root):
+    # hive-partitioned stores (key=value folders) and sidecars are managed by their own writers
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if '=' not in d and not d.startswith('.')]
+        if any('=' in d for d in os.listdir(folder)):
+            continue
+        for f in sorted(files):
+            stem, _, ext = f.rpartition('.')
+            if ext in EXTS and not f.startswith(('.', '_')) and f != REPORT_NAME:
+                yield folder, ext, stem
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    root = args[0] if len(args) > 0 else DATA_ROOT
+    codec = args[1] if len(args) > 1 else CODEC
+    level = int(args[2]) if len(args) > 2 else None
+    apply = '--apply' in sys.argv
+
+    rows = []
+    for folder, ext, stem in data_files(root):
+        before = FileHandler.file_report(folder, ext, stem)
+        row = {'file': before['file'], 'size_mb': before['size'] / 1e6, 'read_ms': before['read_ms']}
+        if apply:
+            df = FileHandler.get_file(folder, ext, stem)
+            # keep the checksum sidecar of files that had one
+            checksum = osp.isfile(FileHandler._sidecar(before['file'], 'sha256'))
+            family = stem.isdigit()
+            FileHandler.save_with_dir_create(folder, ext, stem, df, checksum = checksum,
+                                             compression = codec, level = level,
+                                             downcast = not family, categorical = not family)
+            after = FileHandler.file_report(folder, ext, stem)
+            row.update({'new_size_mb': after['size'] / 1e6, 'new_read_ms': after['read_ms'],
+                        'ratio': after['size'] / max(before['size'], 1)})
+        print(row)
+        rows.append(row)
+
+    report = pd.DataFrame(rows)
+    print(report.to_string())
+    if len(report):
+        print(f"total {report['size_mb'].sum():.1f} MB" + (f" -> {report['new_size_mb'].sum():.1f} MB" if apply else ''))
+    report.to_csv(osp.join(root, REPORT_NAME), index = False)
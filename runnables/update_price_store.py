@@ -0,0 +1,27 @@
+import pandas as pd 
+import sys 
+import os
+
+ROOTPATH = '/home/ubuntu/ciqcoldcopy/' # for importing and reference management 
+sys.path.append(ROOTPATH)
+
+# internal
+from capitaliq.priceStore import PriceStore
+
+# run daily: appends only the miadjprice rows newer than what is already stored
+price_store_PATH = 'data/price/store/'
+price_csv_PATH = 'data/price/us_price.csv' # legacy full-history dump, only used to seed an empty store
+
+if __name__ == "__main__":
+    universe = pd.read_csv('data/us_et_ref.csv', index_col = [0])
+    store = PriceStore(price_store_PATH)
+
+    if not store.exists() and os.path.exists(price_csv_PATH):
+        n = store.append(pd.read_csv(price_csv_PATH, index_col = [0]))
+        print(f'seeded price store with {n} rows from {price_csv_PATH}')
+
+    n = store.update(universe['companyid'].unique(), start = '2000-01-01')
+    print(f'appended {n} rows, latest pricedate {store.last_pricedate()}')
+
+    if '--compact' in sys.argv:
+        store.compact()
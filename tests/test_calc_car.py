@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import car.trading_calendar as trading_calendar
+from car.trading_calendar import TradingCalendar
+from car.calc_car import FACTORS, calculate_car, calculate_car_batch
+
+
+@pytest.fixture
+def market(monkeypatch):
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range('2010-01-04', periods = 1600)
+    opens = (days + pd.Timedelta(hours = 14, minutes = 30)).to_numpy()
+    monkeypatch.setattr(trading_calendar, '_CALENDAR', TradingCalendar(days.to_numpy(), opens, opens + np.timedelta64(390, 'm')))
+
+    factors = pd.DataFrame(rng.normal(0, 1, (len(days), len(FACTORS))), index = days, columns = FACTORS)
+    factors['RF'] = 0.01
+    # a day without factors inside every stock's sample
+    factors = factors.drop(days[900])
+
+    def price(start, n, gaps):
+        dates = days[start:start + n]
+        ret = 0.05 + factors.reindex(dates).fillna(0)[FACTORS].to_numpy() @ rng.normal(0.5, 0.3, len(FACTORS)) + rng.normal(0, 1, n)
+        close = 20 * np.cumprod(1 + ret / 100)
+        df = pd.DataFrame({'pricedate': dates.date, 'priceopen': close, 'priceclose': close, 'divadjclose': close})
+        # days the stock did not trade: rows missing from the fetch, and a missing close
+        df = df.drop(df.index[gaps]).reset_index(drop = True)
+        df.loc[len(df) // 2, 'divadjclose'] = np.nan
+        return df
+
+    prices = {
+        1: price(0, 1600, []),
+        2: price(137, 1300, [300, 301, 302, 650]),
+        3: price(400, 1100, [10, 500, 501, 1000]),
+    }
+    return factors, prices
+
+
+def test_calculate_car_batch_matches_calculate_car(market, tmp_path):
+    factors, prices = market
+    calculate_car_batch({cid: price.copy() for cid, price in prices.items()}, addr = str(tmp_path / 'batch'), factors = factors)
+    for cid, price in prices.items():
+        assert calculate_car(cid, addr = str(tmp_path / 'single'), price = price.copy(), factors = factors) == 0
+        single = pd.read_parquet(tmp_path / 'single' / f'{cid}.parquet')
+        batch = pd.read_parquet(tmp_path / 'batch' / f'{cid}.parquet')
+        pd.testing.assert_frame_equal(batch, single, check_exact = False, rtol = 1e-8, atol = 1e-10)
+
+
+def test_car_keeps_the_sessions_as_csv_strings(market, tmp_path):
+    factors, prices = market
+    assert calculate_car(1, addr = str(tmp_path), price = prices[1].copy(), factors = factors) == 0
+    car = pd.read_parquet(tmp_path / '1.parquet')
+    # same values and type as the baseline merge of tradingcalendar.csv
+    assert car['market_open'].dtype == object and car['market_close'].dtype == object
+    assert car['market_open'].iloc[0] == f"{car['tradingday'].iloc[0]:%Y-%m-%d} 14:30:00+00:00"
@@ -0,0 +1,136 @@
+import threading
+
+import psycopg2
+import pytest
+
+from capitaliq import connectionPool
+from capitaliq.connectionPool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection():
+    """stands in for psycopg2.connect, broken makes every round trip fail"""
+
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        if self.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def fetchall(self):
+        return [(1, )]
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnect():
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self):
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+
+def test_putconn_rolls_back_and_reuses_the_connection():
+    pool = ConnectionPool(FakeConnect(), maxconn = 2)
+    db = pool.getconn()
+    pool.putconn(db)
+    assert db.rollbacks == 1 and not db.closed
+    assert pool.getconn() is db
+    assert pool.stats()['connects'] == 1
+
+
+def test_failed_rollback_closes_instead_of_reusing():
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, maxconn = 2)
+    db = pool.getconn()
+    db.broken = True
+    pool.putconn(db)
+    assert db.closed and pool.stats()['errors'] == 1
+    assert pool.getconn() is not db
+
+
+def test_broken_idle_connection_is_replaced():
+    pool = ConnectionPool(FakeConnect(), maxconn = 2, health_check_interval = 0)
+    db = pool.getconn()
+    pool.putconn(db)
+    db.broken = True
+    fresh = pool.getconn()
+    assert fresh is not db and db.closed
+    stats = pool.stats()
+    assert stats['reconnects'] == 1 and stats['connects'] == 2 and stats['size'] == 1
+
+
+def test_idle_connections_above_minconn_are_evicted():
+    pool = ConnectionPool(FakeConnect(), minconn = 1, maxconn = 3, idle_timeout = 0)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    # the longest idle one goes, minconn stays open
+    assert pool.getconn() is second
+    assert first.closed and pool.stats()['evictions'] == 1
+
+
+def test_forked_child_never_touches_the_parent_connections(monkeypatch):
+    pool = ConnectionPool(FakeConnect(), maxconn = 2)
+    idle, used = pool.getconn(), pool.getconn()
+    pool.putconn(idle)
+
+    monkeypatch.setattr(connectionPool.os, 'getpid', lambda: -1)
+    db = pool.getconn()
+    assert db is not idle and db is not used
+    pool.putconn(used)
+    pool.closeall()
+    # parked, neither reused nor closed (closing would end the parent's sessions)
+    assert not idle.closed and not used.closed and idle.rollbacks == 1 and used.rollbacks == 0
+
+
+def test_connect_runs_outside_the_lock():
+    started, release = threading.Event(), threading.Event()
+    connect = FakeConnect()
+
+    def slow_connect():
+        started.set()
+        release.wait(5)
+        return connect()
+
+    pool = ConnectionPool(slow_connect, maxconn = 1)
+    worker = threading.Thread(target = pool.getconn)
+    worker.start()
+    assert started.wait(5)
+    try:
+        # the pool answers while the connect is in flight, and the reserved slot counts against maxconn
+        answers = []
+        checker = threading.Thread(target = lambda: answers.append(pool.stats()['size']))
+        checker.start()
+        checker.join(1)
+        assert answers == [1]
+        with pytest.raises(PoolTimeout):
+            pool.getconn(timeout = 0.05)
+    finally:
+        release.set()
+        worker.join(5)
+    assert pool.stats()['in_use'] == 1
+
+
+def test_failed_connect_frees_the_slot():
+    def refuse():
+        raise psycopg2.OperationalError('could not connect to server')
+
+    pool = ConnectionPool(refuse, maxconn = 1)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    pool._connect = FakeConnect()
+    assert pool.getconn(timeout = 0.05) is not None
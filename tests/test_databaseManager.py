@@ -0,0 +1,63 @@
+import inspect
+import pandas as pd
+import psycopg2
+import pytest
+
+from capitaliq import databaseManager
+
+
+def test_get_hist_miadj_pricing_by_company_raises_on_failed_chunk(monkeypatch):
+    def fake_pricing(start, end, ids, connection = None):
+        if 3 in ids:
+            return None # what read_sql_to_df returns after a database error
+        return pd.DataFrame({'companyid': ids, 'pricedate': ['2020-01-02'] * len(ids)})
+    monkeypatch.setattr(databaseManager, 'get_hist_miadj_pricing', fake_pricing)
+
+    prices = databaseManager.get_hist_miadj_pricing_by_company('2020-01-01', '2020-02-01', [1, 2, 3, 4], chunksize = 2)
+    assert [companyid for companyid, _ in [next(prices), next(prices)]] == [1, 2]
+    with pytest.raises(psycopg2.DatabaseError) as error:
+        next(prices)
+    assert error.value.companyids == [3, 4]
+
+
+def test_streaming_functions_keep_connection_as_their_next_positional_argument():
+    # chunksize came later than connection, callers passing a connection positionally must not break
+    for func, before in [(databaseManager.get_company_transcripts, ['start', 'end', 'ls_ids']),
+                         (databaseManager.get_transcript, ['ls_transcript_ids']),
+                         (databaseManager.get_hist_fxrate, ['fromdate']),
+                         (databaseManager.get_pit_universe_global_hist, [])]:
+        params = list(inspect.signature(func).parameters)
+        assert params[:len(before) + 2] == before + ['connection', 'chunksize']
+
+
+class CopyCursor():
+    """fake cursor, copy_expert writes the csv postgres produces for the NULL marker it is asked for"""
+    description = [('isin', 25), ('ticker', 1043), ('price', 1700), ('volume', 20), ('listed', 16)]
+
+    def __init__(self):
+        self.copy_sql = None
+
+    def execute(self, sql):
+        pass
+
+    def copy_expert(self, sql, buffer):
+        self.copy_sql = sql
+        buffer.write('isin,ticker,price,volume,listed\n'
+                     '00123,"",1.5,10,t\n'
+                     '4567,\\N,\\N,\\N,f\n'
+                     '8.9E1,NA,2.0,30,\\N\n')
+
+
+def test_copy_keeps_text_columns_as_strings():
+    cursor = CopyCursor()
+    df = databaseManager.read_sql_to_df('SELECT * FROM t;', None, cursor, copy = True)
+    assert "NULL '\\N'" in cursor.copy_sql
+
+    # text as in the tuple path: leading zeros, empty strings, None for NULL, no float / NaN sniffing
+    assert df['isin'].tolist() == ['00123', '4567', '8.9E1']
+    assert df['ticker'].tolist() == ['', None, 'NA']
+    assert df['isin'].dtype == object and df['ticker'].dtype == object
+    # typed columns still parse, NULL becomes missing
+    assert df['price'].dtype == 'float64' and pd.isna(df['price'][1])
+    assert str(df['volume'].dtype) == 'Int64' and df['volume'].tolist()[::2] == [10, 30]
+    assert df['listed'].tolist()[:2] == [True, False] and pd.isna(df['listed'][2])
@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+
+from fhandler.datasetHandler import DatasetHandler
+
+
+def frame(n, value):
+    return pd.DataFrame({'pricedate': pd.bdate_range('2020-01-01', periods = n), 'one_d_car': [value] * n})
+
+
+def test_append_read_compact(tmp_path):
+    dataset = DatasetHandler(str(tmp_path / 'car'), buckets = 4)
+    dataset.append({32307: frame(3, 0.1), 24937: frame(2, 0.2), 11: frame(4, 0.3)})
+    # appending a company again supersedes its earlier rows
+    dataset.append({24937: frame(5, 0.4)})
+
+    one = dataset.read(32307)
+    assert one['companyid'].tolist() == [32307] * 3 and one['one_d_car'].tolist() == [0.1] * 3
+    some = dataset.read([24937, 11], columns = ['one_d_car'])
+    assert list(some.columns) == ['companyid', 'one_d_car']
+    assert some.groupby('companyid')['one_d_car'].agg(list).to_dict() == {11: [0.3] * 4, 24937: [0.4] * 5}
+    assert len(dataset.read()) == 3 + 5 + 4
+    assert dataset.keys() == [11, 24937, 32307]
+    assert dataset.read(99).empty
+
+    before = dataset.read()
+    dataset.compact()
+    for bucket in os.listdir(dataset.path):
+        assert len(os.listdir(os.path.join(dataset.path, bucket))) == 1
+    pd.testing.assert_frame_equal(dataset.read(), before)
+    assert dataset.read(24937)['one_d_car'].tolist() == [0.4] * 5
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from car.event_window import event_start_rows, forward_abnormal_returns
+
+
+def test_event_start_rows_same_day_and_after_close():
+    pricedate = pd.to_datetime(['2020-03-02', '2020-03-03', '2020-03-05']).to_numpy()
+    event_day = pd.to_datetime(['2020-03-03', '2020-03-03', '2020-03-04', '2020-03-05', '2020-03-06', '2020-03-01']).to_numpy()
+    same_day = [True, False, True, False, True, False]
+    assert event_start_rows(pricedate, event_day, same_day).tolist() == [1, 2, 2, -1, -1, 0]
+
+
+def test_forward_abnormal_returns_matches_the_loop():
+    rng = np.random.default_rng(0)
+    ret = rng.normal(0, 0.02, 60)
+    mkt_ret = rng.normal(0, 0.01, 60)
+    ret[[10, 30]] = np.nan
+    start = np.array([0, 5, 8, 25, 55, -1])
+    horizons = [1, 3, 5, 10]
+    beta = np.array([1., 0.5, 1.2, 1., 1., 1.])
+
+    out = forward_abnormal_returns(ret, mkt_ret, start, horizons, beta)
+    assert out.shape == (len(start), len(horizons))
+    for i, s in enumerate(start):
+        for j, h in enumerate(horizons):
+            if s < 0 or s + h > len(ret) or np.isnan(ret[s + h - 1]):
+                assert np.isnan(out[i, j])
+                continue
+            # a missing day inside the window is skipped, as pandas cumprod does
+            stock = pd.Series(ret[s:s + h]).add(1).cumprod().iloc[-1] - 1
+            mkt = np.prod(1 + mkt_ret[s:s + h]) - 1
+            assert np.isclose(out[i, j], stock - beta[i] * mkt)
+    # windows ending on the missing day, and running past the last row, have no value
+    assert np.isnan(out[2, 1]) and np.isnan(out[4, 3]) and np.isnan(out[5]).all()
+    # a window spanning it still has one
+    assert not np.isnan(out[2, 2]) and not np.isnan(out[1, 3])
+
+
+def test_forward_abnormal_returns_without_prices():
+    out = forward_abnormal_returns(np.array([]), np.array([]), np.array([-1, -1]), [1, 5])
+    assert out.shape == (2, 2) and np.isnan(out).all()
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from fhandler.fileHandler import FileHandler
+
+
+def test_compressed_csv_is_named_by_codec(tmp_path):
+    df = pd.DataFrame({'companyid': [1, 2], 'price': [1.5, 2.5]})
+    FileHandler.save_with_dir_create(str(tmp_path), 'csv', 'prices', df, compression = 'zstd')
+    assert (tmp_path / 'prices.csv.zst').exists() and not (tmp_path / 'prices.csv').exists()
+    # plain pandas infers the codec from the name
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'prices.csv.zst', index_col = [0]), df)
+    pd.testing.assert_frame_equal(FileHandler.get_file(str(tmp_path), 'csv.zst', 'prices'), df)
+    assert FileHandler.check_file_existence(str(tmp_path), 'csv.zst', 'prices')
+    assert not FileHandler.check_file_existence(str(tmp_path), 'csv', 'prices')
+
+
+def test_compact_dtypes_keeps_values(tmp_path):
+    df = pd.DataFrame({
+        'companyid': np.array([24937, 32307, 24937], dtype = 'int64'),
+        'fiscalquarter': [1., 4., 2.],
+        'price': [1.1, 2.2, np.nan],
+        'normal_price_flag': [True, None, False],
+        'isocode': ['USD', 'USD', 'USD'],
+    })
+    small = FileHandler.compact_dtypes(df)
+    assert small['companyid'].dtype == 'int16' and small['fiscalquarter'].dtype == 'int8'
+    assert small['price'].dtype == 'float64' # 1.1 is not exact in float32
+    assert str(small['normal_price_flag'].dtype) == 'boolean' and str(small['isocode'].dtype) == 'category'
+    FileHandler.save_with_dir_create(str(tmp_path), 'parquet', 'ref', small, compression = 'zstd', level = 3)
+    back = FileHandler.get_file(str(tmp_path), 'parquet', 'ref')
+    pd.testing.assert_frame_equal(back.astype(object), df.astype(object), check_dtype = False)
@@ -0,0 +1,63 @@
+import json
+import os
+import time
+import zipfile
+import pandas as pd
+import pytest
+
+from gff import gff_function
+
+
+FF5_MONTHLY = '''This file was created by CMPT_ME_BEME_OP_INV_RETS using the 202308 CRSP database.
+The 1-month TBill return is from Ibbotson and Associates Inc.
+
+,Mkt-RF,SMB,HML,RMW,CMA,RF
+196307,  -0.39,  -0.41,  -0.97,   0.68,  -1.18,   0.27
+196308,   5.07,  -0.80,   1.80,   0.36,  -0.35,   0.25
+
+ Annual Factors: January-December 
+,Mkt-RF,SMB,HML,RMW,CMA,RF
+  1964,  12.57,   0.05,   9.63,   1.11,   4.90,   3.54
+  1965,  10.63,  20.76,   5.35,   2.68,   0.10,   3.93
+'''
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gff_function, 'OFFLINE', True)
+    monkeypatch.setattr(gff_function, '_FACTOR_STORE', {})
+    os.makedirs(gff_function.FACTOR_CACHE_DIR)
+    return tmp_path
+
+
+def test_monthly_and_annual_factors_are_the_published_series(offline):
+    with zipfile.ZipFile(os.path.join(gff_function.FACTOR_CACHE_DIR, 'ff5_monthly.zip'), 'w') as z:
+        z.writestr('F-F_Research_Data_5_Factors_2x3.csv', FF5_MONTHLY)
+    with open(os.path.join(gff_function.FACTOR_CACHE_DIR, 'cache.json'), 'w') as f:
+        json.dump({'ff5_monthly': {'version': gff_function.FACTOR_CACHE_VERSION, 'fetched': time.time()}}, f)
+
+    monthly = gff_function.famaFrench5Factor('m')
+    assert list(monthly['date_ff_factors']) == [pd.Timestamp('1963-07-31'), pd.Timestamp('1963-08-31')]
+    assert monthly['RF'].tolist() == pytest.approx([0.0027, 0.0025])
+
+    annual = gff_function.famaFrench5Factor('a')
+    assert list(annual['date_ff_factors']) == [1964, 1965]
+    assert annual['Mkt-RF'].tolist() == pytest.approx([0.1257, 0.1063])
+
+
+def test_daily_factors_fall_back_to_the_legacy_csv_cache(offline):
+    os.makedirs('data', exist_ok = True)
+    pd.DataFrame({'Unnamed: 0': [20200102, 20200103], 'Mom   ': [0.1, -0.2]}).to_csv('data/factor_momentum.csv', index = False)
+    with open('data/factor_momentum.csv', 'a') as f:
+        f.write('Copyright 2023 Kenneth R. French,\n')
+
+    with pytest.warns(UserWarning, match = 'legacy cache'):
+        mom = gff_function.momentumFactor('d')
+    assert list(mom['date_ff_factors']) == [pd.Timestamp('2020-01-02'), pd.Timestamp('2020-01-03')]
+    assert mom['Mom   '].tolist() == [0.1, -0.2]
+
+
+def test_offline_without_any_cache_names_the_fix(offline):
+    with pytest.raises(FileNotFoundError, match = 'run once with network access'):
+        gff_function.famaFrench5Factor('d')
@@ -0,0 +1,54 @@
+import pandas as pd
+import psycopg2
+import pytest
+
+from capitaliq import priceStore
+from capitaliq.priceStore import PriceStore
+
+
+def test_update_fetches_every_company_from_its_own_last_pricedate(monkeypatch, tmp_path):
+    days = pd.bdate_range('2020-01-01', '2020-03-31')
+    db = pd.DataFrame([(cid, 1, day, 10. + i) for cid in (1, 2) for i, day in enumerate(days)],
+                      columns = ['companyid', 'tradingitemid', 'pricedate', 'divadjclose'])
+
+    def fake_pricing(start, end, ids, connection = None):
+        rows = db[db['companyid'].isin(ids) & (db['pricedate'] >= pd.Timestamp(start)) & (db['pricedate'] <= pd.Timestamp(end))]
+        return rows.reset_index(drop = True)
+    monkeypatch.setattr(priceStore, 'get_hist_miadj_pricing', fake_pricing)
+
+    store = PriceStore(str(tmp_path / 'store'))
+    # company 1 stored up to the end of january, company 2 up to the end of february
+    store.append(db[(db['companyid'] == 1) & (db['pricedate'] <= '2020-01-31')])
+    store.append(db[(db['companyid'] == 2) & (db['pricedate'] <= '2020-02-28')])
+
+    store.update([1, 2], end = '2020-03-31')
+    stored = store.read(columns = ['divadjclose'])
+    expected = db[['companyid', 'pricedate', 'divadjclose']].sort_values(['pricedate', 'companyid']).reset_index(drop = True)
+    pd.testing.assert_frame_equal(stored[expected.columns], expected, check_dtype = False)
+
+
+def test_read_is_sorted_by_pricedate_for_merge_asof(tmp_path):
+    days = pd.bdate_range('2020-01-01', '2020-01-10')
+    db = pd.DataFrame([(cid, 1, day, 10. + i) for cid in (2, 1) for i, day in enumerate(days)],
+                      columns = ['companyid', 'tradingitemid', 'pricedate', 'divadjclose'])
+    store = PriceStore(str(tmp_path / 'store'))
+    store.append(db)
+
+    price = store.read(columns = ['companyid', 'pricedate', 'divadjclose'])
+    assert price['pricedate'].is_monotonic_increasing
+    events = pd.DataFrame({'companyid': [1, 2], 'eventdate': pd.to_datetime(['2020-01-04', '2020-01-08'])})
+    merged = pd.merge_asof(events, price.rename(columns = {'pricedate': 'eventdate'}), on = 'eventdate', by = 'companyid')
+    assert merged['divadjclose'].tolist() == [12., 15.]
+
+
+def test_update_raises_when_a_chunk_query_fails(monkeypatch, tmp_path):
+    days = pd.bdate_range('2020-01-01', '2020-01-31')
+    db = pd.DataFrame([(cid, 1, day, 10.) for cid in (1, 2) for day in days],
+                      columns = ['companyid', 'tradingitemid', 'pricedate', 'divadjclose'])
+    store = PriceStore(str(tmp_path / 'store'))
+    store.append(db)
+    monkeypatch.setattr(priceStore, 'get_hist_miadj_pricing', lambda start, end, ids, connection = None: None)
+
+    with pytest.raises(psycopg2.DatabaseError) as error:
+        store.update([1, 2], end = '2020-02-28')
+    assert sorted(error.value.companyids) == [1, 2]
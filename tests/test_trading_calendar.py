@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import car.trading_calendar as trading_calendar
+from car.trading_calendar import TradingCalendar, get_trading_calendar
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    # march 2020: weekends and a made-up holiday on wednesday the 11th
+    days = pd.bdate_range('2020-03-02', '2020-03-31').drop(pd.Timestamp('2020-03-11'))
+    opens = days + pd.Timedelta(hours = 14, minutes = 30)
+    df = pd.DataFrame({'tradingday': days, 'market_open': opens.tz_localize('UTC'),
+                       'market_close': (opens + pd.Timedelta(hours = 6, minutes = 30)).tz_localize('UTC')})
+    path = tmp_path / 'tradingcalendar.csv'
+    df.to_csv(path, index = False)
+    return str(path), df
+
+
+def test_day_index_rolls_non_trading_days(schedule):
+    cal = TradingCalendar.from_csv(schedule[0])
+    dates = ['2020-03-06', '2020-03-07', '2020-03-11', '2020-03-01', '2020-04-01', None]
+    assert cal.day_index(dates).tolist() == [4, 5, 7, -1, -1, -1]
+    assert cal.day_index(dates, roll = 'backward').tolist() == [4, 4, 6, -1, -1, -1]
+    assert cal.day_index(dates, roll = None).tolist() == [4, -1, -1, -1, -1, -1]
+    assert cal.is_trading_day(['2020-03-10', '2020-03-11']).tolist() == [True, False]
+
+
+def test_offset_window_count(schedule):
+    cal = TradingCalendar.from_csv(schedule[0])
+    # friday and saturday both roll to monday before stepping
+    assert list(cal.offset(['2020-03-06', '2020-03-07'], 1)) == list(np.array(['2020-03-09', '2020-03-10'], dtype = 'datetime64[ns]'))
+    # the holiday is skipped
+    assert cal.offset('2020-03-10', 1)[0] == np.datetime64('2020-03-12')
+    assert np.isnat(cal.offset('2020-03-31', 1)[0])
+
+    start, end = cal.window(['2020-03-12', '2020-03-02'], 2, 1)
+    assert start[0] == np.datetime64('2020-03-09') and end[0] == np.datetime64('2020-03-13')
+    # the window leaves the calendar
+    assert np.isnat(start[1]) and np.isnat(end[1])
+
+    assert cal.count(['2020-03-09', '2020-03-14'], ['2020-03-13', '2020-03-13']).tolist() == [4, 0]
+
+
+def test_session_between_and_frame(schedule):
+    path, df = schedule
+    cal = TradingCalendar.from_csv(path)
+    market_open, market_close = cal.session(['2020-03-02', '2020-03-07'])
+    assert market_open[0] == np.datetime64('2020-03-02T14:30') and market_close[0] == np.datetime64('2020-03-02T21:00')
+    assert np.isnat(market_open[1]) and np.isnat(market_close[1])
+
+    assert len(cal.between('2020-03-07', '2020-03-13')) == 4
+    frame = cal.frame()
+    pd.testing.assert_frame_equal(frame, df, check_freq = False)
+
+
+def test_get_trading_calendar_converts_the_csv_once(schedule, tmp_path, monkeypatch):
+    path, _ = schedule
+    npz = str(tmp_path / 'tradingcalendar.npz')
+    monkeypatch.setattr(trading_calendar, 'TRADINGCALENDAR_CSV_PATH', path)
+    monkeypatch.setattr(trading_calendar, '_CALENDAR', None)
+
+    cal = get_trading_calendar(npz)
+    assert get_trading_calendar(npz) is cal
+    loaded = TradingCalendar.load(npz)
+    assert (loaded.days == cal.days).all() and (loaded.market_close == cal.market_close).all()
+
+    monkeypatch.setattr(trading_calendar, '_CALENDAR', None)
+    monkeypatch.setattr(trading_calendar, 'TRADINGCALENDAR_CSV_PATH', str(tmp_path / 'missing.csv'))
+    with pytest.raises(FileNotFoundError):
+        get_trading_calendar(str(tmp_path / 'missing.npz'))
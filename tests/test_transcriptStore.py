@@ -0,0 +1,85 @@
+import glob
+import os
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+from capitaliq import transcriptStore
+from capitaliq.transcriptStore import TranscriptStore
+
+
+def make_db(n_transcripts, n_companies):
+    ref = pd.DataFrame({'transcriptid': range(1, n_transcripts + 1)})
+    ref['companyid'] = 100 + ref['transcriptid'] % n_companies
+    ref['earningscalldateutc'] = pd.Timestamp('2019-06-30') + pd.to_timedelta(ref['transcriptid'] % 3 * 200, unit = 'D')
+    components = pd.DataFrame([(tid, order, f'text {tid}.{order}') for tid in ref['transcriptid'] for order in range(2)],
+                              columns = ['transcriptid', 'componentorder', 'componenttext'])
+    return ref, components
+
+
+def test_download_resumes_after_a_failed_chunk(monkeypatch, tmp_path):
+    ref, components = make_db(100, 7)
+    failing = {'chunk': 3}
+    calls = []
+
+    def fake_get_transcript(ids):
+        calls.append(list(ids))
+        if len(calls) == failing['chunk']:
+            return None # what read_sql_to_df returns after a database error
+        return components[components['transcriptid'].isin(ids)].copy()
+    monkeypatch.setattr(transcriptStore, 'get_transcript', fake_get_transcript)
+
+    store = TranscriptStore(str(tmp_path / 'store'))
+    with pytest.raises(psycopg2.DatabaseError) as error:
+        store.download(ref['transcriptid'], ref, chunksize = 10)
+    assert error.value.transcriptids == list(range(21, 31))
+    assert store.downloaded() == set(range(1, 21))
+
+    failing['chunk'] = None
+    calls.clear()
+    store.download(ref['transcriptid'], ref, chunksize = 10)
+    assert calls[0] == list(range(21, 31))
+    assert store.downloaded() == set(range(1, 101))
+    stored = store.read(ref['transcriptid'])
+    pd.testing.assert_frame_equal(stored[components.columns], components)
+
+
+def count_files(path):
+    return sum(f.endswith('.parquet') and not f.startswith('_') for _, _, files in os.walk(path) for f in files)
+
+
+def test_write_keeps_few_files_per_chunk_and_compact_merges_them(tmp_path):
+    ref, components = make_db(1800, 700)
+    store = TranscriptStore(str(tmp_path / 'store'))
+    for first in range(0, 1800, 200):
+        ids = range(first + 1, first + 201)
+        store.write(components[components['transcriptid'].isin(ids)], ref)
+    # at most one file per year / bucket per chunk
+    assert count_files(store.path) <= 9 * 3 * store.BUCKETS
+
+    store.compact()
+    assert count_files(store.path) <= 3 * store.BUCKETS
+    pd.testing.assert_frame_equal(store.read(ref['transcriptid'])[components.columns], components)
+    company = store.read_company(105)
+    assert set(company['transcriptid']) == set(ref.loc[ref['companyid'] == 105, 'transcriptid'])
+    assert list(company.columns[:3]) == ['transcriptid', 'componentorder', 'componenttext']
+    assert 'bucket' not in company.columns and {'year', 'companyid'} <= set(company.columns)
+
+
+def test_compact_moves_the_earlier_companyid_layout_to_buckets(tmp_path):
+    ref, components = make_db(50, 7)
+    store = TranscriptStore(str(tmp_path / 'store'))
+    store.write(components, ref)
+    # the same rows as the earlier layout wrote them: year / companyid partitions
+    old = pd.read_parquet(store.path).drop(columns = ['bucket']).astype({'year': 'int32'})
+    for f in glob.glob(f'{store.path}/year=*/bucket=*/*.parquet'):
+        os.remove(f)
+    ds.write_dataset(pa.Table.from_pandas(old, preserve_index = False), store.path, format = 'parquet',
+                     partitioning = ds.partitioning(pa.schema([('year', pa.int32()), ('companyid', pa.int64())]), flavor = 'hive'),
+                     existing_data_behavior = 'overwrite_or_ignore')
+
+    store.compact()
+    assert not glob.glob(f'{store.path}/year=*/companyid=*')
+    pd.testing.assert_frame_equal(store.read(ref['transcriptid'])[components.columns], components)